@@ -2,6 +2,15 @@ from flask import Flask, render_template, jsonify, request
 from extensions import db, login_manager, limiter, get_rate_limit_string, csrf
 from flask_migrate import Migrate
 from services.scheduler import subscription_scheduler
+from services.job_queue import generation_queue
+from services.derivatives import derivative_encoder, derivative_cache
+from services.storage import image_storage
+from services.downloader import image_downloader
+from services.exports import gallery_exporter
+from services.image_optimizer import ImageOptimizer
+from services.optimization_cache import optimization_cache
+from services.fal_uploads import fal_uploader
+from services.training_reconciler import training_reconciler
 from version import get_version_info, get_display_version
 import os
 import atexit
@@ -20,6 +29,12 @@ def create_app():
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads')
     app.config['TRAINING_FILES_FOLDER'] = os.path.join(app.root_path, 'static', 'training_files')
+    # Internal nginx location that serves downloads via X-Accel-Redirect (e.g. /protected); unset streams them from Flask
+    app.config['ACCEL_REDIRECT_PREFIX'] = os.getenv('ACCEL_REDIRECT_PREFIX')
+    # Seconds between background FAL status checks of in-progress trainings (minimum per training, across workers)
+    app.config['TRAINING_STATUS_REFRESH_SECONDS'] = int(os.getenv('TRAINING_STATUS_REFRESH_SECONDS', '30'))
+    # Concurrent job progress streams (SSE) per process; 0 keeps them off and clients poll job status
+    app.config['JOB_EVENTS_MAX_STREAMS'] = int(os.getenv('JOB_EVENTS_MAX_STREAMS', '0'))
     
     # Ensure required environment variables are set
     required_vars = ['SECRET_KEY']
@@ -39,11 +54,29 @@ def create_app():
     csrf.init_app(app)
     migrate = Migrate(app, db)
     
-    # Initialize scheduler
+    # Initialize scheduler and the training reconciliation job on it
     subscription_scheduler.init_app(app)
+    training_reconciler.init_app(app)
     
-    # Ensure scheduler stops when app shuts down
+    # Initialize background generation workers
+    generation_queue.init_app(app)
+
+    # Initialize image storage, derivative encoding processes, the on-demand derivative cache, gallery exports,
+    # the cache of optimized input images and source image uploads to FAL
+    image_storage.init_app(app)
+    derivative_encoder.init_app(app)
+    derivative_cache.init_app(app)
+    gallery_exporter.init_app(app)
+    optimization_cache.init_app(app)
+    fal_uploader.init_app(app)
+
+    # Ensure scheduler and workers stop when app shuts down
     atexit.register(lambda: subscription_scheduler.stop())
+    atexit.register(lambda: generation_queue.stop())
+    atexit.register(lambda: derivative_encoder.stop())
+    atexit.register(lambda: ImageOptimizer.shutdown_pool())
+    atexit.register(lambda: training_reconciler.stop())
+    atexit.register(lambda: image_downloader.stop())
 
     with app.app_context():
         # Import models here to avoid circular imports
@@ -62,6 +95,7 @@ def create_app():
         from blueprints.magix import magix_bp
         from blueprints.virtual import virtual_bp
         from blueprints.image_utils import image_utils_bp
+        from blueprints.jobs import jobs_bp
         from blueprints.admin.subscription_routes import admin_subscription_bp
         from blueprints.admin.api_routes import admin_api_bp
         
@@ -80,6 +114,7 @@ def create_app():
         app.register_blueprint(magix_bp)
         app.register_blueprint(virtual_bp)
         app.register_blueprint(image_utils_bp)
+        app.register_blueprint(jobs_bp)
         
         # Error handlers
         @app.errorhandler(404)
@@ -122,7 +157,9 @@ def create_app():
         # User loader
         @login_manager.user_loader
         def load_user(user_id):
-            return db.session.get(User, int(user_id))
+            # Fetch the active subscription and plan alongside the user;
+            # get_subscription() then serves them for the rest of the request
+            return User.load_with_subscription(int(user_id))
 
         def init_api_providers():
             """Initialize default API providers and models using LiteLLM"""
@@ -513,6 +550,7 @@ def create_app():
         init_api_providers()
         init_subscription_plans()
         init_api_settings()
+        generation_queue.fail_stale_jobs()
         
         # Add version information to template context
         @app.context_processor
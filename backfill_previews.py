@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Create gallery previews (thumbnail + placeholder) for images saved before
+they existed.
+
+Images are processed in chunks; each chunk is encoded in parallel by the
+derivative process pool. Safe to re-run: only images missing a thumbnail
+or placeholder are processed.
+
+Usage:
+    python backfill_previews.py [--batch-size 50] [--workers 4]
+"""
+
+import os
+import sys
+import argparse
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def backfill_previews(batch_size):
+    """Encode missing previews chunk by chunk, committing after each one"""
+    from app import create_app
+    from models import db, Image
+    from services.derivatives import derivative_encoder
+    from services.storage import image_storage
+
+    app = create_app()
+
+    with app.app_context():
+        needs_previews = db.or_(Image.thumbnail_filename.is_(None), Image.placeholder.is_(None))
+        missing = Image.query.filter(needs_previews).count()
+        print(f"Images without previews: {missing}")
+
+        created = 0
+        skipped = 0
+        last_id = 0
+        while True:
+            # Walk by id so images whose file is missing aren't retried forever
+            images = Image.query.filter(
+                needs_previews,
+                Image.id > last_id
+            ).order_by(Image.id).limit(batch_size).all()
+            if not images:
+                break
+            last_id = images[-1].id
+
+            on_disk = [image for image in images if image_storage.exists(image.filename)]
+            skipped += len(images) - len(on_disk)
+
+            previews = derivative_encoder.create_previews([image.filename for image in on_disk])
+            for image in on_disk:
+                for column, value in previews.get(image.filename, {}).items():
+                    setattr(image, column, value)
+            db.session.commit()
+
+            created += len(previews)
+            print(f"  ✓ {created} images done, {skipped} missing from storage")
+
+        derivative_encoder.stop()
+        print("\nBackfill complete.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=50, help='Images to encode per chunk')
+    parser.add_argument('--workers', type=int, help='Encoding processes (default: DERIVATIVE_WORKERS or 2)')
+    args = parser.parse_args()
+    if args.workers:
+        # Read by derivative_encoder.init_app() when the app is created
+        os.environ['DERIVATIVE_WORKERS'] = str(args.workers)
+    backfill_previews(args.batch_size)
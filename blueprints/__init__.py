@@ -8,6 +8,7 @@ from .magix import magix_bp
 from .training import training_bp
 from .explainer import explainer
 from .image_generator import image_generator_bp
+from .jobs import jobs_bp
 
 __all__ = [
     'auth_bp',
@@ -19,5 +20,6 @@ __all__ = [
     'magix_bp',
     'training_bp',
     'explainer',
-    'image_generator_bp'
+    'image_generator_bp',
+    'jobs_bp'
 ]
@@ -91,6 +91,7 @@ def update_api_keys():
         api_settings.updated_at = datetime.utcnow()
 
         db.session.commit()
+        APISettings.invalidate_cache()
 
         return jsonify({
             'success': True,
@@ -256,6 +257,7 @@ def clear_api_key(provider):
         api_settings.updated_at = datetime.utcnow()
 
         db.session.commit()
+        APISettings.invalidate_cache()
 
         return jsonify({
             'success': True,
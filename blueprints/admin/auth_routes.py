@@ -64,6 +64,7 @@ def update_auth_settings():
             }), 400
         
         db.session.commit()
+        AuthSettings.invalidate_cache()
         
         return jsonify({
             'success': True,
@@ -6,6 +6,7 @@ from models.subscription import UsageHistory
 from models.api_settings import APISettings
 from datetime import datetime, timedelta
 from services.scheduler import subscription_scheduler
+from services.optimization_cache import optimization_cache
 import json
 
 
@@ -199,8 +200,9 @@ def dashboard():
     system_status = {
         'api_services': [],
         'scheduler_running': False,
-        'scheduled_jobs': 0,
-        'db_size': 0
+        'resets_due_24h': 0,
+        'db_size': 0,
+        'optimization_cache': None
     }
     
     # Credit breakdown by feature
@@ -217,6 +219,7 @@ def dashboard():
         if subscription_scheduler.scheduler:
             scheduler_running = subscription_scheduler.scheduler.running
         system_status['scheduler_running'] = scheduler_running
+        system_status['resets_due_24h'] = UserSubscription.resets_due_before(datetime.utcnow() + timedelta(hours=24)).count()
         
         # Get database size
         system_status['db_size'] = User.query.count() + UsageHistory.query.count() + UserSubscription.query.count()
@@ -259,6 +262,12 @@ def dashboard():
     except Exception as e:
         print(f"Error building system status: {e}")
         # Default values will be used
+
+    try:
+        if optimization_cache.enabled:
+            system_status['optimization_cache'] = optimization_cache.stats()
+    except Exception as e:
+        print(f"Error reading optimization cache stats: {e}")
     
     # Get system settings for dynamic credit costs
     system_settings = SystemSettings.get_settings()
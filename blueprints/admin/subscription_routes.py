@@ -70,9 +70,7 @@ def assign_subscription():
     
     db.session.add(new_sub)
     db.session.commit()
-    
-    # Schedule automatic credit reset for this user
-    subscription_scheduler.schedule_user_reset(new_sub.id)
+    User.forget_subscription(user.id)
     
     return jsonify({
         'success': True, 
@@ -560,7 +558,7 @@ def modify_user_features():
 @login_required
 @admin_required
 def view_scheduled_jobs():
-    """View all scheduled credit reset jobs"""
+    """View upcoming credit resets"""
     jobs = subscription_scheduler.get_scheduled_jobs()
     
     # Check scheduler status
@@ -576,21 +574,9 @@ def view_scheduled_jobs():
         scheduler_status = "Error"
         print(f"Error checking scheduler status: {e}")
     
-    # Enrich job data with user information
-    enriched_jobs = []
-    for job in jobs:
-        subscription = UserSubscription.query.get(job['subscription_id'])
-        if subscription:
-            enriched_jobs.append({
-                **job,
-                'username': subscription.user.username,
-                'plan_name': subscription.plan.display_name,
-                'credits_remaining': subscription.credits_remaining
-            })
-    
     # Use timezone-aware datetime to match APScheduler's timezone-aware datetimes
     return render_template('admin/scheduled_jobs.html', 
-                         jobs=enriched_jobs,
+                         jobs=jobs,
                          current_time=datetime.now(timezone.utc),
                          scheduler_running=scheduler_running,
                          scheduler_status=scheduler_status)
@@ -14,6 +14,7 @@ def update_settings():
         require_manual_approval = request.form.get('require_manual_approval')
         settings.require_manual_approval = require_manual_approval in ['true', 'True', '1', 'on', True]
         db.session.commit()
+        SystemSettings.invalidate_cache()
         
         return jsonify({
             'success': True,
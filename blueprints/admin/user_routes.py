@@ -5,7 +5,7 @@ from models import db, User, PasswordResetOTP, Image, TrainingHistory
 from extensions import limiter, get_rate_limit_string
 from .decorators import admin_required
 from .utils import is_valid_password, send_approval_email
-import os
+from services.derivatives import remove_image_files
 
 @limiter.limit(get_rate_limit_string())
 @login_required
@@ -94,19 +94,11 @@ def update_user(user_id):
             # Delete all user's images first
             images = Image.query.filter_by(user_id=user.id).all()
             for image in images:
-                # Delete the actual image files (multiple formats)
-                base_filename = os.path.splitext(image.filename)[0]
-                static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'static', 'images')
-                
-                # Try to delete all possible file formats
-                for ext in ['.png', '.webp', '.jpeg', '.jpg']:
-                    file_path = os.path.join(static_dir, f'{base_filename}{ext}')
-                    if os.path.exists(file_path):
-                        try:
-                            os.remove(file_path)
-                            print(f"Deleted file: {file_path}")
-                        except Exception as e:
-                            print(f"Failed to delete file {file_path}: {e}")
+                # Delete the stored image files and any cached format derivatives
+                try:
+                    remove_image_files(image)
+                except Exception as e:
+                    print(f"Failed to delete files of image {image.filename}: {e}")
                 
                 # Delete the image record
                 db.session.delete(image)
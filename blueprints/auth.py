@@ -191,7 +191,7 @@ def login():
         return redirect(url_for('core.dashboard'))
 
     # Get auth settings
-    auth_settings = AuthSettings.get_settings()
+    auth_settings = AuthSettings.get_cached()
 
     # If both auth methods are disabled, show error
     if not auth_settings.regular_auth_enabled and not auth_settings.google_auth_enabled:
@@ -236,7 +236,7 @@ def login():
 @limiter.limit(get_rate_limit_string())
 def google_login():
     # Get auth settings
-    auth_settings = AuthSettings.get_settings()
+    auth_settings = AuthSettings.get_cached()
     if not auth_settings.google_auth_enabled:
         flash('Google authentication is disabled.')
         return redirect(url_for('auth.login'))
@@ -267,7 +267,7 @@ def google_login():
 @limiter.limit(get_rate_limit_string())
 def google_callback():
     # Get auth settings
-    auth_settings = AuthSettings.get_settings()
+    auth_settings = AuthSettings.get_cached()
     if not auth_settings.google_auth_enabled:
         flash('Google authentication is disabled.')
         return redirect(url_for('auth.login'))
@@ -324,7 +324,7 @@ def google_callback():
                 counter += 1
 
             # Get system settings for manual approval
-            settings = SystemSettings.get_settings()
+            settings = SystemSettings.get_cached()
             requires_approval = settings.require_manual_approval and User.query.first() is not None
 
             user = User(
@@ -378,7 +378,7 @@ def register():
         return redirect(url_for('core.dashboard'))
 
     # Get auth settings
-    auth_settings = AuthSettings.get_settings()
+    auth_settings = AuthSettings.get_cached()
 
     # If both auth methods are disabled, show error
     if not auth_settings.regular_auth_enabled and not auth_settings.google_auth_enabled:
@@ -415,7 +415,7 @@ def register():
         is_first_user = User.query.first() is None
 
         # Get system settings for manual approval
-        settings = SystemSettings.get_settings()
+        settings = SystemSettings.get_cached()
         requires_approval = settings.require_manual_approval and not is_first_user
 
         # Create new user
@@ -215,7 +215,7 @@ def get_ai_client():
     from models import APISettings, APIProvider
 
     # Get system API settings
-    api_settings = APISettings.get_settings()
+    api_settings = APISettings.get_cached()
     if not api_settings.has_required_keys():
         raise APIKeyError("System API keys not configured by administrators")
 
@@ -243,7 +243,7 @@ def get_selected_model():
     """Get the system's default AI model"""
     from models import APISettings, AIModel
 
-    api_settings = APISettings.get_settings()
+    api_settings = APISettings.get_cached()
 
     # Use default model if configured
     if api_settings.default_model_id:
@@ -277,7 +277,7 @@ def init_fal_client():
     """Initialize FAL client with system API key"""
     from models import APISettings
 
-    api_settings = APISettings.get_settings()
+    api_settings = APISettings.get_cached()
     fal_key = api_settings.get_fal_key()
 
     if not fal_key:
@@ -293,6 +293,25 @@ def init_fal_client():
         raise APIKeyError(f"Error initializing FAL client: {str(e)}")
 
 
+def submit_and_wait(client, application, arguments, on_submit=None, on_queue_update=None):
+    """
+    Submit a request to the FAL queue and poll it until it finishes.
+
+    on_submit(request_id) is called once the request is queued and
+    on_queue_update(status) receives every Queued/InProgress/Completed update.
+    Returns the request result.
+    """
+    handle = client.submit(application, arguments=arguments)
+    if on_submit:
+        on_submit(handle.request_id)
+
+    for update in handle.iter_events(with_logs=True, interval=0.5):
+        if on_queue_update:
+            on_queue_update(update)
+
+    return handle.get()
+
+
 def test_fal_client(client):
     """Test FAL client with a simple request"""
     try:
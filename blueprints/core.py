@@ -14,7 +14,7 @@ def index():
 @core_bp.route('/pricing')
 @limiter.limit(get_rate_limit_string())
 def pricing():
-    system_settings = SystemSettings.get_settings()
+    system_settings = SystemSettings.get_cached()
     return render_template('pricing.html', system_settings=system_settings)
 
 @core_bp.route('/dashboard')
@@ -29,8 +29,8 @@ def dashboard():
         subscription.reset_monthly_credits()
     
     # Get system API settings to check if centralized keys are configured
-    api_settings = APISettings.get_settings()
-    system_settings = SystemSettings.get_settings()
+    api_settings = APISettings.get_cached()
+    system_settings = SystemSettings.get_cached()
     
     return render_template('dashboard.html', 
                          subscription=subscription,
@@ -55,9 +55,9 @@ def subscription():
 @login_required
 def settings():
     # Get API settings and available providers
-    api_settings = APISettings.get_settings()
+    api_settings = APISettings.get_cached()
     available_providers = api_settings.get_available_providers()
-    system_settings = SystemSettings.get_settings()
+    system_settings = SystemSettings.get_cached()
     
     # Get all providers and models for display
     providers = APIProvider.query.filter_by(is_active=True).all()
@@ -1,8 +1,10 @@
-from flask import Blueprint, send_file, abort, current_app
+from flask import Blueprint, send_file, abort, redirect, current_app, make_response
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
-from models import Image
+from models import Image, DerivativeCacheEntry
 from extensions import limiter, get_rate_limit_string
+from services.derivatives import derivative_cache
+from services.storage import image_storage
 import os
 import re
 
@@ -19,14 +21,15 @@ def sanitize_filename(filename):
         return None
     return filename
 
-@download_bp.route('/download/<filename>/<format>')
+@download_bp.route('/download/<path:filename>/<format>')
 @limiter.limit(get_rate_limit_string())
 @login_required
 def download_image(filename, format):
-    # Sanitize filename to prevent path traversal
-    safe_filename = sanitize_filename(filename)
-    if not safe_filename:
+    # Sanitize each segment of the storage key to prevent path traversal
+    segments = [sanitize_filename(segment) for segment in filename.split('/')]
+    if not all(segments):
         abort(400)  # Bad request for invalid filename
+    safe_filename = '/'.join(segments)
 
     # Get base filename without extension
     base_filename = os.path.splitext(safe_filename)[0]
@@ -38,22 +41,39 @@ def download_image(filename, format):
         abort(400)  # Bad request for invalid format
 
     # Get the image record from database - this ensures user owns the image
-    image = Image.query.filter_by(filename=f"{base_filename}.png", user_id=current_user.id).first()
+    image = Image.query.filter(
+        Image.user_id == current_user.id,
+        Image.filename.in_([safe_filename, f"{base_filename}.png"])
+    ).first()
 
     if not image:
         abort(404)
 
-    # Build filepath using current_app.root_path for safety
-    filepath = os.path.join(current_app.root_path, 'static', 'images', f"{base_filename}.{format_lower}")
+    download_name = f"sketchmaker_{os.path.basename(base_filename)}.{format_lower}"
 
-    # Verify the resolved path is within the expected directory (defense in depth)
-    images_dir = os.path.realpath(os.path.join(current_app.root_path, 'static', 'images'))
-    resolved_path = os.path.realpath(filepath)
-    if not resolved_path.startswith(images_dir):
-        abort(403)  # Forbidden - path traversal attempt
-
-    if not os.path.exists(filepath):
-        abort(404)
+    if image.file_extension in DerivativeCacheEntry.FORMAT_EXTENSIONS[format_lower]:
+        if not image_storage.exists(image.filename):
+            abort(404)
+        primary_path = image_storage.local_path(image.filename)
+        if primary_path is None:
+            # Remote storage serves the file itself
+            return redirect(image_storage.url(image.filename, download_name=download_name))
+        filepath = primary_path
+    else:
+        # Copies written next to the primary before derivatives were encoded on demand
+        legacy_path = None
+        if '/' not in image.filename:
+            legacy_path = image_storage.local_path(f"{os.path.splitext(image.filename)[0]}.{format_lower}")
+        if legacy_path and os.path.exists(legacy_path):
+            filepath = legacy_path
+        else:
+            if not image_storage.exists(image.filename):
+                abort(404)
+            try:
+                filepath = derivative_cache.get(image.filename, format_lower)
+            except Exception as e:
+                print(f"Error encoding {format_lower} derivative of {image.filename}: {str(e)}")
+                abort(500)
 
     # Set the appropriate mimetype
     mimetypes = {
@@ -62,9 +82,35 @@ def download_image(filename, format):
         'png': 'image/png'
     }
 
-    return send_file(
-        filepath,
-        mimetype=mimetypes.get(format_lower, 'image/png'),
-        as_attachment=True,
-        download_name=f"sketchmaker_{base_filename}.{format_lower}"
-    )
+    return send_image_file(filepath, mimetypes.get(format_lower, 'image/png'), download_name)
+
+
+def send_image_file(filepath, mimetype, download_name):
+    """
+    Send a file under static/ as an attachment, once access has been checked.
+
+    With ACCEL_REDIRECT_PREFIX set, nginx serves the bytes from its matching
+    internal location (see server/sketchmaker) and the worker thread is
+    released at once. Otherwise Flask streams the file itself, answering
+    conditional (ETag/Last-Modified) and Range requests.
+    """
+    accel_prefix = current_app.config.get('ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        relative_path = os.path.relpath(os.path.realpath(filepath), os.path.realpath(current_app.static_folder))
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{relative_path}"
+        response.headers['Content-Type'] = mimetype
+        response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    else:
+        response = send_file(
+            filepath,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True,
+            etag=True
+        )
+
+    # Files behind a download URL never change, but they are per-user
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
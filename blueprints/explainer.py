@@ -6,14 +6,12 @@ from flask import Blueprint, jsonify, request, render_template, current_app
 from flask_login import login_required, current_user
 from models import Image, db
 import traceback
-import os
-import uuid
-import requests
-import io
 from datetime import datetime
 from extensions import limiter, get_rate_limit_string
-from PIL import Image as PILImage
 from .clients import init_fal_client
+from services.downloader import image_downloader
+from services.derivatives import derivative_encoder
+from services.storage import image_storage
 
 explainer = Blueprint('explainer', __name__)
 
@@ -313,65 +311,29 @@ def generate_explainer_image(prompt, aspect_ratio, resolution, output_format):
         if not result or 'images' not in result:
             raise ValueError("Invalid response from FAL API")
 
-        # Download and save the image
-        image_urls = []
+        # Download images concurrently into staging, keeping the original format
+        ext = output_format if output_format != 'png' else 'png'
+        downloads = []
         for img in result['images']:
             image_url = img.get('url') if isinstance(img, dict) else img
             if not image_url:
                 continue
+            downloads.append((image_url, image_storage.staging_path(ext)))
 
-            # Generate unique filename
-            base_filename = f"explainer_{uuid.uuid4()}"
-
-            # Get paths
-            static_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static')
-            images_dir = os.path.join(static_dir, 'images')
-            os.makedirs(images_dir, exist_ok=True)
-
-            # Download image
-            response = requests.get(image_url)
-            response.raise_for_status()
-
-            # Save original format
-            ext = output_format if output_format != 'png' else 'png'
-            filename = f"{base_filename}.{ext}"
-            filepath = os.path.join(images_dir, filename)
-
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-
-            # Load image for conversions
-            img_data = io.BytesIO(response.content)
-            pil_img = PILImage.open(img_data)
-            width, height = pil_img.size
-
-            # Save PNG version
-            png_filename = f"{base_filename}.png"
-            png_filepath = os.path.join(images_dir, png_filename)
-            pil_img.save(png_filepath, 'PNG')
-
-            # Save WebP version
-            webp_filename = f"{base_filename}.webp"
-            webp_filepath = os.path.join(images_dir, webp_filename)
-            pil_img.save(webp_filepath, 'WEBP')
-
-            # Save JPEG version
-            jpeg_filename = f"{base_filename}.jpeg"
-            jpeg_filepath = os.path.join(images_dir, jpeg_filename)
-            if pil_img.mode in ('RGBA', 'P'):
-                pil_img = pil_img.convert('RGB')
-            pil_img.save(jpeg_filepath, 'JPEG')
-
-            image_urls.append({
-                'filename': png_filename,
-                'width': width,
-                'height': height,
-                'urls': {
-                    'png': f'/static/images/{png_filename}',
-                    'webp': f'/static/images/{webp_filename}',
-                    'jpeg': f'/static/images/{jpeg_filename}'
-                }
-            })
+        # Convert to PNG primaries, make gallery previews and store them in the derivative process pool
+        stored = derivative_encoder.ingest(image_downloader.download_all(downloads), convert_to_png=True)
+
+        image_urls = []
+        for columns in stored:
+            if columns is None:
+                continue
+            key = columns['filename']
+            image_urls.append(dict(columns, urls={
+                'png': image_storage.url(key),
+                # WebP/JPEG copies are encoded on first download
+                'webp': f'/download/{key}/webp',
+                'jpeg': f'/download/{key}/jpeg'
+            }))
 
         if not image_urls:
             raise ValueError("No images were successfully processed")
@@ -420,7 +382,7 @@ def generate_explainer():
 
         # Check FAL API key
         from models import APISettings
-        api_settings = APISettings.get_settings()
+        api_settings = APISettings.get_cached()
         if not api_settings.get_fal_key():
             return jsonify({
                 'error': 'FAL API key not configured',
@@ -458,7 +420,9 @@ def generate_explainer():
                 width=result['width'],
                 height=result['height'],
                 user_id=current_user.id,
-                created_at=datetime.utcnow()
+                created_at=datetime.utcnow(),
+                thumbnail_filename=result['thumbnail_filename'],
+                placeholder=result['placeholder']
             )
             db.session.add(new_image)
             db.session.commit()
@@ -1,9 +1,12 @@
-from flask import Blueprint, render_template, abort, jsonify, request
+from flask import Blueprint, render_template, abort, jsonify, request, Response, stream_with_context
 from flask_login import login_required, current_user
 from models import Image, db
 from extensions import limiter, get_rate_limit_string
+from services.derivatives import remove_image_files
+from services.exports import gallery_exporter
+from .download import send_image_file
 import markdown2
-import os
+from datetime import datetime
 
 gallery_bp = Blueprint('gallery', __name__)
 
@@ -23,39 +26,114 @@ def view_gallery():
 @limiter.limit(get_rate_limit_string())
 @login_required
 def get_gallery_images():
-    """API endpoint for paginated gallery images"""
-    page = request.args.get('page', 1, type=int)
+    """
+    API endpoint for cursor-paginated gallery images, newest first.
+
+    Pass the previous response's next_cursor as ?after=<created_at>,<id> to
+    get the following page. Pages are read by seeking the (user_id,
+    created_at, id) index, so they cost the same however deep the scroll
+    goes; the total is only counted for the first page.
+    """
     per_page = request.args.get('per_page', IMAGES_PER_PAGE, type=int)
 
     # Limit per_page to prevent abuse
-    per_page = min(per_page, 50)
+    per_page = max(1, min(per_page, 50))
+
+    query = Image.query.filter_by(user_id=current_user.id)
 
-    # Get paginated images
-    pagination = Image.query.filter_by(user_id=current_user.id)\
-                           .order_by(Image.created_at.desc())\
-                           .paginate(page=page, per_page=per_page, error_out=False)
+    after = request.args.get('after')
+    if after:
+        try:
+            created_at, image_id = parse_cursor(after)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(db.or_(
+            Image.created_at < created_at,
+            db.and_(Image.created_at == created_at, Image.id < image_id)
+        ))
+
+    # Fetch one extra row to learn whether another page exists
+    images = query.order_by(Image.created_at.desc(), Image.id.desc())\
+                  .limit(per_page + 1).all()
+    has_next = len(images) > per_page
+    images = images[:per_page]
 
     images_data = []
-    for image in pagination.items:
+    for image in images:
         images_data.append({
             'id': image.id,
             'url': image.get_url(),
-            'thumbnail_url': image.get_thumbnail_url() if hasattr(image, 'get_thumbnail_url') else image.get_url(),
+            'thumbnail_url': image.get_thumbnail_url(),
+            'placeholder': image.placeholder,
             'prompt': image.prompt[:100] + '...' if image.prompt and len(image.prompt) > 100 else image.prompt,
             'created_at': image.created_at.isoformat() if image.created_at else None,
             'width': image.width,
             'height': image.height
         })
 
-    return jsonify({
+    response = {
         'images': images_data,
-        'page': page,
         'per_page': per_page,
-        'total': pagination.total,
-        'pages': pagination.pages,
-        'has_next': pagination.has_next,
-        'has_prev': pagination.has_prev
-    })
+        'has_next': has_next,
+        'next_cursor': make_cursor(images[-1]) if has_next else None
+    }
+    if not after:
+        response['total'] = Image.query.filter_by(user_id=current_user.id).count()
+
+    return jsonify(response)
+
+def make_cursor(image):
+    """Encode an image's position in the newest-first gallery order"""
+    return f"{image.created_at.isoformat()},{image.id}"
+
+def parse_cursor(cursor):
+    """Decode a make_cursor() value into (created_at, id); raises ValueError"""
+    created_at, image_id = cursor.rsplit(',', 1)
+    return datetime.fromisoformat(created_at), int(image_id)
+
+@gallery_bp.route('/api/gallery/export')
+@limiter.limit(get_rate_limit_string())
+@login_required
+def export_gallery():
+    """
+    Download images as one streamed ZIP.
+
+    ?format=png|webp|jpeg (default png) picks the format; ?ids=1,2,3
+    limits the export to those images, otherwise the whole gallery is
+    exported. A finished archive is cached, so repeat and resumed (Range)
+    requests for the same selection are served from disk.
+    """
+    format_lower = request.args.get('format', 'png').lower()
+    if format_lower not in {'png', 'webp', 'jpeg'}:
+        return jsonify({'error': 'Invalid format'}), 400
+
+    query = Image.query.filter_by(user_id=current_user.id)
+    ids = request.args.get('ids')
+    if ids:
+        try:
+            query = query.filter(Image.id.in_([int(image_id) for image_id in ids.split(',')]))
+        except ValueError:
+            return jsonify({'error': 'Invalid image ids'}), 400
+
+    images = query.order_by(Image.created_at.desc(), Image.id.desc()).all()
+    if not images:
+        return jsonify({'error': 'No images to export'}), 404
+
+    export_key = gallery_exporter.export_key(current_user.id, format_lower, images)
+    download_name = f"sketchmaker_gallery_{format_lower}.zip"
+
+    cached_path = gallery_exporter.cached_path(export_key)
+    if cached_path:
+        return send_image_file(cached_path, 'application/zip', download_name)
+
+    response = Response(
+        stream_with_context(gallery_exporter.stream(export_key, format_lower, images)),
+        mimetype='application/zip'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Pass chunks straight through nginx
+    return response
 
 @gallery_bp.route('/gallery/<int:image_id>')
 @limiter.limit(get_rate_limit_string())
@@ -77,16 +155,8 @@ def delete_image(image_id):
         abort(403)  # Forbidden if not owner
     
     try:
-        # Delete the actual image files (both PNG and WebP versions)
-        base_filename = os.path.splitext(image.filename)[0]
-        png_path = os.path.join('static', 'images', f'{base_filename}.png')
-        webp_path = os.path.join('static', 'images', f'{base_filename}.webp')
-        
-        # Try to delete both file versions if they exist
-        if os.path.exists(png_path):
-            os.remove(png_path)
-        if os.path.exists(webp_path):
-            os.remove(webp_path)
+        # Delete the stored image files and any cached format derivatives
+        remove_image_files(image)
         
         # Delete the database entry
         db.session.delete(image)
@@ -1,12 +1,14 @@
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, jsonify, request, current_app, url_for
 from flask_login import login_required, current_user
 from .image_generator import generate_image
 from .prompt_generator import generate_prompt
 from .clients import APIKeyError
-from models import db, Image, APISettings
+from models import db, Image, APISettings, User, GenerationJob
+from services.job_queue import generation_queue, settle_reserved_credits, JobError, JobProgress
+from .jobs import events_url, parse_num_images, invalid_num_images_response
+from services.derivatives import derivative_encoder
+from services.storage import image_storage
 from extensions import limiter, get_rate_limit_string
-import os
-from PIL import Image as PILImage
 import uuid
 import traceback
 from fal_client.client import FalClientError
@@ -16,10 +18,6 @@ from google.api_core import exceptions as google_exceptions
 
 generate_bp = Blueprint('generate', __name__)
 
-def get_absolute_path(filename):
-    """Get absolute path for a file in the static/images directory"""
-    return os.path.join(current_app.root_path, 'static', 'images', filename)
-
 @generate_bp.route('/generate/prompt', methods=['POST'])
 @limiter.limit(get_rate_limit_string())
 @login_required
@@ -56,7 +54,7 @@ def generate_prompt_route():
             }), 400
 
         # Check if system has required API keys
-        api_settings = APISettings.get_settings()
+        api_settings = APISettings.get_cached()
         if not api_settings.has_required_keys():
             return jsonify({
                 'error': 'System configuration incomplete',
@@ -123,7 +121,7 @@ def generate_prompt_route():
 def generate_image_route():
     try:
         # Check if system has required API keys first (before credit check)
-        api_settings = APISettings.get_settings()
+        api_settings = APISettings.get_cached()
         if not api_settings.has_required_keys():
             return jsonify({
                 'error': 'System configuration incomplete',
@@ -140,7 +138,9 @@ def generate_image_route():
             }), 400
 
         # Get number of images to calculate credit cost upfront
-        num_images = data.get('num_images', 1)
+        num_images = parse_num_images(data)
+        if num_images is None:
+            return invalid_num_images_response()
 
         # Get all parameters from request
         prompt = data['prompt']
@@ -225,7 +225,7 @@ def generate_image_route():
             generation_params.update({
                 'aspect_ratio': data.get('aspect_ratio', '1:1'),
                 'guidance_scale': float(data.get('guidance_scale', 3.5)),
-                'num_images': int(data.get('num_images', 1)),
+                'num_images': num_images,
                 'output_format': data.get('output_format', 'jpeg'),
                 'safety_tolerance': data.get('safety_tolerance', '2')
             })
@@ -235,7 +235,7 @@ def generate_image_route():
                 'aspect_ratio': data.get('aspect_ratio', '1:1'),
                 'resolution': data.get('resolution', '1K'),
                 'output_format': data.get('output_format', 'png'),
-                'num_images': int(data.get('num_images', 1))
+                'num_images': num_images
             })
         elif model == 'fal-ai/ideogram/v2':
             generation_params.update({
@@ -254,7 +254,7 @@ def generate_image_route():
         elif model == 'fal-ai/imagen4/preview':
             generation_params.update({
                 'aspect_ratio': data.get('aspect_ratio') or '1:1',
-                'num_images': data.get('num_images', 1)
+                'num_images': num_images
             })
             if data.get('negative_prompt'):
                 generation_params['negative_prompt'] = data.get('negative_prompt')
@@ -262,7 +262,7 @@ def generate_image_route():
             generation_params.update({
                 'rendering_speed': data.get('rendering_speed') or 'BALANCED',
                 'expand_prompt': data.get('expand_prompt') if data.get('expand_prompt') is not None else True,
-                'num_images': data.get('num_images', 1),
+                'num_images': num_images,
                 'image_size': data.get('image_size') or 'square_hd',
                 'image_urls': []
             })
@@ -327,160 +327,12 @@ def generate_image_route():
         print(f"Generating image with parameters: {generation_params}")
 
         # SECURITY FIX: Reserve credits BEFORE generating images
-        # This prevents race condition attacks where users send concurrent requests
+        # This prevents race condition attacks where users send concurrent requests.
+        # The job refunds them if generation fails.
         subscription = current_user.get_subscription()
         try:
-            with subscription.reserve_credits('images', num_images) as credits_cost:
-                print(f"Reserved {credits_cost} credits for {num_images} image(s)")
-
-                # Generate the image (credits already deducted, will be refunded if this fails)
-                try:
-                    result = generate_image(generation_params)
-                except FalClientError as e:
-                    if "No user found for Key ID and Secret" in str(e):
-                        # Credits will be automatically refunded
-                        return jsonify({
-                            'error': 'Invalid FAL API key',
-                            'details': 'Contact administrator - FAL API key issue',
-                            'type': 'invalid_fal_key'
-                        }), 401
-                    elif "rate limit" in str(e).lower():
-                        return jsonify({
-                            'error': 'Rate limit exceeded',
-                            'details': 'Please try again later',
-                            'type': 'rate_limit'
-                        }), 429
-                    else:
-                        return jsonify({
-                            'error': 'FAL API error',
-                            'details': str(e),
-                            'type': 'fal_api_error'
-                        }), 400
-                except Exception as e:
-                    # Credits will be automatically refunded
-                    return jsonify({
-                        'error': 'Failed to generate image',
-                        'details': str(e),
-                        'type': 'generation_error'
-                    }), 500
-
-                if not result or 'image_url' not in result:
-                    # Credits will be automatically refunded
-                    return jsonify({
-                        'error': 'Invalid response from image generator',
-                        'details': 'The image generation service returned an invalid response',
-                        'type': 'invalid_response'
-                    }), 500
-
-                # Save each generated image to database
-                saved_images = []
-                for image_url in result['image_url']:
-                    filename = image_url.split('/')[-1]
-                    base_name = os.path.splitext(filename)[0]
-                    original_ext = os.path.splitext(filename)[1].lower()
-
-                    try:
-                        print(f"Processing image: {filename}")
-
-                        # Load the original image
-                        original_filepath = get_absolute_path(filename)
-                        if not os.path.exists(original_filepath):
-                            print(f"Warning: Original file not found: {original_filepath}")
-                            continue
-
-                        img = PILImage.open(original_filepath)
-
-                        # Always save a PNG version first
-                        png_filename = f"{base_name}.png"
-                        png_filepath = get_absolute_path(png_filename)
-                        img.save(png_filepath, 'PNG')
-
-                        # Save WebP version
-                        webp_filename = f"{base_name}.webp"
-                        webp_filepath = get_absolute_path(webp_filename)
-                        img.save(webp_filepath, 'WEBP')
-
-                        # Save JPEG version
-                        jpeg_filename = f"{base_name}.jpeg"
-                        jpeg_filepath = get_absolute_path(jpeg_filename)
-                        # Convert to RGB mode for JPEG
-                        if img.mode in ('RGBA', 'P'):
-                            img = img.convert('RGB')
-                        img.save(jpeg_filepath, 'JPEG')
-
-                        # Save image record to database with PNG as primary filename
-                        new_image = Image(
-                            filename=png_filename,  # Always store PNG as the primary filename
-                            prompt=prompt,
-                            art_style=art_style,
-                            width=result.get('width'),
-                            height=result.get('height'),
-                            user_id=current_user.id
-                        )
-                        db.session.add(new_image)
-
-                        saved_images.append({
-                            'png_url': f'/static/images/{png_filename}',
-                            'webp_url': f'/static/images/{webp_filename}',
-                            'jpeg_url': f'/static/images/{jpeg_filename}',
-                            'image_url': f'/static/images/{png_filename}'  # Keep image_url for backward compatibility
-                        })
-
-                        print(f"Successfully processed image: {filename}")
-
-                        # Clean up original file if it's not PNG
-                        if original_ext != '.png' and os.path.exists(original_filepath):
-                            os.remove(original_filepath)
-
-                    except FileNotFoundError as e:
-                        print(f"File not found error: {str(e)}")
-                        continue
-                    except Exception as e:
-                        print(f"Error processing image {filename}: {str(e)}")
-                        print(traceback.format_exc())
-                        continue
-
-                if not saved_images:
-                    # Credits will be automatically refunded
-                    return jsonify({
-                        'error': 'No images were successfully processed',
-                        'details': 'Failed to save generated images',
-                        'type': 'processing_error'
-                    }), 500
-
-                db.session.commit()
-
-                # Log usage history for audit trail
-                images_generated = len(saved_images)
-                if images_generated > 0:
-                    current_user.log_usage(
-                        action='images',
-                        credits_used=credits_cost,
-                        extra_data={
-                            'model': model,
-                            'prompt': prompt,
-                            'art_style': art_style,
-                            'images_generated': images_generated
-                        }
-                    )
-
-                response_data = {
-                    'images': saved_images,
-                    'prompt': prompt,
-                    'art_style': art_style,
-                    'model': model,
-                    'credits_remaining': current_user.get_credits_remaining()
-                }
-
-                # Add dimension info if available
-                if 'width' in result and 'height' in result:
-                    response_data.update({
-                        'width': result['width'],
-                        'height': result['height']
-                    })
-
-                return jsonify(response_data)
-
+            credits_cost = subscription.deduct_credits('images', num_images)
+            print(f"Reserved {credits_cost} credits for {num_images} image(s)")
         except ValueError as e:
             # Insufficient credits or other validation error
             error_msg = str(e)
@@ -504,6 +356,38 @@ def generate_image_route():
                     'details': error_msg,
                     'type': 'validation_error'
                 }), 400
+
+        # Hand the render to a background worker and return immediately
+        job = GenerationJob(
+            job_id=GenerationJob.generate_job_id(),
+            user_id=current_user.id,
+            subscription_id=subscription.id,
+            feature_type='images',
+            arguments={
+                'generation_params': generation_params,
+                'prompt': prompt,
+                'art_style': art_style,
+                'model': model,
+                'num_images': num_images
+            },
+            credits_reserved=credits_cost
+        )
+        try:
+            db.session.add(job)
+            db.session.commit()
+            generation_queue.enqueue(job)
+        except Exception:
+            db.session.rollback()
+            subscription.refund_credits(credits_cost)
+            raise
+
+        return jsonify({
+            'job_id': job.job_id,
+            'status': job.status,
+            'status_url': url_for('jobs.get_job', job_id=job.job_id),
+            'events_url': events_url(job),
+            'credits_remaining': subscription.credits_remaining
+        }), 202
     except APIKeyError as e:
         return jsonify({
             'error': 'API configuration issue',
@@ -518,3 +402,117 @@ def generate_image_route():
             'details': 'Please try again. If the problem persists, contact support.',
             'type': 'unexpected_error'
         }), 500
+
+
+def save_generated_images(image_paths, user_id, prompt, art_style, width=None, height=None):
+    """Store downloaded images as PNG primaries with gallery previews and add gallery rows (uncommitted).
+
+    WebP and JPEG copies are encoded on first download through the download route.
+    """
+    # Every image is converted, previewed and stored in parallel
+    stored = derivative_encoder.ingest(image_paths, convert_to_png=True)
+
+    saved_images = []
+    for image_path, columns in zip(image_paths, stored):
+        if columns is None:
+            print(f"Error processing image: {image_path}")
+            continue
+
+        key = columns['filename']
+        print(f"Successfully processed image: {key}")
+
+        # Save image record to database with PNG as primary filename
+        new_image = Image(
+            prompt=prompt,
+            art_style=art_style,
+            user_id=user_id,
+            **dict(columns, width=width or columns['width'], height=height or columns['height'])
+        )
+        db.session.add(new_image)
+
+        png_url = image_storage.url(key)
+        saved_images.append({
+            'png_url': png_url,
+            'webp_url': f'/download/{key}/webp',
+            'jpeg_url': f'/download/{key}/jpeg',
+            'image_url': png_url  # Keep image_url for backward compatibility
+        })
+
+    return saved_images
+
+
+def run_image_job(job):
+    """Run a queued image generation job on a generation worker thread"""
+    arguments = job.arguments
+    prompt = arguments['prompt']
+    art_style = arguments.get('art_style')
+    model = arguments['model']
+
+    def on_submit(request_id):
+        job.request_id = request_id
+        db.session.commit()
+
+    try:
+        result = generate_image(
+            arguments['generation_params'],
+            on_submit=on_submit,
+            on_queue_update=JobProgress(job)
+        )
+    except FalClientError as e:
+        if "No user found for Key ID and Secret" in str(e):
+            raise JobError('Invalid FAL API key. Contact administrator.', 'invalid_fal_key')
+        elif "rate limit" in str(e).lower():
+            raise JobError('Rate limit exceeded. Please try again later.', 'rate_limit')
+        raise JobError(f'FAL API error: {str(e)}', 'fal_api_error')
+    except APIKeyError:
+        raise JobError('Contact administrator - system API configuration issue', 'api_key_error')
+
+    if not result or 'image_paths' not in result:
+        raise JobError('The image generation service returned an invalid response', 'invalid_response')
+
+    saved_images = save_generated_images(
+        result['image_paths'],
+        user_id=job.user_id,
+        prompt=prompt,
+        art_style=art_style,
+        width=result.get('width'),
+        height=result.get('height')
+    )
+
+    if not saved_images:
+        raise JobError('Failed to save generated images', 'processing_error')
+
+    db.session.commit()
+
+    # Log usage of the credits reserved for the images actually saved
+    credits_used = settle_reserved_credits(job, len(saved_images))
+    user = db.session.get(User, job.user_id)
+    user.log_usage(
+        action='images',
+        credits_used=credits_used,
+        extra_data={
+            'model': model,
+            'prompt': prompt,
+            'art_style': art_style,
+            'images_generated': len(saved_images)
+        }
+    )
+
+    response_data = {
+        'images': saved_images,
+        'prompt': prompt,
+        'art_style': art_style,
+        'model': model
+    }
+
+    # Add dimension info if available
+    if 'width' in result and 'height' in result:
+        response_data.update({
+            'width': result['width'],
+            'height': result['height']
+        })
+
+    return response_data
+
+
+generation_queue.register('images', run_image_job)
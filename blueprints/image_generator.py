@@ -1,10 +1,8 @@
-import uuid
-import os
-import requests
 from flask import current_app, jsonify, Blueprint
 from flask_login import login_required, current_user
-from .clients import init_fal_client
-import io
+from .clients import init_fal_client, submit_and_wait
+from services.downloader import image_downloader
+from services.storage import image_storage
 import fal_client
 from models import db, TrainingHistory
 
@@ -194,8 +192,14 @@ def get_model_arguments(model, data):
 
     return final_args
 
-def generate_image(data):
-    """Generate image using FAL API with user's API key"""
+def generate_image(data, on_submit=None, on_queue_update=None):
+    """
+    Generate image using FAL API with the system API key.
+
+    The request is submitted to the FAL queue and polled until done.
+    on_submit(request_id) is called once queued; on_queue_update(status)
+    receives every status update while the request is pending.
+    """
     try:
         # Validate inputs
         if not data.get("prompt"):
@@ -209,11 +213,6 @@ def generate_image(data):
         # Initialize FAL client and get instance
         client = init_fal_client()
 
-        def on_queue_update(update):
-            if isinstance(update, fal_client.InProgress):
-                for log in update.logs:
-                    print(f"FAL generation log: {log['message']}")
-
         # Get model-specific arguments
         arguments = get_model_arguments(model, data)
 
@@ -221,12 +220,20 @@ def generate_image(data):
         print(f"Using Model: {model}")
         print(f"With Arguments: {arguments}")
         
-        # Generate image using FAL API
-        result = client.subscribe(
+        def log_queue_update(update):
+            if isinstance(update, fal_client.InProgress):
+                for log in update.logs or []:
+                    print(f"FAL generation log: {log['message']}")
+            if on_queue_update:
+                on_queue_update(update)
+
+        # Submit to the FAL queue and poll for completion
+        result = submit_and_wait(
+            client,
             model,
-            arguments=arguments,
-            with_logs=True,
-            on_queue_update=on_queue_update
+            arguments,
+            on_submit=on_submit,
+            on_queue_update=log_queue_update
         )
         
         print(f"Received response from FAL: {result}")
@@ -235,7 +242,11 @@ def generate_image(data):
         if not result or 'images' not in result:
             raise ValueError("Invalid response from FAL API")
 
-        image_urls = []
+        extension = 'png'
+        if arguments.get('output_format') == 'jpeg':
+            extension = 'jpg'
+
+        downloads = []
         for img in result['images']:
             # Handle different response formats
             if isinstance(img, dict):
@@ -249,48 +260,19 @@ def generate_image(data):
             if not image_url:
                 continue
 
-            # Generate a unique filename
-            base_filename = str(uuid.uuid4())
-            
-            # Get absolute paths
-            static_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static')
-            images_dir = os.path.join(static_dir, 'images')
-            
-            # Ensure the images directory exists
-            os.makedirs(images_dir, exist_ok=True)
-            
-            # Download image
-            response = requests.get(image_url)
-            response.raise_for_status()
-            
-            # Load image into memory
-            image_data = io.BytesIO(response.content)
-            
-            # Save image
-            extension = 'png'
-            if arguments.get('output_format') == 'jpeg':
-                extension = 'jpg'
-            
-            filename = f"{base_filename}.{extension}"
-            filepath = os.path.join(images_dir, filename)
-            
-            with open(filepath, 'wb') as f:
-                f.write(image_data.getvalue())
-            
-            print(f"Saved image to: {filepath}")
-            
-            # Verify file was saved
-            if not os.path.exists(filepath):
-                print(f"Warning: Failed to save image to {filepath}")
-                continue
-                
-            image_urls.append(f"/static/images/{filename}")
+            downloads.append((image_url, image_storage.staging_path(extension)))
+
+        # Download all images concurrently, streaming each to the staging directory; failed ones are skipped
+        image_paths = [path for path in image_downloader.download_all(downloads) if path]
+        for filepath in image_paths:
+            print(f"Downloaded image to: {filepath}")
 
-        if not image_urls:
+        if not image_paths:
             raise ValueError("No images were successfully downloaded")
 
+        # The caller stores the staged files (see DerivativeEncoder.ingest)
         response_data = {
-            "image_url": image_urls,
+            "image_paths": image_paths,
         }
 
         # Add dimension info for models that use it
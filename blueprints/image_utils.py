@@ -3,7 +3,8 @@ Image Utility Blueprint
 Provides image optimization endpoints for various services
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response
+import json
 from flask_login import login_required
 from services.image_optimizer import ImageOptimizer
 from extensions import limiter
@@ -63,14 +64,19 @@ def optimize_image():
 @login_required
 def batch_optimize():
     """
-    Optimize multiple images at once.
+    Optimize multiple images at once, in parallel.
     
     Request body:
     {
         "images": ["base64 or data URL", ...],
         "service": "fal|magix|training|thumbnail",
-        "config": { ... }  // optional
+        "config": { ... },  // optional
+        "stream": false     // optional
     }
+
+    With "stream": true the response is newline-delimited JSON, one
+    {"index", "image", "metadata"} object per image as soon as it is
+    optimized (in completion order), followed by {"done": true, ...}.
     """
     try:
         data = request.get_json()
@@ -88,6 +94,19 @@ def batch_optimize():
         if len(images) > 10:
             return jsonify({'error': 'Maximum 10 images per batch'}), 400
         
+        if data.get('stream'):
+            def generate():
+                processed = 0
+                for index, optimized_data, metadata in ImageOptimizer.iter_optimize(images, service, custom_config):
+                    processed += 1
+                    yield json.dumps({'index': index, 'image': optimized_data, 'metadata': metadata}) + '\n'
+                yield json.dumps({'done': True, 'total_processed': processed}) + '\n'
+
+            return Response(generate(), mimetype='application/x-ndjson', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'  # Let nginx flush each image as it is written
+            })
+
         # Optimize all images
         results = ImageOptimizer.batch_optimize(
             images=images,
@@ -0,0 +1,190 @@
+from flask import Blueprint, jsonify, request, Response, stream_with_context, current_app, url_for
+from flask_login import login_required, current_user
+from models import db, GenerationJob
+from extensions import limiter
+import json
+import time
+import threading
+
+jobs_bp = Blueprint('jobs', __name__)
+
+# Server-Sent Events stream settings
+EVENTS_POLL_INTERVAL = 0.5  # seconds between job row reads
+EVENTS_KEEPALIVE_INTERVAL = 15  # seconds between keepalive comments
+EVENTS_MAX_DURATION = 300  # seconds before the client is asked to reconnect
+EVENTS_RETRY_MS = 2000
+
+# Images a single generation job may ask FAL for
+MAX_IMAGES_PER_JOB = 4
+
+# Streams open in this process; each one holds a worker thread for its whole duration
+_open_streams = 0
+_open_streams_lock = threading.Lock()
+
+
+def events_url(job):
+    """URL of a job's progress stream, or None when streaming is off and clients poll status_url"""
+    if current_app.config['JOB_EVENTS_MAX_STREAMS'] <= 0:
+        return None
+    return url_for('jobs.job_events', job_id=job.job_id)
+
+
+def parse_num_images(data):
+    """The request's num_images (default 1), or None unless it is an integer from 1 to MAX_IMAGES_PER_JOB"""
+    value = data.get('num_images', 1)
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        # int() would accept True or truncate 2.5
+        return None
+    try:
+        num_images = int(value)
+    except (TypeError, ValueError):
+        return None
+    if not 1 <= num_images <= MAX_IMAGES_PER_JOB:
+        return None
+    return num_images
+
+
+def invalid_num_images_response():
+    """400 response for a num_images outside 1..MAX_IMAGES_PER_JOB"""
+    return jsonify({
+        'error': 'Invalid number of images',
+        'details': f'num_images must be a whole number from 1 to {MAX_IMAGES_PER_JOB}',
+        'type': 'invalid_num_images'
+    }), 400
+
+
+def _acquire_stream():
+    global _open_streams
+    with _open_streams_lock:
+        if _open_streams >= current_app.config['JOB_EVENTS_MAX_STREAMS']:
+            return False
+        _open_streams += 1
+        return True
+
+
+def _release_stream():
+    global _open_streams
+    with _open_streams_lock:
+        _open_streams -= 1
+
+
+def format_event(event, data, event_id=None):
+    """Format a single Server-Sent Event"""
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    message += f"data: {json.dumps(data)}\n\n"
+    return message
+
+
+@jobs_bp.route('/api/jobs/<job_id>')
+@limiter.limit("120 per minute")  # Clients poll this while a job runs
+@login_required
+def get_job(job_id):
+    """Get the status (and result once finished) of a background generation job"""
+    job = GenerationJob.query.filter_by(
+        job_id=job_id,
+        user_id=current_user.id
+    ).first()
+
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    response_data = job.to_dict()
+    if job.is_finished:
+        response_data['credits_remaining'] = current_user.get_credits_remaining()
+
+    return jsonify(response_data)
+
+
+@jobs_bp.route('/api/jobs/<job_id>/events')
+@limiter.limit("30 per minute")
+@login_required
+def job_events(job_id):
+    """
+    Stream job progress as Server-Sent Events.
+
+    Emits 'status' when the status or queue position changes, one 'log'
+    event per FAL log line (the event id is the log index, so a reconnect
+    with Last-Event-ID resumes where it left off) and a final 'completed'
+    or 'failed' event carrying the same payload as GET /api/jobs/<job_id>.
+
+    Off unless JOB_EVENTS_MAX_STREAMS is set, and limited to that many
+    streams per process; clients poll GET /api/jobs/<job_id> otherwise.
+    """
+    job = GenerationJob.query.filter_by(
+        job_id=job_id,
+        user_id=current_user.id
+    ).first()
+
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    if not _acquire_stream():
+        return jsonify({'error': 'Progress streaming unavailable, poll the job status instead'}), 503
+
+    job_pk = job.id
+    user = current_user._get_current_object()
+
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_event_id = 0
+
+    def generate():
+        log_count = last_event_id
+        last_status = None
+        last_keepalive = started = time.monotonic()
+
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+
+        while True:
+            # End the read transaction so the next query sees worker commits
+            db.session.commit()
+            job = db.session.get(GenerationJob, job_pk, populate_existing=True)
+            if job is None:
+                return
+
+            progress = job.progress or {}
+            status = {
+                'status': job.status,
+                'queue_position': progress.get('queue_position'),
+                'percent': progress.get('percent')
+            }
+            if status != last_status:
+                last_status = status
+                yield format_event('status', status)
+
+            # Only the most recent lines are kept on the job; skip any that rolled off
+            total_logs = progress.get('log_count', 0)
+            logs = progress.get('logs') or []
+            first_index = total_logs - len(logs)
+            for index in range(max(log_count, first_index), total_logs):
+                yield format_event('log', {'message': logs[index - first_index]}, index + 1)
+            log_count = max(log_count, total_logs)
+
+            if job.is_finished:
+                data = job.to_dict()
+                data['credits_remaining'] = user.get_credits_remaining()
+                yield format_event(job.status, data)
+                return
+
+            now = time.monotonic()
+            if now - started > EVENTS_MAX_DURATION:
+                return
+            if now - last_keepalive > EVENTS_KEEPALIVE_INTERVAL:
+                last_keepalive = now
+                yield ": keepalive\n\n"
+
+            time.sleep(EVENTS_POLL_INTERVAL)
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Let nginx flush events as they are written
+        }
+    )
+    response.call_on_close(_release_stream)
+    return response
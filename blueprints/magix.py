@@ -1,48 +1,36 @@
-from flask import Blueprint, render_template, request, jsonify, current_app
+from flask import Blueprint, render_template, request, jsonify, current_app, url_for
 from flask_login import login_required, current_user
-from .clients import init_fal_client
+from .clients import init_fal_client, submit_and_wait
 import fal_client
-import os
 import uuid
-import requests
 from extensions import limiter, get_rate_limit_string
-from models import db
+from models import db, User, GenerationJob
 from models.content import Image
-from PIL import Image as PILImage
 import json
 import base64
 from io import BytesIO
 from services.image_optimizer import ImageOptimizer
+from services.downloader import image_downloader
+from services.derivatives import derivative_encoder
+from services.storage import image_storage
+from services.fal_uploads import fal_uploader
+from services.job_queue import generation_queue, settle_reserved_credits, JobError, JobProgress
+from .jobs import events_url, parse_num_images, invalid_num_images_response
 
 magix_bp = Blueprint('magix', __name__)
 
-def save_result_image(url):
-    """Save the result image locally and return both URL and filename"""
+def save_result_images(urls):
+    """Download and store result images concurrently; return the Image columns for each (None if it failed)"""
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-
-        # Generate unique filename
-        filename = f"nano_{uuid.uuid4()}.jpg"
-        filepath = os.path.join(current_app.root_path, 'static', 'images', filename)
-
-        # Save the image
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
-        
-        # Get image dimensions
-        width, height = None, None
-        try:
-            with PILImage.open(filepath) as img:
-                width, height = img.size
-        except Exception as e:
-            print(f"Error getting image dimensions: {str(e)}")
-
-        return f'/static/images/{filename}', filename, width, height
+        downloads = [(url, image_storage.staging_path('jpg')) for url in urls]
+        filepaths = image_downloader.download_all(downloads)
     except Exception as e:
         print(f"Error saving result image: {str(e)}")
         raise
 
+    # FAL's files are kept as the primaries; thumbnails and placeholders are encoded alongside
+    return derivative_encoder.ingest(filepaths, convert_to_png=False)
+
 def image_to_base64(image_path):
     """Convert image to base64 string"""
     with open(image_path, "rb") as image_file:
@@ -55,49 +43,50 @@ def magix_page():
     """Render the Nano Studio page"""
     return render_template('magix.html')
 
+def insufficient_credits_response(num_images):
+    """403 response for a user without the credits for num_images Nano Studio images"""
+    subscription = current_user.get_subscription()
+    plan_name = subscription.plan.display_name if subscription else 'No Plan'
+    credits_remaining = current_user.get_credits_remaining()
+    credit_cost = current_user.get_credit_cost('magix') * num_images
+    return jsonify({
+        'error': 'Insufficient credits for Nano Studio',
+        'details': f'You need {credit_cost} credit{"s" if credit_cost > 1 else ""} to use Nano Studio. You have {credits_remaining} credits remaining.',
+        'type': 'insufficient_credits',
+        'feature': 'magix',
+        'credits_needed': credit_cost,
+        'credits_remaining': credits_remaining,
+        'plan': plan_name
+    }), 403
+
 @magix_bp.route('/api/magix/generate', methods=['POST'])
 @limiter.limit(get_rate_limit_string())
 @login_required
 def generate_magix():
     try:
-        # Check if user can use Nano Studio (credit-based limit)
+        # Check if user can use Nano Studio (credit-based limit) before uploading anything;
+        # credits are reserved just before the job is queued
         if not current_user.can_use_feature('magix'):
-            subscription = current_user.get_subscription()
-            plan_name = subscription.plan.display_name if subscription else 'No Plan'
-            credits_remaining = current_user.get_credits_remaining()
-            credit_cost = current_user.get_credit_cost('magix')
-            return jsonify({
-                'error': 'Insufficient credits for Nano Studio',
-                'details': f'You need {credit_cost} credit{"s" if credit_cost > 1 else ""} to use Nano Studio. You have {credits_remaining} credits remaining.',
-                'type': 'insufficient_credits',
-                'feature': 'magix',
-                'credits_needed': credit_cost,
-                'credits_remaining': credits_remaining,
-                'plan': plan_name
-            }), 403
+            return insufficient_credits_response(1)
             
-        data = request.get_json()
+        # Browsers post multipart/form-data with the images as files; JSON with
+        # base64 data URLs is still accepted
+        is_multipart = request.mimetype == 'multipart/form-data'
+        data = request.form.to_dict() if is_multipart else request.get_json()
         if not data:
             return jsonify({'error': 'No data provided'}), 400
 
+        num_images = parse_num_images(data)
+        if num_images is None:
+            return invalid_num_images_response()
+
         mode = data.get('mode', 'edit')
         prompt = data.get('prompt', '')
         
-        # Initialize FAL client
-        client = init_fal_client()
-
-        # Progress tracking
-        progress_updates = []
-        def on_queue_update(update):
-            if isinstance(update, fal_client.InProgress):
-                for log in update.logs:
-                    progress_updates.append(log['message'])
-                    print(f"Nano Studio Progress: {log['message']}")
-
         # Prepare base arguments for Nano Banana Pro
         arguments = {
             "prompt": prompt,
-            "num_images": data.get('num_images', 1),
+            "num_images": num_images,
             "aspect_ratio": data.get('aspect_ratio', 'auto'),
             "output_format": data.get('output_format', 'png'),
             "resolution": data.get('resolution', '1K')  # Supports: 1K, 2K, 4K
@@ -105,7 +94,11 @@ def generate_magix():
 
         # Add image URLs if provided (for editing modes)
         # Optimize images before sending to FAL
-        if 'image_urls' in data:
+        uploads = request.files.getlist('images') if is_multipart else []
+        if uploads:
+            # Optimized from disk and uploaded to FAL storage once; FAL gets URLs
+            arguments['image_urls'] = fal_uploader.upload_images(init_fal_client(), uploads, 'magix')
+        elif 'image_urls' in data:
             optimized_urls = []
             for img_url in data['image_urls']:
                 optimized_img, metadata = ImageOptimizer.optimize_image(img_url, service='magix')
@@ -1384,124 +1377,162 @@ def generate_magix():
 
         print(f"Calling Nano Banana Pro API with mode: {mode}, arguments: {arguments}")
 
-        # Call Google's Nano Banana Pro (Nano Banana 2) API - State-of-the-art image generation and editing
+        # Reserve credits for every requested image before queueing; the job
+        # refunds them if it fails, and those for images FAL didn't return
+        subscription = current_user.get_subscription()
         try:
-            result = client.subscribe(
-                "fal-ai/nano-banana-pro/edit",
-                arguments=arguments,
-                with_logs=True,
-                on_queue_update=on_queue_update
-            )
+            credits_cost = subscription.deduct_credits('magix', arguments['num_images'])
+        except ValueError:
+            return insufficient_credits_response(arguments['num_images'])
 
-            if not result:
-                raise ValueError("Invalid response from Nano Banana Pro API")
+        # Hand the render to a background worker; clients follow it at status_url (or events_url)
+        job = GenerationJob(
+            job_id=GenerationJob.generate_job_id(),
+            user_id=current_user.id,
+            subscription_id=subscription.id,
+            feature_type='magix',
+            arguments={'mode': mode, 'prompt': prompt, 'num_images': arguments['num_images']},
+            credits_reserved=credits_cost
+        )
+        try:
+            db.session.add(job)
+            db.session.commit()
+            generation_queue.enqueue(job, fal_arguments=arguments)
+        except Exception:
+            db.session.rollback()
+            subscription.refund_credits(credits_cost)
+            raise
 
-            # Process results based on mode
-            results_data = {
-                'mode': mode,
-                'progress': progress_updates,
-                'images': [],
-                'metadata': {}
-            }
+        return jsonify({
+            'job_id': job.job_id,
+            'status': job.status,
+            'status_url': url_for('jobs.get_job', job_id=job.job_id),
+            'events_url': events_url(job)
+        }), 202
 
-            # Handle the response format from Nano Banana API
-            # Response format: {"images": [{"url": "..."}], "description": "..."}
-            if 'images' in result:
-                for img in result['images']:
-                    if img.get('url'):
-                        local_url, filename, width, height = save_result_image(img['url'])
-
-                        # Save to gallery with the actual JSON prompt sent to API
-                        try:
-                            gallery_image = Image(
-                                filename=filename,
-                                prompt=arguments['prompt'],  # Save the full JSON prompt
-                                art_style=f'nano_{mode}',
-                                width=width,
-                                height=height,
-                                user_id=current_user.id
-                            )
-                            db.session.add(gallery_image)
-                            db.session.commit()
-                            
-                            results_data['images'].append({
-                                'url': local_url,
-                                'gallery_id': gallery_image.id,
-                                'width': width,
-                                'height': height
-                            })
-                        except Exception as e:
-                            print(f"Error saving to gallery: {str(e)}")
-                            db.session.rollback()
-                            results_data['images'].append({
-                                'url': local_url,
-                                'width': width,
-                                'height': height
-                            })
-            elif 'image' in result:
-                # Single image result (fallback)
-                if result['image'].get('url'):
-                    local_url, filename, width, height = save_result_image(result['image']['url'])
-
-                    try:
-                        gallery_image = Image(
-                            filename=filename,
-                            prompt=arguments['prompt'],  # Save the full JSON prompt
-                            art_style=f'nano_{mode}',
-                            width=width,
-                            height=height,
-                            user_id=current_user.id
-                        )
-                        db.session.add(gallery_image)
-                        db.session.commit()
-                        
-                        results_data['images'].append({
-                            'url': local_url,
-                            'gallery_id': gallery_image.id,
-                            'width': width,
-                            'height': height
-                        })
-                    except Exception as e:
-                        print(f"Error saving to gallery: {str(e)}")
-                        db.session.rollback()
-                        results_data['images'].append({
-                            'url': local_url,
-                            'width': width,
-                            'height': height
-                        })
-            
-            # Add description if available
-            if 'description' in result:
-                results_data['metadata']['description'] = result['description']
-
-            # Add metadata
-            results_data['metadata'] = {
-                'seed': result.get('seed'),
-                'prompt': result.get('prompt', prompt),
-                'mode': mode,
-                'timestamp': str(uuid.uuid4())
-            }
+    except Exception as e:
+        print(f"Error in generate_magix: {str(e)}")
+        return jsonify({'error': 'An error occurred. Please try again.'}), 500
+
+
+def run_magix_job(job, fal_arguments):
+    """Run a queued Nano Studio job on a generation worker thread"""
+    arguments = fal_arguments
+    mode = job.arguments['mode']
+    prompt = job.arguments['prompt']
+    progress = JobProgress(job)
+
+    def on_queue_update(update):
+        if isinstance(update, fal_client.InProgress):
+            for log in update.logs or []:
+                print(f"Nano Studio Progress: {log['message']}")
+        progress(update)
+
+    def on_submit(request_id):
+        job.request_id = request_id
+        db.session.commit()
 
-            # Track usage
-            current_user.use_feature(
-                feature_type='magix',
-                amount=len(results_data['images']),
-                extra_data={
-                    'mode': mode,
-                    'prompt': prompt,
-                    'images_generated': len(results_data['images'])
-                }
+    # Call Google's Nano Banana Pro (Nano Banana 2) API - State-of-the-art image generation and editing
+    try:
+        client = init_fal_client()
+        result = submit_and_wait(
+            client,
+            "fal-ai/nano-banana-pro/edit",
+            arguments,
+            on_submit=on_submit,
+            on_queue_update=on_queue_update
+        )
+    except Exception as e:
+        print(f"Error calling Nano Banana Pro API: {str(e)}")
+        raise JobError('Generation failed. Please try again.')
+
+    if not result:
+        raise JobError('Generation failed. Please try again.', 'invalid_response')
+
+    # Process results based on mode
+    results_data = {
+        'mode': mode,
+        'progress': progress.messages,
+        'images': [],
+        'metadata': {}
+    }
+
+    # Handle the response format from Nano Banana API
+    # Response format: {"images": [{"url": "..."}], "description": "..."}
+    if 'images' in result:
+        result_images = [img for img in result['images'] if img.get('url')]
+    elif 'image' in result and result['image'].get('url'):
+        # Single image result (fallback)
+        result_images = [result['image']]
+    else:
+        result_images = []
+
+    saved_images = save_result_images([img['url'] for img in result_images])
+
+    for columns in saved_images:
+        if columns is None:
+            continue
+        local_url = image_storage.url(columns['filename'])
+        width, height = columns['width'], columns['height']
+
+        # Save to gallery with the actual JSON prompt sent to API
+        try:
+            gallery_image = Image(
+                prompt=arguments['prompt'],  # Save the full JSON prompt
+                art_style=f'nano_{mode}',
+                user_id=job.user_id,
+                **columns
             )
-            
-            return jsonify(results_data)
+            db.session.add(gallery_image)
+            db.session.commit()
 
+            results_data['images'].append({
+                'url': local_url,
+                'gallery_id': gallery_image.id,
+                'width': width,
+                'height': height
+            })
         except Exception as e:
-            print(f"Error calling Nano Banana Pro API: {str(e)}")
-            return jsonify({'error': 'Generation failed. Please try again.'}), 500
+            print(f"Error saving to gallery: {str(e)}")
+            db.session.rollback()
+            results_data['images'].append({
+                'url': local_url,
+                'width': width,
+                'height': height
+            })
 
-    except Exception as e:
-        print(f"Error in generate_magix: {str(e)}")
-        return jsonify({'error': 'An error occurred. Please try again.'}), 500
+    # Add metadata
+    results_data['metadata'] = {
+        'seed': result.get('seed'),
+        'prompt': result.get('prompt', prompt),
+        'mode': mode,
+        'timestamp': str(uuid.uuid4())
+    }
+
+    # Add description if available
+    if 'description' in result:
+        results_data['metadata']['description'] = result['description']
+
+    if not results_data['images']:
+        raise JobError('No images were generated. Please try again.', 'invalid_response')
+
+    # Track usage of the credits reserved for the images actually produced
+    credits_used = settle_reserved_credits(job, len(results_data['images']))
+    user = db.session.get(User, job.user_id)
+    user.log_usage(
+        action='magix',
+        credits_used=credits_used,
+        extra_data={
+            'mode': mode,
+            'prompt': prompt,
+            'images_generated': len(results_data['images'])
+        }
+    )
+
+    return results_data
+
+
+generation_queue.register('magix', run_magix_job)
 
 
 @magix_bp.route('/api/magix/history/<int:user_id>')
@@ -1524,7 +1555,9 @@ def get_history(user_id):
         for img in images:
             history.append({
                 'id': img.id,
-                'url': f'/static/images/{img.filename}',
+                'url': img.get_url(),
+                'thumbnail_url': img.get_thumbnail_url(),
+                'placeholder': img.placeholder,
                 'prompt': img.prompt,
                 'mode': img.art_style.replace('nano_', ''),
                 'created_at': img.created_at.isoformat()
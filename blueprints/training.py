@@ -6,12 +6,9 @@ import os
 import json
 import requests
 from datetime import datetime
-from werkzeug.utils import secure_filename
-import zipfile
-import io
-import base64
-import fal_client
 from models import TrainingHistory
+from services.fal_uploads import fal_uploader
+from services.training_reconciler import check_training_status, is_training_completed, log_lines
 import traceback
 import hmac
 import hashlib
@@ -19,70 +16,6 @@ import time
 
 training_bp = Blueprint('training', __name__)
 
-def is_training_completed(logs):
-    """Check if training is completed based on logs"""
-    if not logs:
-        return False
-    
-    # Convert logs to string if needed
-    logs_str = logs if isinstance(logs, str) else format_logs(logs)
-    
-    # Check for completion indicators
-    completion_indicators = [
-        'Model saved to',
-        '100/100',
-        'Training completed'
-    ]
-    
-    return any(indicator in logs_str for indicator in completion_indicators)
-
-def format_logs(logs):
-    """Format logs into a string"""
-    if not logs:
-        return ''
-    
-    # Handle array of log objects
-    if isinstance(logs, list):
-        return '\n'.join([
-            log.get('message', str(log)) if isinstance(log, dict) else str(log)
-            for log in logs
-        ])
-    # Handle string logs
-    elif isinstance(logs, str):
-        return logs
-    # Handle other types
-    return str(logs)
-
-def check_training_status(client, request_id):
-    """Check training status and get logs"""
-    try:
-        status = client.status("fal-ai/flux-lora-fast-training", request_id, with_logs=True)
-        current_app.logger.info(f"Status check response: {status}")
-        
-        # Format logs if present
-        if hasattr(status, 'logs'):
-            formatted_logs = format_logs(status.logs)
-            status.logs = formatted_logs
-            
-            # Check for completion in logs
-            if is_training_completed(formatted_logs):
-                status.status = 'completed'
-                
-        return status
-    except Exception as e:
-        current_app.logger.error(f"Error checking status: {str(e)}")
-        return None
-
-def get_training_result(client, request_id):
-    """Get training result once completed"""
-    try:
-        result = client.result("fal-ai/flux-lora-fast-training", request_id)
-        current_app.logger.info(f"Got training result: {result}")
-        return result
-    except Exception as e:
-        current_app.logger.error(f"Error getting result: {str(e)}")
-        return None
-
 def generate_webhook_secret():
     """Generate a unique webhook secret for this training job"""
     return os.urandom(24).hex()
@@ -108,17 +41,6 @@ def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def create_zip_archive(files):
-    """Create a ZIP archive from uploaded files"""
-    memory_file = io.BytesIO()
-    with zipfile.ZipFile(memory_file, 'w') as zf:
-        for file in files:
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                zf.writestr(filename, file.read())
-    memory_file.seek(0)
-    return memory_file
-
 @training_bp.route('/training')
 @limiter.limit(get_rate_limit_string())
 @login_required
@@ -147,12 +69,13 @@ def upload_training_images():
             return jsonify({'error': 'Please upload between 5 and 20 images'}), 400
 
         try:
-            zip_file = create_zip_archive(files)
-            zip_base64 = base64.b64encode(zip_file.read()).decode('utf-8')
-            data_url = f"data:application/zip;base64,{zip_base64}"
+            # The dataset is zipped on disk and uploaded to FAL storage once;
+            # only its URL goes back to the browser
+            images = [file for file in files if file and allowed_file(file.filename)]
+            images_url = fal_uploader.upload_training_archive(init_fal_client(), images)
             return jsonify({
                 'status': 'success',
-                'images_data_url': data_url
+                'images_url': images_url
             })
         except Exception as e:
             current_app.logger.error(f"Upload error: {str(e)}\n{traceback.format_exc()}")
@@ -185,7 +108,7 @@ def start_training():
         
         # Check if system has required API keys
         from models import APISettings
-        api_settings = APISettings.get_settings()
+        api_settings = APISettings.get_cached()
         if not api_settings.has_required_keys():
             return jsonify({'error': 'System API keys not configured. Contact administrator.'}), 503
 
@@ -193,11 +116,15 @@ def start_training():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
 
-        required_fields = ['images_data_url', 'trigger_word']
+        required_fields = ['images_url', 'trigger_word']
         missing_fields = [field for field in required_fields if field not in data]
         if missing_fields:
             return jsonify({'error': f'Missing fields: {", ".join(missing_fields)}'}), 400
 
+        # Comes from /api/training/upload; refuse anything but an uploaded file's URL
+        if not str(data['images_url']).startswith('https://'):
+            return jsonify({'error': 'Invalid images URL'}), 400
+
         # Initialize FAL client
         try:
             client = init_fal_client()
@@ -216,15 +143,15 @@ def start_training():
             training_id=os.urandom(16).hex(),
             trigger_word=data['trigger_word'],
             status='in_progress',
-            logs='',
-            webhook_secret=webhook_secret
+            webhook_secret=webhook_secret,
+            images_url=data['images_url']
         )
         db.session.add(training_record)
         db.session.commit()
 
         # Prepare training arguments
         training_args = {
-            'images_data_url': data['images_data_url'],
+            'images_data_url': training_record.images_url,
             'trigger_word': data['trigger_word'],
             'create_masks': data.get('create_masks', True),
             'steps': data.get('steps', 1000),
@@ -252,7 +179,8 @@ def start_training():
             # Get initial status
             status = check_training_status(client, request_id)
             if status:
-                training_record.logs = format_logs(getattr(status, 'logs', ''))
+                training_record.record_logs(getattr(status, 'logs', []))
+                training_record.status_checked_at = datetime.utcnow()
             
             db.session.commit()
             
@@ -275,8 +203,9 @@ def start_training():
 
         except Exception as e:
             current_app.logger.error(f"Training error: {str(e)}\n{traceback.format_exc()}")
+            db.session.rollback()
             training_record.status = 'failed'
-            training_record.logs = (training_record.logs or '') + "\nError: Training failed"
+            training_record.append_log_lines(["Error: Training failed"])
             db.session.commit()
             return jsonify({'error': 'Training failed to start. Please try again.'}), 500
 
@@ -294,38 +223,15 @@ def get_training_status(training_id):
             training_id=training_id
         ).first_or_404()
 
-        # If training is in progress and we have a queue_id, check status
-        if training.status == 'in_progress' and training.queue_id:
-            try:
-                client = init_fal_client()
-                status = check_training_status(client, training.queue_id)
-                
-                if status:
-                    # Update logs
-                    if hasattr(status, 'logs'):
-                        training.logs = format_logs(status.logs)
-                    
-                    # Check for completion
-                    if getattr(status, 'status', None) == 'completed' or is_training_completed(training.logs):
-                        result = get_training_result(client, training.queue_id)
-                        if result:
-                            training.status = 'completed'
-                            training.completed_at = datetime.utcnow()
-                            training.result = result
-                            training.config_url = result.get('config_file', {}).get('url')
-                            training.weights_url = result.get('diffusers_lora_file', {}).get('url')
-                            current_app.logger.info(f"Training completed. Result: {result}")
-                    elif getattr(status, 'status', None) == 'failed':
-                        training.status = 'failed'
-                        training.logs += f"\nTraining failed: {getattr(status, 'error', 'Unknown error')}"
-                    
-                    db.session.commit()
-            except Exception as e:
-                current_app.logger.error(f"Error checking training status: {str(e)}")
+        # The webhook and the background reconciler keep the row current
+        # Clients pass the log_offset of their previous response and get only newer lines
+        offset = request.args.get('offset', 0, type=int)
+        lines = training.log_lines_since(offset)
         
         return jsonify({
             'status': training.status,
-            'logs': training.logs,
+            'logs': '\n'.join(lines),
+            'log_offset': offset + len(lines),
             'config_url': training.config_url,
             'weights_url': training.weights_url,
             'trigger_word': training.trigger_word,
@@ -372,8 +278,12 @@ def webhook():
 
         current_app.logger.info(f"Processing webhook for training_id: {training.training_id}, status: {data.get('status')}")
 
+        # Fresh from FAL, so polls can skip their own status check
+        training.status_checked_at = datetime.utcnow()
+
         # Update training record based on webhook data
-        if data.get('status') == 'completed' or is_training_completed(data.get('logs')):
+        new_lines = training.record_logs(log_lines(data.get('logs')))
+        if data.get('status') == 'completed' or is_training_completed(new_lines):
             training.status = 'completed'
             training.completed_at = datetime.utcnow()
             training.result = data.get('result', {})
@@ -382,12 +292,10 @@ def webhook():
             current_app.logger.info(f"Training {training.training_id} completed successfully")
         elif data.get('status') == 'failed':
             training.status = 'failed'
-            training.logs = (training.logs or '') + f"\nError: {data.get('error', 'Unknown error')}"
+            training.append_log_lines([f"Error: {data.get('error', 'Unknown error')}"])
             current_app.logger.warning(f"Training {training.training_id} failed")
         elif data.get('status') == 'in_progress':
-            if 'logs' in data:
-                training.logs = format_logs(data['logs'])
-                current_app.logger.debug(f"Training {training.training_id} progress update")
+            current_app.logger.debug(f"Training {training.training_id} progress update: {len(new_lines)} new log lines")
 
         db.session.commit()
         return jsonify({'status': 'success'}), 200
@@ -1,48 +1,36 @@
-from flask import Blueprint, render_template, request, jsonify, current_app
+from flask import Blueprint, render_template, request, jsonify, current_app, url_for
 from flask_login import login_required, current_user
-from .clients import init_fal_client
+from .clients import init_fal_client, submit_and_wait
 import fal_client
-import os
 import uuid
-import requests
 from extensions import limiter, get_rate_limit_string
-from models import db
+from models import db, User, GenerationJob
 from models.content import Image
-from PIL import Image as PILImage
 import json
 import base64
 from io import BytesIO
 from services.image_optimizer import ImageOptimizer
+from services.downloader import image_downloader
+from services.derivatives import derivative_encoder
+from services.storage import image_storage
+from services.fal_uploads import fal_uploader
+from services.job_queue import generation_queue, settle_reserved_credits, JobError, JobProgress
+from .jobs import events_url, parse_num_images, invalid_num_images_response
 
 virtual_bp = Blueprint('virtual', __name__)
 
-def save_result_image(url):
-    """Save the result image locally and return both URL and filename"""
+def save_result_images(urls):
+    """Download and store result images concurrently; return the Image columns for each (None if it failed)"""
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-
-        # Generate unique filename
-        filename = f"virtual_{uuid.uuid4()}.jpg"
-        filepath = os.path.join(current_app.root_path, 'static', 'images', filename)
-
-        # Save the image
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
-        
-        # Get image dimensions
-        width, height = None, None
-        try:
-            with PILImage.open(filepath) as img:
-                width, height = img.size
-        except Exception as e:
-            print(f"Error getting image dimensions: {str(e)}")
-
-        return f'/static/images/{filename}', filename, width, height
+        downloads = [(url, image_storage.staging_path('jpg')) for url in urls]
+        filepaths = image_downloader.download_all(downloads)
     except Exception as e:
         print(f"Error saving result image: {str(e)}")
         raise
 
+    # FAL's files are kept as the primaries; thumbnails and placeholders are encoded alongside
+    return derivative_encoder.ingest(filepaths, convert_to_png=False)
+
 @virtual_bp.route('/virtual')
 @limiter.limit(get_rate_limit_string())
 @login_required
@@ -50,65 +38,77 @@ def virtual_page():
     """Render the Virtual Try-On page"""
     return render_template('virtual.html')
 
+def insufficient_credits_response(num_images):
+    """403 response for a user without the credits for num_images Virtual Try-On images"""
+    subscription = current_user.get_subscription()
+    plan_name = subscription.plan.display_name if subscription else 'No Plan'
+    credits_remaining = current_user.get_credits_remaining()
+    credit_cost = current_user.get_credit_cost('virtual') * num_images
+    return jsonify({
+        'error': 'Insufficient credits for Virtual Try-On',
+        'details': f'You need {credit_cost} credit{"s" if credit_cost > 1 else ""} to use Virtual Try-On. You have {credits_remaining} credits remaining.',
+        'type': 'insufficient_credits',
+        'feature': 'virtual',
+        'credits_needed': credit_cost,
+        'credits_remaining': credits_remaining,
+        'plan': plan_name
+    }), 403
+
 @virtual_bp.route('/api/virtual/generate', methods=['POST'])
 @limiter.limit(get_rate_limit_string())
 @login_required
 def generate_virtual():
     try:
-        # Check if user can use Virtual Try-On (credit-based limit)
+        # Check if user can use Virtual Try-On (credit-based limit) before uploading anything;
+        # credits are reserved just before the job is queued
         if not current_user.can_use_feature('virtual'):
-            subscription = current_user.get_subscription()
-            plan_name = subscription.plan.display_name if subscription else 'No Plan'
-            credits_remaining = current_user.get_credits_remaining()
-            credit_cost = current_user.get_credit_cost('virtual')
-            return jsonify({
-                'error': 'Insufficient credits for Virtual Try-On',
-                'details': f'You need {credit_cost} credit{"s" if credit_cost > 1 else ""} to use Virtual Try-On. You have {credits_remaining} credits remaining.',
-                'type': 'insufficient_credits',
-                'feature': 'virtual',
-                'credits_needed': credit_cost,
-                'credits_remaining': credits_remaining,
-                'plan': plan_name
-            }), 403
+            return insufficient_credits_response(1)
             
-        data = request.get_json()
+        # Browsers post multipart/form-data with the images as files; JSON with
+        # base64 data URLs is still accepted
+        is_multipart = request.mimetype == 'multipart/form-data'
+        data = request.form.to_dict() if is_multipart else request.get_json()
         if not data:
             return jsonify({'error': 'No data provided'}), 400
 
+        num_images = parse_num_images(data)
+        if num_images is None:
+            return invalid_num_images_response()
+
         prompt = data.get('prompt', '')
-        person_image = data.get('person_image')
-        dress_image = data.get('dress_image')
-        use_dress_background = data.get('use_dress_background', False)
+        if is_multipart:
+            person_image = request.files.get('person_image')
+            dress_image = request.files.get('dress_image')
+            use_dress_background = data.get('use_dress_background') == 'true'
+        else:
+            person_image = data.get('person_image')
+            dress_image = data.get('dress_image')
+            use_dress_background = data.get('use_dress_background', False)
         
         if not person_image:
             return jsonify({'error': 'Person image is required'}), 400
         if not dress_image:
             return jsonify({'error': 'Dress image is required'}), 400
         
-        # Initialize FAL client
-        client = init_fal_client()
-
-        # Progress tracking
-        progress_updates = []
-        def on_queue_update(update):
-            if isinstance(update, fal_client.InProgress):
-                for log in update.logs:
-                    progress_updates.append(log['message'])
-                    print(f"Virtual Try-On Progress: {log['message']}")
-
         # Optimize images before sending to FAL
-        optimized_person, person_metadata = ImageOptimizer.optimize_image(person_image, service='virtual')
-        optimized_dress, dress_metadata = ImageOptimizer.optimize_image(dress_image, service='virtual')
-        
-        if person_metadata.get('optimization_failed'):
-            print(f"Warning: Person image optimization failed, using original")
+        if is_multipart:
+            # Optimized from disk and uploaded to FAL storage once; FAL gets URLs
+            optimized_person, optimized_dress = fal_uploader.upload_images(
+                init_fal_client(), [person_image, dress_image], 'virtual'
+            )
         else:
-            print(f"Person image optimized: {person_metadata.get('compression_ratio', 100)}% of original size")
+            optimized_person, person_metadata = ImageOptimizer.optimize_image(person_image, service='virtual')
+            optimized_dress, dress_metadata = ImageOptimizer.optimize_image(dress_image, service='virtual')
             
-        if dress_metadata.get('optimization_failed'):
-            print(f"Warning: Dress image optimization failed, using original")
-        else:
-            print(f"Dress image optimized: {dress_metadata.get('compression_ratio', 100)}% of original size")
+            if person_metadata.get('optimization_failed'):
+                print(f"Warning: Person image optimization failed, using original")
+            else:
+                print(f"Person image optimized: {person_metadata.get('compression_ratio', 100)}% of original size")
+                
+            if dress_metadata.get('optimization_failed'):
+                print(f"Warning: Dress image optimization failed, using original")
+            else:
+                print(f"Dress image optimized: {dress_metadata.get('compression_ratio', 100)}% of original size")
 
         # Prepare arguments for the virtual try-on API
         # Construct a comprehensive prompt
@@ -123,7 +123,7 @@ def generate_virtual():
         arguments = {
             "prompt": base_prompt,
             "image_urls": [optimized_person, optimized_dress],
-            "num_images": data.get('num_images', 1)
+            "num_images": num_images
         }
 
         # Advanced parameters
@@ -134,123 +134,161 @@ def generate_virtual():
 
         print(f"Calling Virtual Try-On API with arguments: {arguments}")
 
-        # Call the FAL API (using the Nano Banana edit endpoint which can handle virtual try-on)
+        # Reserve credits for every requested image before queueing; the job
+        # refunds them if it fails, and those for images FAL didn't return
+        subscription = current_user.get_subscription()
         try:
-            result = client.subscribe(
-                "fal-ai/nano-banana/edit",
-                arguments=arguments,
-                with_logs=True,
-                on_queue_update=on_queue_update
-            )
+            credits_cost = subscription.deduct_credits('virtual', arguments['num_images'])
+        except ValueError:
+            return insufficient_credits_response(arguments['num_images'])
 
-            if not result:
-                raise ValueError("Invalid response from Virtual Try-On API")
-
-            # Process results
-            results_data = {
-                'mode': 'virtual',
-                'progress': progress_updates,
-                'images': [],
-                'metadata': {}
-            }
-
-            # Handle the response format
-            if 'images' in result:
-                for img in result['images']:
-                    if img.get('url'):
-                        local_url, filename, width, height = save_result_image(img['url'])
-                        
-                        # Save to gallery
-                        try:
-                            gallery_image = Image(
-                                filename=filename,
-                                prompt=base_prompt,
-                                art_style='virtual_tryon',
-                                width=width,
-                                height=height,
-                                user_id=current_user.id
-                            )
-                            db.session.add(gallery_image)
-                            db.session.commit()
-                            
-                            results_data['images'].append({
-                                'url': local_url,
-                                'gallery_id': gallery_image.id,
-                                'width': width,
-                                'height': height
-                            })
-                        except Exception as e:
-                            print(f"Error saving to gallery: {str(e)}")
-                            db.session.rollback()
-                            results_data['images'].append({
-                                'url': local_url,
-                                'width': width,
-                                'height': height
-                            })
-            elif 'image' in result:
-                # Single image result (fallback)
-                if result['image'].get('url'):
-                    local_url, filename, width, height = save_result_image(result['image']['url'])
-                    
-                    try:
-                        gallery_image = Image(
-                            filename=filename,
-                            prompt=base_prompt,
-                            art_style='dress_virtual_tryon',
-                            width=width,
-                            height=height,
-                            user_id=current_user.id
-                        )
-                        db.session.add(gallery_image)
-                        db.session.commit()
-                        
-                        results_data['images'].append({
-                            'url': local_url,
-                            'gallery_id': gallery_image.id,
-                            'width': width,
-                            'height': height
-                        })
-                    except Exception as e:
-                        print(f"Error saving to gallery: {str(e)}")
-                        db.session.rollback()
-                        results_data['images'].append({
-                            'url': local_url,
-                            'width': width,
-                            'height': height
-                        })
-            
-            # Add description if available
-            if 'description' in result:
-                results_data['metadata']['description'] = result['description']
-
-            # Add metadata
-            results_data['metadata'] = {
-                'seed': result.get('seed'),
-                'prompt': result.get('prompt', base_prompt),
-                'mode': 'virtual',
-                'timestamp': str(uuid.uuid4())
-            }
-
-            # Track usage
-            current_user.use_feature(
-                feature_type='virtual',
-                amount=len(results_data['images']),
-                extra_data={
-                    'prompt': base_prompt,
-                    'images_generated': len(results_data['images'])
-                }
-            )
-            
-            return jsonify(results_data)
+        # Hand the render to a background worker; clients follow it at status_url (or events_url)
+        job = GenerationJob(
+            job_id=GenerationJob.generate_job_id(),
+            user_id=current_user.id,
+            subscription_id=subscription.id,
+            feature_type='virtual',
+            arguments={'prompt': base_prompt, 'num_images': arguments['num_images']},
+            credits_reserved=credits_cost
+        )
+        try:
+            db.session.add(job)
+            db.session.commit()
+            generation_queue.enqueue(job, fal_arguments=arguments)
+        except Exception:
+            db.session.rollback()
+            subscription.refund_credits(credits_cost)
+            raise
 
-        except Exception as e:
-            print(f"Error calling Virtual Try-On API: {str(e)}")
-            return jsonify({'error': 'Generation failed. Please try again.'}), 500
+        return jsonify({
+            'job_id': job.job_id,
+            'status': job.status,
+            'status_url': url_for('jobs.get_job', job_id=job.job_id),
+            'events_url': events_url(job)
+        }), 202
 
     except Exception as e:
         print(f"Error in generate_virtual: {str(e)}")
         return jsonify({'error': 'An error occurred. Please try again.'}), 500
 
+
+def run_virtual_job(job, fal_arguments):
+    """Run a queued Virtual Try-On job on a generation worker thread"""
+    arguments = fal_arguments
+    base_prompt = job.arguments['prompt']
+    progress = JobProgress(job)
+
+    def on_queue_update(update):
+        if isinstance(update, fal_client.InProgress):
+            for log in update.logs or []:
+                print(f"Virtual Try-On Progress: {log['message']}")
+        progress(update)
+
+    def on_submit(request_id):
+        job.request_id = request_id
+        db.session.commit()
+
+    # Call the FAL API (using the Nano Banana edit endpoint which can handle virtual try-on)
+    try:
+        client = init_fal_client()
+        result = submit_and_wait(
+            client,
+            "fal-ai/nano-banana/edit",
+            arguments,
+            on_submit=on_submit,
+            on_queue_update=on_queue_update
+        )
+    except Exception as e:
+        print(f"Error calling Virtual Try-On API: {str(e)}")
+        raise JobError('Generation failed. Please try again.')
+
+    if not result:
+        raise JobError('Generation failed. Please try again.', 'invalid_response')
+
+    # Process results
+    results_data = {
+        'mode': 'virtual',
+        'progress': progress.messages,
+        'images': [],
+        'metadata': {}
+    }
+
+    # Handle the response format
+    if 'images' in result:
+        result_images = [(img, 'virtual_tryon') for img in result['images'] if img.get('url')]
+    elif 'image' in result and result['image'].get('url'):
+        # Single image result (fallback)
+        result_images = [(result['image'], 'dress_virtual_tryon')]
+    else:
+        result_images = []
+
+    saved_images = save_result_images([img['url'] for img, _ in result_images])
+
+    for (_, art_style), columns in zip(result_images, saved_images):
+        if columns is None:
+            continue
+        local_url = image_storage.url(columns['filename'])
+        width, height = columns['width'], columns['height']
+
+        # Save to gallery
+        try:
+            gallery_image = Image(
+                prompt=base_prompt,
+                art_style=art_style,
+                user_id=job.user_id,
+                **columns
+            )
+            db.session.add(gallery_image)
+            db.session.commit()
+
+            results_data['images'].append({
+                'url': local_url,
+                'gallery_id': gallery_image.id,
+                'width': width,
+                'height': height
+            })
+        except Exception as e:
+            print(f"Error saving to gallery: {str(e)}")
+            db.session.rollback()
+            results_data['images'].append({
+                'url': local_url,
+                'width': width,
+                'height': height
+            })
+
+    # Add metadata
+    results_data['metadata'] = {
+        'seed': result.get('seed'),
+        'prompt': result.get('prompt', base_prompt),
+        'mode': 'virtual',
+        'timestamp': str(uuid.uuid4())
+    }
+
+    # Add description if available
+    if 'description' in result:
+        results_data['metadata']['description'] = result['description']
+
+    if not results_data['images']:
+        raise JobError('No images were generated. Please try again.', 'invalid_response')
+
+    # Track usage of the credits reserved for the images actually produced
+    credits_used = settle_reserved_credits(job, len(results_data['images']))
+    user = db.session.get(User, job.user_id)
+    user.log_usage(
+        action='virtual',
+        credits_used=credits_used,
+        extra_data={
+            'prompt': base_prompt,
+            'images_generated': len(results_data['images'])
+        }
+    )
+
+    return results_data
+
+
+generation_queue.register('virtual', run_virtual_job)
+
+
 @virtual_bp.route('/api/virtual/history/<int:user_id>')
 @limiter.limit(get_rate_limit_string())
 @login_required
@@ -271,7 +309,7 @@ def get_virtual_history(user_id):
         for img in images:
             history.append({
                 'id': img.id,
-                'url': f'/static/images/{img.filename}',
+                'url': img.get_url(),
                 'prompt': img.prompt,
                 'created_at': img.created_at.isoformat()
             })
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Move images saved in the flat static/images layout (uuid.png) into
+content-addressed storage (ab/cd/<sha256>.<ext>).
+
+Each primary is stored under its content key and its row updated; once
+the chunk is committed, format copies written next to it are deleted, since derivatives are now encoded
+on demand. Thumbnails from the old static/thumbnails directory are
+dropped so backfill_previews.py recreates them in storage.
+
+Safe to re-run: rows that already have a storage key are skipped.
+
+Usage:
+    python migrate_image_storage.py [--batch-size 100]
+    python backfill_previews.py
+"""
+
+import os
+import sys
+import shutil
+import argparse
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def migrate_image_storage(batch_size):
+    """Store flat primaries under their content keys, committing after each chunk"""
+    from app import create_app
+    from models import db, Image
+    from services.derivatives import derivative_cache, derivative_encoder
+    from services.storage import image_storage
+
+    app = create_app()
+
+    with app.app_context():
+        legacy_dir = os.path.join(app.root_path, 'static', 'images')
+        legacy_thumbnail_dir = os.path.join(app.root_path, 'static', 'thumbnails')
+        is_flat = ~Image.filename.contains('/')
+        print(f"Images in the flat layout: {Image.query.filter(is_flat).count()}")
+
+        moved = 0
+        missing = 0
+        last_id = 0
+        while True:
+            images = Image.query.filter(
+                is_flat,
+                Image.id > last_id
+            ).order_by(Image.id).limit(batch_size).all()
+            if not images:
+                break
+            last_id = images[-1].id
+
+            moved_files = []
+            for image in images:
+                legacy_path = os.path.join(legacy_dir, image.filename)
+                if not os.path.exists(legacy_path):
+                    missing += 1
+                    continue
+
+                # store() consumes its input, so hand it a staged copy
+                staged_path = image_storage.staging_path(image.file_extension)
+                shutil.copyfile(legacy_path, staged_path)
+                key = image_storage.store(staged_path)
+
+                moved_files.append((image.filename, image.thumbnail_filename))
+                if image.thumbnail_filename and '/' not in image.thumbnail_filename:
+                    image.thumbnail_filename = None
+                image.filename = key
+
+            # Rows point at their storage keys before any flat file goes away
+            db.session.commit()
+            moved += len(moved_files)
+
+            for filename, thumbnail_filename in moved_files:
+                derivative_cache.remove(filename)
+                if thumbnail_filename and '/' not in thumbnail_filename:
+                    _remove(os.path.join(legacy_thumbnail_dir, thumbnail_filename))
+                base_filename = os.path.splitext(filename)[0]
+                for ext in ('png', 'webp', 'jpeg', 'jpg'):
+                    _remove(os.path.join(legacy_dir, f"{base_filename}.{ext}"))
+            db.session.commit()
+            print(f"  ✓ {moved} images moved, {missing} missing on disk")
+
+        derivative_encoder.stop()
+        print("\nMigration complete. Run 'python backfill_previews.py' to recreate thumbnails.")
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=100, help='Images to move per chunk')
+    args = parser.parse_args()
+    migrate_image_storage(args.batch_size)
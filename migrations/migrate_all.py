@@ -71,6 +71,46 @@ MIGRATIONS = {
         'description': 'Rename banners to explainers',
         'depends_on': 'add_new_litellm_providers',
     },
+    'add_image_gallery_index': {
+        'description': 'Gallery pagination index',
+        'depends_on': 'rename_banners_to_explainers',
+    },
+    'add_image_thumbnails': {
+        'description': 'Gallery thumbnails',
+        'depends_on': 'add_image_gallery_index',
+    },
+    'add_image_placeholders': {
+        'description': 'Image placeholders',
+        'depends_on': 'add_image_thumbnails',
+    },
+    'add_image_filename_index': {
+        'description': 'Image storage key index',
+        'depends_on': 'add_image_placeholders',
+    },
+    'add_training_images_url': {
+        'description': 'Training dataset URL',
+        'depends_on': 'add_image_filename_index',
+    },
+    'add_training_status_checked_at': {
+        'description': 'Training status refresh time',
+        'depends_on': 'add_training_images_url',
+    },
+    'add_training_log_chunks': {
+        'description': 'Append-only training logs',
+        'depends_on': 'add_training_status_checked_at',
+    },
+    'add_credit_reset_sweep': {
+        'description': 'Credit reset sweep schedule and lock',
+        'depends_on': 'add_training_log_chunks',
+    },
+    'add_generation_jobs': {
+        'description': 'Background generation jobs',
+        'depends_on': 'add_credit_reset_sweep',
+    },
+    'add_derivative_cache_entries': {
+        'description': 'On-demand derivative cache index',
+        'depends_on': 'add_generation_jobs',
+    },
 }
 
 
@@ -89,6 +129,15 @@ def table_exists(cursor, table_name):
     return cursor.fetchone() is not None
 
 
+def index_exists(cursor, index_name):
+    """Check if an index exists"""
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type='index' AND name=?",
+        (index_name,)
+    )
+    return cursor.fetchone() is not None
+
+
 def get_current_revision(cursor):
     """Get current alembic revision"""
     if not table_exists(cursor, 'alembic_version'):
@@ -146,6 +195,44 @@ def get_applied_migrations(cursor):
         if 'credit_cost_explainers' in cols:
             applied.add('rename_banners_to_explainers')
 
+    # Check for gallery pagination index
+    if index_exists(cursor, 'ix_image_user_created_id'):
+        applied.add('add_image_gallery_index')
+
+    # Check for gallery thumbnails
+    if table_exists(cursor, 'image'):
+        cols = get_table_columns(cursor, 'image')
+        if 'thumbnail_filename' in cols:
+            applied.add('add_image_thumbnails')
+        if 'placeholder' in cols:
+            applied.add('add_image_placeholders')
+
+    # Check for storage key index
+    if index_exists(cursor, 'ix_image_filename'):
+        applied.add('add_image_filename_index')
+
+    # Check for training dataset URL
+    if table_exists(cursor, 'training_history'):
+        cols = get_table_columns(cursor, 'training_history')
+        if 'images_url' in cols:
+            applied.add('add_training_images_url')
+        if 'status_checked_at' in cols:
+            applied.add('add_training_status_checked_at')
+        if 'log_line_count' in cols and table_exists(cursor, 'training_log_chunk'):
+            applied.add('add_training_log_chunks')
+
+    # Check for credit reset sweep schedule and lock
+    if index_exists(cursor, 'ix_user_subscriptions_next_reset_at') and table_exists(cursor, 'scheduler_locks'):
+        applied.add('add_credit_reset_sweep')
+
+    # Check for background generation jobs
+    if table_exists(cursor, 'generation_jobs') and 'heartbeat_at' in get_table_columns(cursor, 'generation_jobs'):
+        applied.add('add_generation_jobs')
+
+    # Check for the derivative cache index
+    if table_exists(cursor, 'derivative_cache_entries'):
+        applied.add('add_derivative_cache_entries')
+
     return applied
 
 
@@ -409,6 +496,218 @@ def run_migrations():
 
             migrations_applied.append('rename_banners_to_explainers')
 
+        # ============================================================
+        # Migration: add_image_gallery_index
+        # ============================================================
+        if 'add_image_gallery_index' in pending:
+            print("\n[8/8] Applying: add_image_gallery_index")
+
+            if table_exists(cursor, 'image') and not index_exists(cursor, 'ix_image_user_created_id'):
+                cursor.execute("CREATE INDEX ix_image_user_created_id ON image (user_id, created_at, id)")
+                print("       + Created image(user_id, created_at, id) index")
+
+            migrations_applied.append('add_image_gallery_index')
+
+        # ============================================================
+        # Migration: add_image_thumbnails
+        # ============================================================
+        if 'add_image_thumbnails' in pending:
+            print("\n[9/9] Applying: add_image_thumbnails")
+
+            if table_exists(cursor, 'image'):
+                columns = get_table_columns(cursor, 'image')
+
+                if 'thumbnail_filename' not in columns:
+                    cursor.execute("ALTER TABLE image ADD COLUMN thumbnail_filename VARCHAR(255)")
+                    print("       + Added image.thumbnail_filename column")
+                    print("       Run 'python backfill_previews.py' to create thumbnails for existing images")
+
+            migrations_applied.append('add_image_thumbnails')
+
+        # ============================================================
+        # Migration: add_image_placeholders
+        # ============================================================
+        if 'add_image_placeholders' in pending:
+            print("\n[10/10] Applying: add_image_placeholders")
+
+            if table_exists(cursor, 'image'):
+                columns = get_table_columns(cursor, 'image')
+
+                if 'placeholder' not in columns:
+                    cursor.execute("ALTER TABLE image ADD COLUMN placeholder TEXT")
+                    print("       + Added image.placeholder column")
+                    print("       Run 'python backfill_previews.py' to create placeholders for existing images")
+
+            migrations_applied.append('add_image_placeholders')
+
+        # ============================================================
+        # Migration: add_image_filename_index
+        # ============================================================
+        if 'add_image_filename_index' in pending:
+            print("\n[11/11] Applying: add_image_filename_index")
+
+            if table_exists(cursor, 'image') and not index_exists(cursor, 'ix_image_filename'):
+                cursor.execute("CREATE INDEX ix_image_filename ON image (filename)")
+                print("       + Created image(filename) index")
+
+            migrations_applied.append('add_image_filename_index')
+
+        # ============================================================
+        # Migration: add_training_images_url
+        # ============================================================
+        if 'add_training_images_url' in pending:
+            print("\n[12/12] Applying: add_training_images_url")
+
+            if table_exists(cursor, 'training_history'):
+                columns = get_table_columns(cursor, 'training_history')
+
+                if 'images_url' not in columns:
+                    cursor.execute("ALTER TABLE training_history ADD COLUMN images_url VARCHAR(500)")
+                    print("       + Added training_history.images_url column")
+
+            migrations_applied.append('add_training_images_url')
+
+        # ============================================================
+        # Migration: add_training_status_checked_at
+        # ============================================================
+        if 'add_training_status_checked_at' in pending:
+            print("\n[13/13] Applying: add_training_status_checked_at")
+
+            if table_exists(cursor, 'training_history'):
+                columns = get_table_columns(cursor, 'training_history')
+
+                if 'status_checked_at' not in columns:
+                    cursor.execute("ALTER TABLE training_history ADD COLUMN status_checked_at DATETIME")
+                    print("       + Added training_history.status_checked_at column")
+
+            migrations_applied.append('add_training_status_checked_at')
+
+        # ============================================================
+        # Migration: add_training_log_chunks
+        # ============================================================
+        if 'add_training_log_chunks' in pending:
+            print("\n[14/14] Applying: add_training_log_chunks")
+
+            if not table_exists(cursor, 'training_log_chunk'):
+                cursor.execute("""
+                    CREATE TABLE training_log_chunk (
+                        id INTEGER NOT NULL PRIMARY KEY,
+                        training_history_id INTEGER NOT NULL REFERENCES training_history (id),
+                        start_line INTEGER NOT NULL,
+                        line_count INTEGER NOT NULL,
+                        text TEXT NOT NULL,
+                        created_at DATETIME,
+                        CONSTRAINT uq_training_log_chunk_start_line UNIQUE (training_history_id, start_line)
+                    )
+                """)
+                print("       + Created training_log_chunk table")
+
+            if table_exists(cursor, 'training_history'):
+                columns = get_table_columns(cursor, 'training_history')
+
+                if 'log_line_count' not in columns:
+                    cursor.execute("ALTER TABLE training_history ADD COLUMN log_line_count INTEGER NOT NULL DEFAULT 0")
+                    print("       + Added training_history.log_line_count column")
+
+            migrations_applied.append('add_training_log_chunks')
+
+        # ============================================================
+        # Migration: add_credit_reset_sweep
+        # ============================================================
+        if 'add_credit_reset_sweep' in pending:
+            print("\n[15/15] Applying: add_credit_reset_sweep")
+
+            if table_exists(cursor, 'user_subscriptions'):
+                columns = get_table_columns(cursor, 'user_subscriptions')
+
+                if 'next_reset_at' not in columns:
+                    cursor.execute("ALTER TABLE user_subscriptions ADD COLUMN next_reset_at DATETIME")
+                    print("       + Added user_subscriptions.next_reset_at column")
+                    print("       Filled in by the credit reset sweep on its first run")
+
+                if not index_exists(cursor, 'ix_user_subscriptions_next_reset_at'):
+                    cursor.execute("CREATE INDEX ix_user_subscriptions_next_reset_at ON user_subscriptions (next_reset_at)")
+                    print("       + Created user_subscriptions(next_reset_at) index")
+
+            if not table_exists(cursor, 'scheduler_locks'):
+                cursor.execute("""
+                    CREATE TABLE scheduler_locks (
+                        name VARCHAR(100) NOT NULL PRIMARY KEY,
+                        owner VARCHAR(100) NOT NULL,
+                        expires_at DATETIME NOT NULL
+                    )
+                """)
+                print("       + Created scheduler_locks table")
+
+            migrations_applied.append('add_credit_reset_sweep')
+
+        # ============================================================
+        # Migration: add_generation_jobs
+        # ============================================================
+        if 'add_generation_jobs' in pending:
+            print("\n[16/16] Applying: add_generation_jobs")
+
+            if not table_exists(cursor, 'generation_jobs'):
+                cursor.execute("""
+                    CREATE TABLE generation_jobs (
+                        id INTEGER NOT NULL PRIMARY KEY,
+                        job_id VARCHAR(32) NOT NULL,
+                        user_id INTEGER NOT NULL REFERENCES user (id),
+                        subscription_id INTEGER REFERENCES user_subscriptions (id),
+                        feature_type VARCHAR(50) NOT NULL,
+                        status VARCHAR(20) NOT NULL,
+                        request_id VARCHAR(100),
+                        arguments JSON,
+                        progress JSON,
+                        result JSON,
+                        error TEXT,
+                        error_type VARCHAR(50),
+                        credits_reserved FLOAT,
+                        created_at DATETIME,
+                        started_at DATETIME,
+                        heartbeat_at DATETIME,
+                        completed_at DATETIME
+                    )
+                """)
+                print("       + Created generation_jobs table")
+            elif 'heartbeat_at' not in get_table_columns(cursor, 'generation_jobs'):
+                cursor.execute("ALTER TABLE generation_jobs ADD COLUMN heartbeat_at DATETIME")
+                print("       + Added generation_jobs.heartbeat_at column")
+
+            if not index_exists(cursor, 'ix_generation_jobs_job_id'):
+                cursor.execute("CREATE UNIQUE INDEX ix_generation_jobs_job_id ON generation_jobs (job_id)")
+                print("       + Created generation_jobs(job_id) unique index")
+            if not index_exists(cursor, 'ix_generation_jobs_status'):
+                cursor.execute("CREATE INDEX ix_generation_jobs_status ON generation_jobs (status)")
+                print("       + Created generation_jobs(status) index")
+
+            migrations_applied.append('add_generation_jobs')
+
+        # ============================================================
+        # Migration: add_derivative_cache_entries
+        # ============================================================
+        if 'add_derivative_cache_entries' in pending:
+            print("\n[17/17] Applying: add_derivative_cache_entries")
+
+            cursor.execute("""
+                CREATE TABLE derivative_cache_entries (
+                    id INTEGER NOT NULL PRIMARY KEY,
+                    filename VARCHAR(255) NOT NULL UNIQUE,
+                    source_filename VARCHAR(255) NOT NULL,
+                    format VARCHAR(10) NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at DATETIME,
+                    last_accessed_at DATETIME
+                )
+            """)
+            print("       + Created derivative_cache_entries table")
+            cursor.execute("CREATE INDEX ix_derivative_cache_entries_source_filename ON derivative_cache_entries (source_filename)")
+            print("       + Created derivative_cache_entries(source_filename) index")
+            cursor.execute("CREATE INDEX ix_derivative_cache_entries_last_accessed_at ON derivative_cache_entries (last_accessed_at)")
+            print("       + Created derivative_cache_entries(last_accessed_at) index")
+
+            migrations_applied.append('add_derivative_cache_entries')
+
         # Update alembic version to latest
         if migrations_applied:
             latest_revision = migrations_applied[-1]
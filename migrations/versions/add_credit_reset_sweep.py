@@ -0,0 +1,35 @@
+"""Sweep credit resets from a precomputed next_reset_at under a leader lock
+
+Revision ID: add_credit_reset_sweep
+Revises: add_training_log_chunks
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_credit_reset_sweep'
+down_revision = 'add_training_log_chunks'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Filled in for existing subscriptions by the credit reset sweep
+    with op.batch_alter_table('user_subscriptions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('next_reset_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_user_subscriptions_next_reset_at', ['next_reset_at'], unique=False)
+
+    op.create_table(
+        'scheduler_locks',
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('owner', sa.String(length=100), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+def downgrade():
+    op.drop_table('scheduler_locks')
+    with op.batch_alter_table('user_subscriptions', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_subscriptions_next_reset_at')
+        batch_op.drop_column('next_reset_at')
@@ -0,0 +1,41 @@
+"""On-demand derivative cache index
+
+Revision ID: add_derivative_cache_entries
+Revises: add_generation_jobs
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_derivative_cache_entries'
+down_revision = 'add_generation_jobs'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    bind = op.get_bind()
+    if 'derivative_cache_entries' in sa.inspect(bind).get_table_names():
+        # Created earlier by db.create_all()
+        return
+
+    op.create_table(
+        'derivative_cache_entries',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=False),
+        sa.Column('source_filename', sa.String(length=255), nullable=False),
+        sa.Column('format', sa.String(length=10), nullable=False),
+        sa.Column('size_bytes', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('last_accessed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('filename')
+    )
+    op.create_index('ix_derivative_cache_entries_source_filename', 'derivative_cache_entries', ['source_filename'], unique=False)
+    op.create_index('ix_derivative_cache_entries_last_accessed_at', 'derivative_cache_entries', ['last_accessed_at'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_derivative_cache_entries_last_accessed_at', table_name='derivative_cache_entries')
+    op.drop_index('ix_derivative_cache_entries_source_filename', table_name='derivative_cache_entries')
+    op.drop_table('derivative_cache_entries')
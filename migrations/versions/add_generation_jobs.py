@@ -0,0 +1,54 @@
+"""Background generation jobs with a heartbeat
+
+Revision ID: add_generation_jobs
+Revises: add_credit_reset_sweep
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_generation_jobs'
+down_revision = 'add_credit_reset_sweep'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    bind = op.get_bind()
+    if 'generation_jobs' in sa.inspect(bind).get_table_names():
+        # Created earlier by db.create_all(), before jobs had a heartbeat
+        with op.batch_alter_table('generation_jobs', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+        return
+
+    op.create_table(
+        'generation_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_id', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('subscription_id', sa.Integer(), nullable=True),
+        sa.Column('feature_type', sa.String(length=50), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('request_id', sa.String(length=100), nullable=True),
+        sa.Column('arguments', sa.JSON(), nullable=True),
+        sa.Column('progress', sa.JSON(), nullable=True),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('error_type', sa.String(length=50), nullable=True),
+        sa.Column('credits_reserved', sa.Float(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.ForeignKeyConstraint(['subscription_id'], ['user_subscriptions.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_generation_jobs_job_id', 'generation_jobs', ['job_id'], unique=True)
+    op.create_index('ix_generation_jobs_status', 'generation_jobs', ['status'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_generation_jobs_status', table_name='generation_jobs')
+    op.drop_index('ix_generation_jobs_job_id', table_name='generation_jobs')
+    op.drop_table('generation_jobs')
@@ -0,0 +1,22 @@
+"""Index image filenames (content-addressed storage keys)
+
+Revision ID: add_image_filename_index
+Revises: add_image_placeholders
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_image_filename_index'
+down_revision = 'add_image_placeholders'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Deleting an image checks whether another row still shares its stored file
+    op.create_index('ix_image_filename', 'image', ['filename'])
+
+def downgrade():
+    op.drop_index('ix_image_filename', table_name='image')
@@ -0,0 +1,22 @@
+"""Add composite index for keyset gallery pagination
+
+Revision ID: add_image_gallery_index
+Revises: rename_banners_to_explainers
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_image_gallery_index'
+down_revision = 'rename_banners_to_explainers'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Lets /api/gallery/images seek straight to a cursor instead of OFFSET scanning
+    op.create_index('ix_image_user_created_id', 'image', ['user_id', 'created_at', 'id'])
+
+def downgrade():
+    op.drop_index('ix_image_user_created_id', table_name='image')
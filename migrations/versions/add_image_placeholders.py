@@ -0,0 +1,24 @@
+"""Add inline placeholders to images
+
+Revision ID: add_image_placeholders
+Revises: add_image_thumbnails
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_image_placeholders'
+down_revision = 'add_image_thumbnails'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Existing rows are filled in by backfill_previews.py
+    with op.batch_alter_table('image', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('placeholder', sa.Text(), nullable=True))
+
+def downgrade():
+    with op.batch_alter_table('image', schema=None) as batch_op:
+        batch_op.drop_column('placeholder')
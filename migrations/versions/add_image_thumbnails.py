@@ -0,0 +1,24 @@
+"""Add gallery thumbnails to images
+
+Revision ID: add_image_thumbnails
+Revises: add_image_gallery_index
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_image_thumbnails'
+down_revision = 'add_image_gallery_index'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Existing rows are filled in by backfill_previews.py
+    with op.batch_alter_table('image', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('thumbnail_filename', sa.String(length=255), nullable=True))
+
+def downgrade():
+    with op.batch_alter_table('image', schema=None) as batch_op:
+        batch_op.drop_column('thumbnail_filename')
@@ -0,0 +1,23 @@
+"""Store the uploaded dataset URL on training history
+
+Revision ID: add_training_images_url
+Revises: add_image_filename_index
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_training_images_url'
+down_revision = 'add_image_filename_index'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('training_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('images_url', sa.String(length=500), nullable=True))
+
+def downgrade():
+    with op.batch_alter_table('training_history', schema=None) as batch_op:
+        batch_op.drop_column('images_url')
@@ -0,0 +1,38 @@
+"""Store training logs as append-only chunks
+
+Revision ID: add_training_log_chunks
+Revises: add_training_status_checked_at
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_training_log_chunks'
+down_revision = 'add_training_status_checked_at'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'training_log_chunk',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('training_history_id', sa.Integer(), nullable=False),
+        sa.Column('start_line', sa.Integer(), nullable=False),
+        sa.Column('line_count', sa.Integer(), nullable=False),
+        sa.Column('text', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['training_history_id'], ['training_history.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('training_history_id', 'start_line', name='uq_training_log_chunk_start_line')
+    )
+    # Existing logs stay in training_history.logs until the training next logs a line,
+    # which moves them into chunk 0 (TrainingHistory._chunk_legacy_logs)
+    with op.batch_alter_table('training_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('log_line_count', sa.Integer(), nullable=False, server_default='0'))
+
+def downgrade():
+    with op.batch_alter_table('training_history', schema=None) as batch_op:
+        batch_op.drop_column('log_line_count')
+    op.drop_table('training_log_chunk')
@@ -0,0 +1,23 @@
+"""Record when a training's status was last fetched from FAL
+
+Revision ID: add_training_status_checked_at
+Revises: add_training_images_url
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'add_training_status_checked_at'
+down_revision = 'add_training_images_url'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('training_history', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status_checked_at', sa.DateTime(), nullable=True))
+
+def downgrade():
+    with op.batch_alter_table('training_history', schema=None) as batch_op:
+        batch_op.drop_column('status_checked_at')
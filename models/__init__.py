@@ -4,11 +4,12 @@ from extensions import db
 # Import all models to make them available when importing from models package
 from .api import APIProvider, AIModel
 from .auth import User, PasswordResetOTP, AuthSettings
-from .content import Image, TrainingHistory
+from .content import Image, TrainingHistory, TrainingLogChunk, DerivativeCacheEntry
 from .email import EmailSettings
-from .system import SystemSettings
+from .system import SystemSettings, SchedulerLock
 from .subscription import SubscriptionPlanModel, UserSubscription, UsageHistory, SubscriptionPlan
 from .api_settings import APISettings
+from .jobs import GenerationJob
 
 # For backwards compatibility and ease of use, export all models at package level
 __all__ = [
@@ -19,12 +20,16 @@ __all__ = [
     'AuthSettings',
     'Image',
     'TrainingHistory',
+    'TrainingLogChunk',
+    'DerivativeCacheEntry',
     'EmailSettings',
     'SystemSettings',
+    'SchedulerLock',
     'SubscriptionPlanModel',
     'UserSubscription',
     'UsageHistory',
     'SubscriptionPlan',
     'APISettings',
+    'GenerationJob',
     'db'
 ]
@@ -1,10 +1,63 @@
 from extensions import db
 from datetime import datetime
 from cryptography.fernet import Fernet
+from .settings_cache import settings_registry
 import os
 import base64
 
-class APISettings(db.Model):
+# Provider name -> encrypted key column
+PROVIDER_KEY_COLUMNS = {
+    'OpenAI': 'openai_api_key',
+    'Anthropic': 'anthropic_api_key',
+    'Google Gemini': 'gemini_api_key',
+    'Groq': 'groq_api_key',
+    'xAI': 'xai_api_key',
+    'Cerebras': 'cerebras_api_key',
+    'OpenRouter': 'openrouter_api_key'
+}
+
+# Fernet objects by encryption key, so the key is only decoded once per process
+_ciphers = {}
+
+
+class APIKeyLookup:
+    """
+    Key checks shared by APISettings and its cached snapshot.
+
+    Subclasses implement _get_key. A plain mixin rather than an abc.ABC:
+    ABCMeta can't be combined with db.Model's metaclass.
+    """
+
+    def _get_key(self, column):
+        """Decrypted key stored in an encrypted key column (e.g. 'fal_key'), or None"""
+        raise NotImplementedError
+
+    def get_provider_key(self, provider_name):
+        """Get API key for specific provider"""
+        column = PROVIDER_KEY_COLUMNS.get(provider_name)
+        return self._get_key(column) if column else None
+
+    def has_required_keys(self):
+        """Check if system has the minimum required API keys"""
+        return bool(self._get_key('fal_key') and any(
+            self._get_key(column) for column in PROVIDER_KEY_COLUMNS.values()
+        ))
+
+    def get_available_providers(self):
+        """Get list of providers with configured API keys"""
+        from .api import APIProvider
+
+        available = []
+        providers = APIProvider.query.filter_by(is_active=True).all()
+
+        for provider in providers:
+            if self.get_provider_key(provider.name):
+                available.append(provider)
+
+        return available
+
+
+class APISettings(db.Model, APIKeyLookup):
     """Centralized API key management - Admin only"""
     __tablename__ = 'api_settings'
 
@@ -39,8 +92,11 @@ class APISettings(db.Model):
 
     def _get_cipher(self):
         """Get encryption cipher"""
-        key = base64.urlsafe_b64decode(self.encryption_key.encode())
-        return Fernet(key)
+        cipher = _ciphers.get(self.encryption_key)
+        if cipher is None:
+            key = base64.urlsafe_b64decode(self.encryption_key.encode())
+            cipher = _ciphers[self.encryption_key] = Fernet(key)
+        return cipher
 
     def _encrypt_key(self, api_key):
         """Encrypt API key"""
@@ -59,6 +115,9 @@ class APISettings(db.Model):
         except:
             return None
 
+    def _get_key(self, column):
+        return self._decrypt_key(getattr(self, column))
+
     # OpenAI
     def set_openai_key(self, api_key):
         """Set encrypted OpenAI API key"""
@@ -144,44 +203,6 @@ class APISettings(db.Model):
             'fal_key': self.get_fal_key()
         }
 
-    def get_provider_key(self, provider_name):
-        """Get API key for specific provider"""
-        keys_map = {
-            'OpenAI': self.get_openai_key(),
-            'Anthropic': self.get_anthropic_key(),
-            'Google Gemini': self.get_gemini_key(),
-            'Groq': self.get_groq_key(),
-            'xAI': self.get_xai_key(),
-            'Cerebras': self.get_cerebras_key(),
-            'OpenRouter': self.get_openrouter_key()
-        }
-        return keys_map.get(provider_name)
-
-    def has_required_keys(self):
-        """Check if system has the minimum required API keys"""
-        return bool(self.get_fal_key() and (
-            self.get_openai_key() or
-            self.get_anthropic_key() or
-            self.get_gemini_key() or
-            self.get_groq_key() or
-            self.get_xai_key() or
-            self.get_cerebras_key() or
-            self.get_openrouter_key()
-        ))
-
-    def get_available_providers(self):
-        """Get list of providers with configured API keys"""
-        from .api import APIProvider
-
-        available = []
-        providers = APIProvider.query.filter_by(is_active=True).all()
-
-        for provider in providers:
-            if self.get_provider_key(provider.name):
-                available.append(provider)
-
-        return available
-
     @staticmethod
     def get_settings():
         """Get or create API settings singleton"""
@@ -191,3 +212,37 @@ class APISettings(db.Model):
             db.session.add(settings)
             db.session.commit()
         return settings
+
+    @staticmethod
+    def get_cached():
+        """
+        Get a read-only snapshot of the settings with keys already decrypted.
+
+        Use this on request hot paths; use get_settings() to modify settings.
+        """
+        return settings_registry.get('api')
+
+    @staticmethod
+    def invalidate_cache():
+        """Refresh cached settings in every worker; call after committing a change"""
+        settings_registry.invalidate()
+
+
+class APISettingsSnapshot(APIKeyLookup):
+    """Decrypted API keys and defaults from one version of APISettings"""
+
+    def __init__(self, settings):
+        self.id = settings.id
+        self.updated_at = settings.updated_at
+        self.default_provider_id = settings.default_provider_id
+        self.default_model_id = settings.default_model_id
+        self._keys = settings.get_all_keys()
+
+    def _get_key(self, column):
+        return self._keys.get(column)
+
+    def get_fal_key(self):
+        return self._keys.get('fal_key')
+
+
+settings_registry.register('api', APISettings, APISettingsSnapshot)
@@ -1,8 +1,11 @@
 from extensions import db
+from flask import g, has_request_context
 from flask_login import UserMixin
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
 import random
 from .api import APIProvider  # Add this import
+from .settings_cache import settings_registry
 
 class AuthSettings(db.Model):
     __tablename__ = 'auth_settings'
@@ -28,6 +31,18 @@ class AuthSettings(db.Model):
             db.session.commit()
         return settings
 
+    @staticmethod
+    def get_cached():
+        """Get a read-only snapshot of the settings; use get_settings() to modify them"""
+        return settings_registry.get('auth')
+
+    @staticmethod
+    def invalidate_cache():
+        """Refresh cached settings in every worker; call after committing a change"""
+        settings_registry.invalidate()
+
+settings_registry.register('auth', AuthSettings)
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -100,12 +115,56 @@ class User(UserMixin, db.Model):
         return self.role == 'superadmin'
     
     def get_subscription(self):
-        """Get active subscription for user"""
+        """Get active subscription for user, memoized for the current request"""
         from .subscription import UserSubscription
-        return UserSubscription.query.filter_by(
+        subscriptions = User._request_subscriptions()
+        if subscriptions is not None and self.id in subscriptions:
+            return subscriptions[self.id]
+
+        sub = UserSubscription.query.options(
+            joinedload(UserSubscription.plan)
+        ).filter_by(
             user_id=self.id, 
             is_active=True
         ).first()
+        if subscriptions is not None:
+            subscriptions[self.id] = sub
+        return sub
+
+    @staticmethod
+    def _request_subscriptions():
+        """Per-request map of user id -> active subscription, or None outside requests"""
+        if not has_request_context():
+            return None
+        if '_subscriptions' not in g:
+            g._subscriptions = {}
+        return g._subscriptions
+
+    @staticmethod
+    def forget_subscription(user_id):
+        """Drop a memoized subscription; call after changing which one is active or its credits"""
+        subscriptions = User._request_subscriptions()
+        if subscriptions is not None:
+            subscriptions.pop(user_id, None)
+
+    @staticmethod
+    def load_with_subscription(user_id):
+        """Load a user together with their active subscription and plan in one query"""
+        from .subscription import UserSubscription
+        row = db.session.query(User, UserSubscription).outerjoin(
+            UserSubscription,
+            db.and_(UserSubscription.user_id == User.id, UserSubscription.is_active == True)
+        ).options(
+            joinedload(UserSubscription.plan)
+        ).filter(User.id == user_id).first()
+        if row is None:
+            return None
+
+        user, sub = row
+        subscriptions = User._request_subscriptions()
+        if subscriptions is not None:
+            subscriptions[user.id] = sub
+        return user
     
     def get_subscription_plan(self):
         """Get user's subscription plan name"""
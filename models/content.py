@@ -1,11 +1,11 @@
 from extensions import db
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 from PIL import Image as PILImage
 
 class Image(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    filename = db.Column(db.String(255), nullable=False)
+    filename = db.Column(db.String(255), nullable=False, index=True)  # Storage key of the primary
     prompt = db.Column(db.Text, nullable=False)
     art_style = db.Column(db.String(100))
     width = db.Column(db.Integer)
@@ -14,6 +14,13 @@ class Image(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     provider_id = db.Column(db.Integer, db.ForeignKey('api_provider.id'))
     model_id = db.Column(db.Integer, db.ForeignKey('ai_model.id'))
+    thumbnail_filename = db.Column(db.String(255))  # Storage key of the WebP gallery thumbnail
+    placeholder = db.Column(db.Text)  # Tiny WebP data URL painted while the thumbnail loads
+
+    __table_args__ = (
+        # Serves the newest-first gallery pages (scanned backwards) by keyset
+        db.Index('ix_image_user_created_id', 'user_id', 'created_at', 'id'),
+    )
 
     @property
     def dimensions(self):
@@ -25,9 +32,9 @@ class Image(db.Model):
     def get_dimensions(self):
         """Get image dimensions from file if not stored in database"""
         if not self.width or not self.height:
+            from services.storage import image_storage
             try:
-                filepath = os.path.join('static', 'images', self.filename)
-                with PILImage.open(filepath) as img:
+                with image_storage.local_copy(self.filename) as filepath, PILImage.open(filepath) as img:
                     self.width, self.height = img.size
                     db.session.commit()
             except Exception as e:
@@ -36,7 +43,9 @@ class Image(db.Model):
 
     @property
     def file_path(self):
-        return os.path.join('static', 'images', self.filename)
+        """Local path of the primary, or None when storage is remote"""
+        from services.storage import image_storage
+        return image_storage.local_path(self.filename)
     
     @property
     def file_extension(self):
@@ -45,20 +54,46 @@ class Image(db.Model):
 
     def get_url(self, format=None):
         """Get URL for the image. If format is None, use the actual file format"""
-        if format is None:
+        from services.storage import image_storage
+        if format is None or self.file_extension in DerivativeCacheEntry.FORMAT_EXTENSIONS.get(format, ()):
             # Return the actual file URL
-            return f'/static/images/{self.filename}'
-        else:
-            # Check if the requested format file exists
-            base_filename = os.path.splitext(self.filename)[0]
-            requested_path = os.path.join('static', 'images', f'{base_filename}.{format}')
-            
-            # If the requested format exists, return it
-            if os.path.exists(os.path.join(os.path.dirname(__file__), '..', requested_path)):
-                return f'/static/images/{base_filename}.{format}'
-            else:
-                # Otherwise, return the original file
-                return f'/static/images/{self.filename}'
+            return image_storage.url(self.filename)
+
+        # Serve a cached derivative directly; otherwise the download route encodes it on demand
+        entry = DerivativeCacheEntry.query.filter_by(source_filename=self.filename, format=format).first()
+        if entry:
+            return entry.url
+        return f'/download/{self.filename}/{format}'
+
+    def get_thumbnail_url(self):
+        """Get URL for the gallery thumbnail, falling back to the full image"""
+        if self.thumbnail_filename:
+            from services.storage import image_storage
+            return image_storage.url(self.thumbnail_filename)
+        return self.get_url()
+
+class DerivativeCacheEntry(db.Model):
+    """Index of format derivatives in the bounded on-demand cache (static/derivatives)"""
+    __tablename__ = 'derivative_cache_entries'
+
+    # Requested format -> file extensions that already satisfy it
+    FORMAT_EXTENSIONS = {
+        'png': ('png',),
+        'webp': ('webp',),
+        'jpeg': ('jpeg', 'jpg')
+    }
+
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), unique=True, nullable=False)  # File in the cache directory
+    source_filename = db.Column(db.String(255), nullable=False, index=True)  # Image.filename it was encoded from
+    format = db.Column(db.String(10), nullable=False)
+    size_bytes = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    @property
+    def url(self):
+        return f'/static/derivatives/{self.filename}'
 
 class TrainingHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -67,24 +102,124 @@ class TrainingHistory(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     trigger_word = db.Column(db.String(100), nullable=False)
     status = db.Column(db.String(20), default='pending')  # pending, in_progress, completed, failed
-    logs = db.Column(db.Text)
+    logs = db.Column(db.Text)  # Log from before TrainingLogChunk; moved into chunk 0 on the next append
+    log_line_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Lines in log chunks
     result = db.Column(db.JSON)
     config_url = db.Column(db.String(500))
     weights_url = db.Column(db.String(500))
     webhook_secret = db.Column(db.String(48))  # For webhook verification
+    images_url = db.Column(db.String(500))  # Training dataset ZIP in FAL storage
+    status_checked_at = db.Column(db.DateTime)  # Last status update from FAL (poll or webhook)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
 
+    def claim_status_refresh(self, interval_seconds):
+        """
+        Atomically take the right to ask FAL for this training's status.
+
+        False if another poll (in any worker) or a webhook updated it in
+        the last interval_seconds; its result is already on the row.
+        """
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=interval_seconds)
+        if self.status_checked_at and self.status_checked_at >= stale_before:
+            # Recent according to the row as loaded; no need to contend for it
+            return False
+
+        claimed = TrainingHistory.query.filter(
+            TrainingHistory.id == self.id,
+            db.or_(
+                TrainingHistory.status_checked_at.is_(None),
+                TrainingHistory.status_checked_at < stale_before
+            )
+        ).update({'status_checked_at': now}, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+
+    def record_logs(self, lines):
+        """
+        Store the lines of a full FAL log past those already stored.
+
+        FAL reports the whole log on every status check and webhook; only
+        the new tail becomes a chunk. Returns the new lines. Committed by
+        the caller; a concurrent update storing the same tail fails on the
+        chunk's unique start line.
+        """
+        self._chunk_legacy_logs()
+        new_lines = lines[self.log_line_count:]
+        if new_lines:
+            self.append_log_lines(new_lines)
+        return new_lines
+
+    def append_log_lines(self, lines):
+        """Append lines of our own (e.g. an error) after the stored log"""
+        self._chunk_legacy_logs()
+        db.session.add(TrainingLogChunk(
+            training_history_id=self.id,
+            start_line=self.log_line_count,
+            line_count=len(lines),
+            text='\n'.join(lines)
+        ))
+        self.log_line_count += len(lines)
+
+    def _chunk_legacy_logs(self):
+        """Move a log from before chunks existed into chunk 0, so appended lines number after it"""
+        if not self.logs or self.log_line_count:
+            return
+        lines = self.logs.split('\n')
+        db.session.add(TrainingLogChunk(
+            training_history_id=self.id,
+            start_line=0,
+            line_count=len(lines),
+            text=self.logs
+        ))
+        self.log_line_count = len(lines)
+        self.logs = None
+
+    def log_lines_since(self, offset=0):
+        """Log lines from line number offset on"""
+        # A log from before chunks existed comes first; rows appended to
+        # since then have it in chunk 0 instead
+        legacy = self.logs.split('\n') if self.logs else []
+        lines = legacy[offset:]
+        if not self.log_line_count:
+            return lines
+
+        offset = max(0, offset - len(legacy))
+        chunks = TrainingLogChunk.query.filter(
+            TrainingLogChunk.training_history_id == self.id,
+            TrainingLogChunk.start_line + TrainingLogChunk.line_count > offset
+        ).order_by(TrainingLogChunk.start_line).all()
+        for chunk in chunks:
+            lines.extend(chunk.text.split('\n')[max(0, offset - chunk.start_line):])
+        return lines
+
     def to_dict(self):
         return {
             'training_id': self.training_id,
             'queue_id': self.queue_id,
             'trigger_word': self.trigger_word,
             'status': self.status,
-            'logs': self.logs,
+            'logs': '\n'.join(self.log_lines_since(0)),
             'config_url': self.config_url,
             'weights_url': self.weights_url,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None,
             'result': self.result
         }
+
+class TrainingLogChunk(db.Model):
+    """Lines appended to a training's log by one status update"""
+    __tablename__ = 'training_log_chunk'
+
+    id = db.Column(db.Integer, primary_key=True)
+    training_history_id = db.Column(db.Integer, db.ForeignKey('training_history.id'), nullable=False)
+    start_line = db.Column(db.Integer, nullable=False)  # Line number of the first line
+    line_count = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.Text, nullable=False)  # Newline-joined lines
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Serves reads from an offset; two writers can't store the same lines twice
+        db.UniqueConstraint('training_history_id', 'start_line', name='uq_training_log_chunk_start_line'),
+    )
@@ -0,0 +1,51 @@
+from extensions import db
+from datetime import datetime
+import os
+
+class GenerationJob(db.Model):
+    """Background generation request tracked from enqueue to completion"""
+    __tablename__ = 'generation_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(32), unique=True, nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    subscription_id = db.Column(db.Integer, db.ForeignKey('user_subscriptions.id'))
+    feature_type = db.Column(db.String(50), nullable=False, default='images')
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, completed, failed
+    request_id = db.Column(db.String(100))  # FAL queue request ID
+    arguments = db.Column(db.JSON)
+    progress = db.Column(db.JSON)  # queue_position, percent, log_count and recent log lines
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    error_type = db.Column(db.String(50))
+    credits_reserved = db.Column(db.Float, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime, default=datetime.utcnow)  # Last sign of life from the process holding the job
+    completed_at = db.Column(db.DateTime)
+
+    user = db.relationship('User', backref=db.backref('generation_jobs', lazy='dynamic'))
+
+    @staticmethod
+    def generate_job_id():
+        """Generate a unique public identifier for a job"""
+        return os.urandom(16).hex()
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'feature_type': self.feature_type,
+            'status': self.status,
+            'progress': self.progress,
+            'result': self.result,
+            'error': self.error,
+            'error_type': self.error_type,
+            'credits_reserved': self.credits_reserved,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
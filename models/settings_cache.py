@@ -0,0 +1,116 @@
+"""
+Process-wide cache of the settings singletons
+
+SystemSettings, APISettings and AuthSettings are single rows that nearly
+every request reads. The registry loads all of them once per process and
+serves read-only snapshots from memory.
+
+After committing a change, writers call invalidate(), which bumps a
+version stamp file in the instance folder. Readers compare the stamp's
+inode and mtime (a single stat(), at most once per request) to notice
+changes made by another gunicorn worker. A stale stamp reloads every row,
+but a snapshot is only rebuilt when its row's updated_at moved.
+"""
+
+import os
+import uuid
+import threading
+import time
+from flask import g, has_request_context
+
+STAMP_DIR = os.getenv(
+    'SETTINGS_STAMP_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance')
+)
+
+
+def _stamp_path(name):
+    return os.path.join(STAMP_DIR, f'{name}.version')
+
+
+def current_version(name):
+    """Current stamp for a settings name, or None if it was never bumped"""
+    try:
+        stat = os.stat(_stamp_path(name))
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns)
+
+
+def bump_version(name):
+    """Mark a settings name as changed for every worker"""
+    os.makedirs(STAMP_DIR, exist_ok=True)
+    path = _stamp_path(name)
+    # Replacing the file gives it a new inode, so even same-tick bumps are seen
+    temp_path = f'{path}.{uuid.uuid4().hex}'
+    with open(temp_path, 'w') as f:
+        f.write(uuid.uuid4().hex)
+    os.replace(temp_path, path)
+
+
+class SettingsSnapshot:
+    """Read-only copy of a settings row's column values"""
+
+    def __init__(self, row):
+        for column in row.__table__.columns:
+            setattr(self, column.key, getattr(row, column.key))
+
+
+class SettingsRegistry:
+    VERSION_NAME = 'settings'
+    # Also reload this often, to pick up writes that skipped invalidate()
+    RECHECK_INTERVAL = 60  # seconds
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+        self._snapshots = {}
+        self._version = None
+        self._loaded_at = 0
+
+    def register(self, name, model, snapshot_class=SettingsSnapshot):
+        """Register a singleton model; model.get_settings() must return its row"""
+        self._models[name] = (model, snapshot_class)
+
+    def get(self, name):
+        """Get the snapshot of a registered settings singleton"""
+        snapshots = self._snapshots
+        if not snapshots or not self._is_current():
+            snapshots = self.reload()
+        return snapshots[name]
+
+    def _is_current(self):
+        if has_request_context() and g.get('_settings_checked'):
+            return True
+        current = (current_version(self.VERSION_NAME) == self._version and
+                   time.monotonic() - self._loaded_at < self.RECHECK_INTERVAL)
+        if current and has_request_context():
+            g._settings_checked = True
+        return current
+
+    def reload(self):
+        """Re-read every settings row, rebuilding snapshots whose row changed"""
+        with self._lock:
+            # Read the stamp first so a bump during the reload triggers another one
+            version = current_version(self.VERSION_NAME)
+            snapshots = {}
+            for name, (model, snapshot_class) in self._models.items():
+                row = model.get_settings()
+                snapshot = self._snapshots.get(name)
+                if snapshot is None or snapshot.id != row.id or snapshot.updated_at != row.updated_at:
+                    snapshot = snapshot_class(row)
+                snapshots[name] = snapshot
+            self._snapshots = snapshots
+            self._version = version
+            self._loaded_at = time.monotonic()
+            return snapshots
+
+    def invalidate(self):
+        """Make every worker reload the settings; call after committing a change"""
+        if has_request_context():
+            g.pop('_settings_checked', None)
+        bump_version(self.VERSION_NAME)
+
+
+# Global registry instance
+settings_registry = SettingsRegistry()
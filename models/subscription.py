@@ -1,7 +1,7 @@
 from extensions import db
 from datetime import datetime, timedelta
 from enum import Enum
-from sqlalchemy import CheckConstraint
+from sqlalchemy import CheckConstraint, update
 from contextlib import contextmanager
 
 class SubscriptionPlan(Enum):
@@ -112,6 +112,11 @@ class SubscriptionPlanModel(db.Model):
         
         db.session.commit()
 
+def _first_reset_at(context):
+    """Default next_reset_at of a new subscription: one month after it starts"""
+    start = context.get_current_parameters().get('subscription_start')
+    return UserSubscription.anniversary_after(start, start) if start else None
+
 class UserSubscription(db.Model):
     __tablename__ = 'user_subscriptions'
     __table_args__ = (
@@ -126,6 +131,7 @@ class UserSubscription(db.Model):
     subscription_start = db.Column(db.DateTime, default=datetime.utcnow)
     subscription_end = db.Column(db.DateTime)  # NULL for active subscriptions
     last_credit_reset = db.Column(db.DateTime, default=datetime.utcnow)
+    next_reset_at = db.Column(db.DateTime, default=_first_reset_at, index=True)  # Next monthly anniversary, swept by the scheduler
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -138,48 +144,49 @@ class UserSubscription(db.Model):
     notes = db.Column(db.Text)  # Admin notes
     
     def should_reset_credits(self):
-        """Check if monthly credits should be reset based on subscription start date"""
+        """Check if monthly credits are due for a reset (next_reset_at has passed)"""
         if not self.subscription_start:
             return True
-        
-        now = datetime.utcnow()
-        
-        # Calculate next reset date based on subscription start date
-        # Reset happens monthly on the same day the subscription started
-        next_reset_date = self.get_next_reset_date()
-        
-        return now >= next_reset_date
+
+        if self.next_reset_at is None:
+            # Not filled in by the reset sweep yet; the first anniversary after the last reset is due
+            self.next_reset_at = UserSubscription.anniversary_after(
+                self.subscription_start, self.last_credit_reset or self.subscription_start
+            )
+
+        return datetime.utcnow() >= self.next_reset_at
     
     def get_next_reset_date(self):
         """Get the next credit reset date based on subscription start date"""
+        if self.next_reset_at:
+            return self.next_reset_at
         if not self.subscription_start:
             return datetime.utcnow()
-        
-        now = datetime.utcnow()
-        start_date = self.subscription_start
-        
-        # Calculate how many months have passed since subscription started
-        months_passed = (now.year - start_date.year) * 12 + (now.month - start_date.month)
-        
-        # Calculate next reset date (same day next month)
-        if now.day >= start_date.day and now.hour >= start_date.hour:
-            months_passed += 1
-        
-        # Add months to the start date to get next reset
-        next_reset_year = start_date.year + (start_date.month + months_passed - 1) // 12
-        next_reset_month = ((start_date.month + months_passed - 1) % 12) + 1
-        
-        try:
-            next_reset_date = start_date.replace(year=next_reset_year, month=next_reset_month)
-        except ValueError:
-            # Handle edge case for end-of-month dates (e.g., Jan 31 -> Feb 28)
-            import calendar
-            last_day = calendar.monthrange(next_reset_year, next_reset_month)[1]
-            day = min(start_date.day, last_day)
-            next_reset_date = start_date.replace(year=next_reset_year, month=next_reset_month, day=day)
-        
-        return next_reset_date
+        return UserSubscription.anniversary_after(self.subscription_start, datetime.utcnow())
+
+    @staticmethod
+    def resets_due_before(moment):
+        """Query of active subscriptions whose credits reset by moment (served by the next_reset_at index)"""
+        return UserSubscription.query.filter(
+            UserSubscription.is_active == True,
+            UserSubscription.next_reset_at <= moment
+        )
     
+    @staticmethod
+    def anniversary_after(start_date, moment):
+        """First monthly anniversary of start_date strictly after moment"""
+        import calendar
+        months_passed = max((moment.year - start_date.year) * 12 + (moment.month - start_date.month), 1)
+        while True:
+            year = start_date.year + (start_date.month + months_passed - 1) // 12
+            month = ((start_date.month + months_passed - 1) % 12) + 1
+            # End-of-month start dates fall on the last day of shorter months (e.g., Jan 31 -> Feb 28)
+            day = min(start_date.day, calendar.monthrange(year, month)[1])
+            anniversary = start_date.replace(year=year, month=month, day=day)
+            if anniversary > moment:
+                return anniversary
+            months_passed += 1
+
     def days_until_reset(self):
         """Get days until next credit reset"""
         next_reset = self.get_next_reset_date()
@@ -192,12 +199,14 @@ class UserSubscription(db.Model):
         self.credits_remaining = self.plan.monthly_credits
         self.credits_used_this_month = 0
         self.last_credit_reset = datetime.utcnow()
+        if self.subscription_start:
+            self.next_reset_at = UserSubscription.anniversary_after(self.subscription_start, self.last_credit_reset)
         db.session.commit()
     
     def get_credit_cost(self, feature_type):
         """Get the credit cost for a specific feature from system settings"""
         from .system import SystemSettings
-        system_settings = SystemSettings.get_settings()
+        system_settings = SystemSettings.get_cached()
         return system_settings.get_credit_cost(feature_type)
     
     def can_use_feature(self, feature_type, amount=1):
@@ -206,79 +215,100 @@ class UserSubscription(db.Model):
         total_cost = cost_per_use * amount
         return self.credits_remaining >= total_cost
 
-    @contextmanager
-    def reserve_credits(self, feature_type, amount=1):
+    def deduct_credits(self, feature_type, amount=1):
         """
-        Context manager to atomically reserve credits before an operation.
-        Credits are deducted immediately with row-level locking.
-        If the operation fails, credits are automatically refunded.
+        Atomically deduct credits for a feature and commit immediately.
+        Returns the total cost deducted. Raises ValueError if credits are insufficient
+        or amount is not positive.
 
-        Usage:
-            with user.get_subscription().reserve_credits('images', 1) as cost:
-                # Perform expensive operation here
-                result = call_external_api()
-                # If this block completes successfully, credits stay deducted
-                # If an exception occurs, credits are automatically refunded
+        Use this (paired with refund_credits) when the operation outlives the request,
+        e.g. background generation jobs. Otherwise prefer reserve_credits().
         """
-        from sqlalchemy.exc import IntegrityError
+        if amount <= 0:
+            # A negative deduction would add credits the later refund then adds again
+            raise ValueError(f"Credit amount must be positive, got {amount}")
 
         cost_per_use = self.get_credit_cost(feature_type)
         total_cost = cost_per_use * amount
 
-        # Start a nested transaction with pessimistic locking
-        # This prevents concurrent requests from reading the same credit balance
         try:
-            # Lock this row for update (prevents other transactions from reading/modifying)
-            locked_subscription = db.session.query(UserSubscription).with_for_update().filter_by(
-                id=self.id
-            ).first()
-
-            if not locked_subscription:
-                raise ValueError("Subscription not found")
+            # The balance check and the deduction are one conditional UPDATE, so
+            # concurrent workers can never overdraw, on SQLite as well as PostgreSQL
+            result = db.session.execute(
+                update(UserSubscription)
+                .where(
+                    UserSubscription.id == self.id,
+                    UserSubscription.credits_remaining >= total_cost
+                )
+                .values(
+                    credits_remaining=UserSubscription.credits_remaining - total_cost,
+                    credits_used_this_month=UserSubscription.credits_used_this_month + total_cost
+                )
+                .execution_options(synchronize_session=False)
+            )
 
-            # Re-check credits under lock
-            if locked_subscription.credits_remaining < total_cost:
-                raise ValueError(f"Insufficient credits. Required: {total_cost}, Available: {locked_subscription.credits_remaining}")
+            if result.rowcount == 0:
+                db.session.rollback()
+                raise ValueError(f"Insufficient credits. Required: {total_cost}, Available: {self.credits_remaining}")
 
-            # Deduct credits BEFORE the operation
-            locked_subscription.credits_remaining -= total_cost
-            locked_subscription.credits_used_this_month += total_cost
-
-            # Commit the credit deduction immediately
+            # Commit the credit deduction immediately; the commit expires this
+            # instance, so its balance is re-read on next access
+            self._forget_memoized()
             db.session.commit()
+            return total_cost
 
-            # Refresh local instance to reflect the changes
-            db.session.refresh(self)
+        except ValueError:
+            raise
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def refund_credits(self, total_cost):
+        """Return previously deducted credits (compensates deduct_credits)"""
+        db.session.execute(
+            update(UserSubscription)
+            .where(UserSubscription.id == self.id)
+            .values(
+                credits_remaining=UserSubscription.credits_remaining + total_cost,
+                credits_used_this_month=UserSubscription.credits_used_this_month - total_cost
+            )
+            .execution_options(synchronize_session=False)
+        )
+        self._forget_memoized()
+        db.session.commit()
 
-            try:
-                # Yield control to the calling code to perform the operation
-                yield total_cost
+    def _forget_memoized(self):
+        """Make the owner's next get_subscription() in this request re-read the row"""
+        from .auth import User
+        User.forget_subscription(self.user_id)
 
-                # If we get here, operation was successful
-                # Credits remain deducted
+    @contextmanager
+    def reserve_credits(self, feature_type, amount=1):
+        """
+        Context manager to atomically reserve credits before an operation.
+        Credits are deducted immediately with a single conditional UPDATE.
+        If the operation fails, credits are automatically refunded.
 
-            except Exception as e:
-                # Operation failed - refund the credits
-                refund_subscription = db.session.query(UserSubscription).with_for_update().filter_by(
-                    id=self.id
-                ).first()
+        Usage:
+            with user.get_subscription().reserve_credits('images', 1) as cost:
+                # Perform expensive operation here
+                result = call_external_api()
+                # If this block completes successfully, credits stay deducted
+                # If an exception occurs, credits are automatically refunded
+        """
+        total_cost = self.deduct_credits(feature_type, amount)
 
-                if refund_subscription:
-                    refund_subscription.credits_remaining += total_cost
-                    refund_subscription.credits_used_this_month -= total_cost
-                    db.session.commit()
-                    db.session.refresh(self)
+        try:
+            # Yield control to the calling code to perform the operation
+            yield total_cost
 
-                # Re-raise the exception
-                raise e
+            # If we get here, operation was successful
+            # Credits remain deducted
 
-        except IntegrityError as e:
-            db.session.rollback()
-            if 'check_credits_non_negative' in str(e):
-                raise ValueError("Insufficient credits - this operation would result in negative credits")
-            raise
-        except Exception as e:
+        except Exception:
+            # Operation failed - refund the credits
             db.session.rollback()
+            self.refund_credits(total_cost)
             raise
 
     def use_feature(self, feature_type, amount=1):
@@ -1,7 +1,28 @@
 from extensions import db
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from .settings_cache import settings_registry, SettingsSnapshot
 
-class SystemSettings(db.Model):
+
+class CreditCostLookup:
+    """Credit cost reads shared by SystemSettings and its cached snapshot"""
+
+    def get_credit_cost(self, feature_type):
+        """Get credit cost for a specific feature"""
+        return self.get_all_credit_costs().get(feature_type, 1.0)
+
+    def get_all_credit_costs(self):
+        """Get all credit costs as a dictionary"""
+        return {
+            'images': self.credit_cost_images,
+            'explainers': self.credit_cost_explainers,
+            'magix': self.credit_cost_magix,
+            'virtual': self.credit_cost_virtual,
+            'lora_training': self.credit_cost_lora_training
+        }
+
+
+class SystemSettings(db.Model, CreditCostLookup):
     id = db.Column(db.Integer, primary_key=True)
     require_manual_approval = db.Column(db.Boolean, default=False)
     
@@ -23,28 +44,17 @@ class SystemSettings(db.Model):
             db.session.add(settings)
             db.session.commit()
         return settings
-    
-    def get_credit_cost(self, feature_type):
-        """Get credit cost for a specific feature"""
-        feature_map = {
-            'images': self.credit_cost_images,
-            'explainers': self.credit_cost_explainers,
-            'magix': self.credit_cost_magix,
-            'virtual': self.credit_cost_virtual,
-            'lora_training': self.credit_cost_lora_training
-        }
-        return feature_map.get(feature_type, 1.0)
-    
-    def get_all_credit_costs(self):
-        """Get all credit costs as a dictionary"""
-        return {
-            'images': self.credit_cost_images,
-            'explainers': self.credit_cost_explainers,
-            'magix': self.credit_cost_magix,
-            'virtual': self.credit_cost_virtual,
-            'lora_training': self.credit_cost_lora_training
-        }
-    
+
+    @staticmethod
+    def get_cached():
+        """Get a read-only snapshot of the settings; use get_settings() to modify them"""
+        return settings_registry.get('system')
+
+    @staticmethod
+    def invalidate_cache():
+        """Refresh cached settings in every worker; call after committing a change"""
+        settings_registry.invalidate()
+
     def update_credit_costs(self, credit_costs):
         """Update credit costs from a dictionary"""
         if 'images' in credit_costs:
@@ -60,3 +70,56 @@ class SystemSettings(db.Model):
 
         self.updated_at = datetime.utcnow()
         db.session.commit()
+        SystemSettings.invalidate_cache()
+
+
+class SystemSettingsSnapshot(SettingsSnapshot, CreditCostLookup):
+    """Read-only copy of SystemSettings"""
+
+
+settings_registry.register('system', SystemSettings, SystemSettingsSnapshot)
+
+
+class SchedulerLock(db.Model):
+    """Lease on a scheduled job that must run in only one process at a time"""
+    __tablename__ = 'scheduler_locks'
+
+    name = db.Column(db.String(100), primary_key=True)
+    owner = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    @staticmethod
+    def acquire(name, owner, ttl_seconds):
+        """
+        Take or renew the lease on name for ttl_seconds.
+
+        True if owner holds it afterwards. A lease its holder stopped
+        renewing can be taken once it expires.
+        """
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl_seconds)
+        claimed = SchedulerLock.query.filter(
+            SchedulerLock.name == name,
+            db.or_(
+                SchedulerLock.owner == owner,
+                SchedulerLock.expires_at < now
+            )
+        ).update({'owner': owner, 'expires_at': expires_at}, synchronize_session=False)
+        if claimed == 1:
+            db.session.commit()
+            return True
+
+        # No row yet, or another owner's live lease (then the insert fails)
+        try:
+            db.session.add(SchedulerLock(name=name, owner=owner, expires_at=expires_at))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            db.session.rollback()
+            return False
+
+    @staticmethod
+    def release(name, owner):
+        """Give up the lease on name if owner holds it"""
+        SchedulerLock.query.filter_by(name=name, owner=owner).delete(synchronize_session=False)
+        db.session.commit()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark ImageOptimizer batches: serial versus the process pool.
+
+Optimizes a batch of seeded synthetic phone-sized photos (base64, as
+uploads arrive) for a service three ways:
+
+- serial:    batch_optimize(parallel=False), one image after another
+- parallel:  batch_optimize() on the worker process pool
+- streaming: iter_optimize(), timing when the first result arrives
+
+The optimization cache is not configured here, so every run optimizes.
+
+Usage:
+    python scripts/bench_batch_optimize.py [--images 10] [--width 4032] [--height 3024] [--service fal] [--workers N]
+"""
+
+import io
+import os
+import time
+import base64
+import logging
+import argparse
+
+from bench_common import synthetic_photo
+
+
+def encode_photos(count, size):
+    """Seeded synthetic photos as base64 JPEG data"""
+    images = []
+    for seed in range(count):
+        buffer = io.BytesIO()
+        synthetic_photo(size, seed).save(buffer, 'JPEG', quality=92)
+        images.append(base64.b64encode(buffer.getvalue()).decode('ascii'))
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=10, help='Images per batch')
+    parser.add_argument('--width', type=int, default=4032)
+    parser.add_argument('--height', type=int, default=3024)
+    parser.add_argument('--service', default='fal', help='ImageOptimizer.SERVICE_CONFIGS entry')
+    parser.add_argument('--workers', type=int, help='Pool processes (default: OPTIMIZER_WORKERS or CPU count)')
+    args = parser.parse_args()
+    if args.workers:
+        # Read when the pool is created
+        os.environ['OPTIMIZER_WORKERS'] = str(args.workers)
+    logging.disable(logging.WARNING)
+
+    from services.image_optimizer import ImageOptimizer
+
+    images = encode_photos(args.images, (args.width, args.height))
+    total_mb = sum(len(image) * 3 / 4 for image in images) / (1024 * 1024)
+    print(f"{args.images} {args.width}x{args.height} JPEGs ({total_mb:.1f} MB) for '{args.service}', "
+          f"{os.cpu_count()} CPUs\n")
+
+    # Start the pool processes outside the timings
+    ImageOptimizer.batch_optimize(images[:2], args.service)
+
+    try:
+        started = time.perf_counter()
+        serial = ImageOptimizer.batch_optimize(images, args.service, parallel=False)
+        serial_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        parallel = ImageOptimizer.batch_optimize(images, args.service)
+        parallel_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        first = None
+        for _ in ImageOptimizer.iter_optimize(images, args.service):
+            if first is None:
+                first = time.perf_counter() - started
+        streaming_time = time.perf_counter() - started
+    finally:
+        ImageOptimizer.shutdown_pool()
+
+    failed = sum(1 for _, metadata in serial + parallel if metadata.get('optimization_failed'))
+    output_mb = sum(metadata.get('optimized_size_bytes', 0) for _, metadata in parallel) / (1024 * 1024)
+    print(f"{'serial':<10} {serial_time:7.2f}s")
+    print(f"{'parallel':<10} {parallel_time:7.2f}s  ({serial_time / parallel_time:.2f}x)")
+    print(f"{'streaming':<10} {streaming_time:7.2f}s  first result after {first:.2f}s")
+    print(f"\noutput {output_mb:.1f} MB, {failed} failed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Shared helpers for the benchmark scripts: seeded synthetic images and
+timing summaries, so every run measures the same pixels; SQL statement
+counting; and an app on a throwaway database with the FAL call stubbed
+out, for benchmarks that drive routes. The tests optimize the same
+synthetic photos and count statements with the same helper.
+"""
+
+import os
+import sys
+import random
+import shutil
+import logging
+import threading
+import statistics
+from contextlib import contextmanager
+
+from PIL import Image, ImageDraw, ImageFilter
+
+# Make the app's packages importable from scripts/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def synthetic_photo(size, seed=0):
+    """
+    A photo-like RGB image: smooth gradients, hard edges and fine grain.
+
+    Compresses roughly like a real photo, unlike flat test patterns.
+    """
+    width, height = size
+    image = Image.merge('RGB', (
+        Image.linear_gradient('L').resize(size),
+        Image.radial_gradient('L').resize(size),
+        Image.effect_mandelbrot(size, (-2.0 + seed * 0.05, -1.2, 0.8, 1.2), 60)
+    ))
+    draw = ImageDraw.Draw(image)
+    rng = random.Random(seed)
+    for _ in range(12):
+        left, top = rng.randrange(width), rng.randrange(height)
+        radius = rng.randrange(width // 20, width // 6)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((left, top, left + radius, top + radius), outline=color, width=max(2, width // 300))
+    image = image.filter(ImageFilter.GaussianBlur(1.0))
+
+    # Sensor-like grain: uniform bytes scaled to a standard deviation of about 32
+    grain_size = (max(1, width // 2), max(1, height // 2))
+    grain = Image.frombytes('L', grain_size, rng.randbytes(grain_size[0] * grain_size[1]))
+    grain = grain.point(lambda value: round(128 + (value - 128) * 0.43))
+    grain = grain.resize(size, Image.Resampling.BICUBIC)
+    return Image.blend(image, Image.merge('RGB', (grain, grain, grain)), 0.15)
+
+
+def write_photos(directory, count, size, format='JPEG', quality=92):
+    """Save count synthetic photos into directory; returns their paths"""
+    extension = 'jpg' if format == 'JPEG' else format.lower()
+    paths = []
+    for seed in range(count):
+        path = os.path.join(directory, f"photo_{seed}.{extension}")
+        params = {'quality': quality} if format == 'JPEG' else {}
+        synthetic_photo(size, seed).save(path, format, **params)
+        paths.append(path)
+    return paths
+
+
+def summarize_ms(samples):
+    """'p50 / p95 / max' of durations in seconds, as milliseconds"""
+    if not samples:
+        return 'n/a'
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"{statistics.median(ordered) * 1000:7.1f} / {p95 * 1000:7.1f} / {ordered[-1] * 1000:7.1f}"
+
+
+@contextmanager
+def count_statements(engine):
+    """Collect SQL statements executed on this thread (background jobs share the engine)"""
+    from sqlalchemy import event
+
+    statements = []
+    thread_id = threading.get_ident()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread_id:
+            statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def load_app(work_dir, db_url=None):
+    """Import the app against db_url (default: a SQLite file in work_dir), ready for test clients"""
+    # The app reads its configuration when app.py is imported
+    os.environ.setdefault('SECRET_KEY', 'bench-secret-key')
+    os.environ['DB_PATH'] = db_url or f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    logging.disable(logging.WARNING)
+
+    from app import app
+    from extensions import limiter
+
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    limiter.enabled = False
+    return app
+
+
+def add_user(db, credits=1_000_000):
+    """A user with an active subscription on the first plan, plus configured API keys; returns its id"""
+    from models import User, UserSubscription, SubscriptionPlanModel, APISettings
+
+    user = User(username='bench', email='bench@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    plan = SubscriptionPlanModel.query.first()
+    db.session.add(UserSubscription(user_id=user.id, plan_id=plan.id, credits_remaining=credits, credits_used_this_month=0))
+    settings = APISettings.get_settings()
+    settings.set_fal_key('bench-fal-key')
+    settings.set_openai_key('bench-openai-key')
+    db.session.commit()
+    APISettings.invalidate_cache()
+    return user.id
+
+
+def silence_stdout():
+    """Send the prints of routes and background jobs to /dev/null; returns the real stdout for the report"""
+    report = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    return report
+
+
+def logged_in_client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def stub_fal(work_dir, sources=None):
+    """
+    Replace the FAL call behind /generate/image with one that "downloads"
+    instantly: copies of sources, in turn, or small gray PNGs. Images are
+    stored under work_dir instead of static/images.
+    """
+    from PIL import Image
+    import blueprints.generate as generate
+    from services.storage import image_storage, LocalStorage
+
+    image_storage.backend = LocalStorage(os.path.join(work_dir, 'images'), '/static/images')
+
+    def generate_image(params, on_submit=None, on_queue_update=None):
+        on_submit('bench-request')
+        paths = []
+        for index in range(params.get('num_images', 1)):
+            if sources:
+                source = sources[index % len(sources)]
+                path = image_storage.staging_path(os.path.splitext(source)[1].lstrip('.'))
+                shutil.copyfile(source, path)
+            else:
+                path = image_storage.staging_path('png')
+                Image.new('RGB', (64, 64), 'gray').save(path)
+            paths.append(path)
+        return {'image_paths': paths}
+
+    generate.generate_image = generate_image
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Benchmark derivative encoding on request threads versus the process pool.
+
+Encodes WebP and JPEG derivatives of synthetic generated images (PNG)
+from several request threads at once, two ways:
+
+- inline: encode_derivative runs on the request threads themselves, as
+  before DerivativeEncoder existed; it holds this process's GIL
+- pool:   DerivativeEncoder.encode, which hands the work to worker
+  processes and only waits on the request threads
+
+Meanwhile a probe thread repeatedly does a small piece of request work
+(serializing a JSON payload) and records how long each one takes, which
+is what other requests served by the same gunicorn worker feel.
+
+Then it drives POST /generate/image for 1, 2 and 4 images, on a
+throwaway database with the FAL call stubbed to hand back synthetic
+JPEGs at once, from several logged-in clients at a time. Each client
+polls its job until it completes. It reports the p50 / p95 / max of the
+POST itself and of submit-to-completed, once with ingest encoding on the
+job threads (inline, as before DerivativeEncoder) and once on the pool.
+
+Usage:
+    python scripts/bench_derivatives.py [--images 8] [--size 1536] [--threads 4] [--workers 2]
+                                        [--jobs 20] [--clients 2] [--fal-size 1024]
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from bench_common import write_photos, summarize_ms, load_app, add_user, logged_in_client, stub_fal, silence_stdout
+
+from services.derivatives import DerivativeEncoder, derivative_encoder, encode_derivative
+
+FORMATS = ('webp', 'jpeg')
+BATCH_SIZES = (1, 2, 4)
+PAYLOAD = {'images': [{'id': i, 'prompt': 'a lighthouse at dusk ' * 4, 'tags': list(range(20))} for i in range(50)]}
+
+
+def probe_latency(stop, samples):
+    """Time small units of request work until stop is set"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        json.dumps(PAYLOAD)
+        samples.append(time.perf_counter() - started)
+        time.sleep(0.002)
+
+
+def run(label, encode, jobs, threads):
+    samples = []
+    stop = threading.Event()
+    probe = threading.Thread(target=probe_latency, args=(stop, samples))
+    probe.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as request_threads:
+        list(request_threads.map(lambda job: encode(*job), jobs))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    probe.join()
+    print(f"{label:<8} {elapsed:8.2f}s {len(jobs) / elapsed:10.1f}   {summarize_ms(samples)}")
+
+
+class InlineExecutor:
+    """Runs submitted work on the calling thread, as encoding did before DerivativeEncoder"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def run_generation(client, num_images):
+    """POST /generate/image and poll the job; returns (request seconds, submit-to-completed seconds)"""
+    started = time.perf_counter()
+    response = client.post('/generate/image', json={
+        'prompt': 'a lighthouse at dusk',
+        'model': 'fal-ai/flux/dev',
+        'num_images': num_images,
+        'image_size': {'width': 1024, 'height': 1024}
+    })
+    requested = time.perf_counter() - started
+    if response.status_code != 202:
+        raise RuntimeError(f"/generate/image returned {response.status_code}: {response.get_json()}")
+    job_id = response.get_json()['job_id']
+    while True:
+        status = client.get(f'/api/jobs/{job_id}').get_json()['status']
+        if status == 'completed':
+            return requested, time.perf_counter() - started
+        if status == 'failed':
+            raise RuntimeError(f"job {job_id} failed")
+        time.sleep(0.01)
+
+
+def bench_route(args):
+    # Not a TemporaryDirectory: the app's exit handlers still use the database
+    directory = tempfile.mkdtemp()
+    app = load_app(directory)
+    from extensions import db
+
+    with app.app_context():
+        user_id = add_user(db)
+    sources = write_photos(directory, 4, (args.fal_size, args.fal_size))
+    stub_fal(directory, sources)
+    clients = [logged_in_client(app, user_id) for _ in range(args.clients)]
+
+    report = silence_stdout()
+    print(f"\nPOST /generate/image, {args.jobs} jobs per row from {args.clients} clients, "
+          f"{args.fal_size}x{args.fal_size} JPEGs from FAL, {os.getenv('GENERATION_WORKERS', '4')} generation threads", file=report)
+    print(f"{'mode':<8} {'images':>6}   {'POST p50 / p95 / max (ms)':>27}   {'completed p50 / p95 / max (ms)':>30}",
+          file=report)
+    for mode in ('inline', 'pool'):
+        if mode == 'inline':
+            derivative_encoder.executor = InlineExecutor()
+        else:
+            derivative_encoder.executor = None
+            derivative_encoder.max_workers = args.workers
+        run_generation(clients[0], 1)  # Start pool processes and warm caches outside the timing
+        for num_images in BATCH_SIZES:
+            requests, completions = [], []
+            with ThreadPoolExecutor(max_workers=args.clients) as client_threads:
+                for requested, completed in client_threads.map(
+                    lambda index: run_generation(clients[index % args.clients], num_images), range(args.jobs)
+                ):
+                    requests.append(requested)
+                    completions.append(completed)
+            print(f"{mode:<8} {num_images:>6}   {summarize_ms(requests):>27}   {summarize_ms(completions):>30}",
+                  file=report)
+    derivative_encoder.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=8, help='Source images to encode')
+    parser.add_argument('--size', type=int, default=1536, help='Width of the square sources')
+    parser.add_argument('--threads', type=int, default=4, help='Concurrent request threads')
+    parser.add_argument('--workers', type=int, default=2, help='Encoding processes (DERIVATIVE_WORKERS)')
+    parser.add_argument('--jobs', type=int, default=20, help='Generation jobs per batch size')
+    parser.add_argument('--clients', type=int, default=2, help='Concurrent logged-in clients')
+    parser.add_argument('--fal-size', type=int, default=1024, help='Width of the square images FAL returns')
+    args = parser.parse_args()
+    logging.getLogger('services').setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        sources = write_photos(directory, args.images, (args.size, args.size), format='PNG')
+        jobs = [
+            (source, os.path.join(directory, f"{os.path.basename(source)}.{ext}"), ext)
+            for source in sources for ext in FORMATS
+        ]
+        print(f"{len(jobs)} encodes of {args.size}x{args.size} PNGs, {args.threads} request threads, "
+              f"{args.workers} pool processes, {os.cpu_count()} CPUs\n")
+        print(f"{'mode':<8} {'wall':>9} {'encodes/s':>10}   request work p50 / p95 / max (ms)")
+
+        idle = []
+        stop = threading.Event()
+        probe = threading.Thread(target=probe_latency, args=(stop, idle))
+        probe.start()
+        time.sleep(1)
+        stop.set()
+        probe.join()
+        print(f"{'idle':<8} {'':>9} {'':>10}   {summarize_ms(idle)}")
+
+        run('inline', encode_derivative, jobs, args.threads)
+
+        encoder = DerivativeEncoder()
+        encoder.max_workers = args.workers
+        encoder.encode(*jobs[0])  # Start the worker processes outside the timing
+        try:
+            run('pool', encoder.encode, jobs, args.threads)
+        finally:
+            encoder.stop()
+
+    bench_route(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark decoding large JPEGs with and without ImageOptimizer's draft mode.
+
+A seeded synthetic photo is saved as one large JPEG, then decoded,
+oriented and resized to each service's target box two ways:
+
+- full:  decode at full resolution, then _resize_image (LANCZOS with
+         REDUCING_GAP), as optimize_image did before draft decoding
+- draft: _draft_for_target first, so libjpeg scales by 1/2, 1/4 or 1/8
+         while decoding, then the same _resize_image
+
+Every run happens in a fresh process, so its peak RSS (minus the RSS
+after imports) is the memory that decode and resize needed. Linux keeps
+the peak across exec, so the source is written in a process of its own
+too, keeping this one small. Times are p50 / p95 / max over the runs.
+
+Usage:
+    python scripts/bench_draft_decode.py [--width 8000] [--height 6000] [--runs 5] [--services magix,training]
+"""
+
+import os
+import time
+import logging
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+from bench_common import synthetic_photo, summarize_ms
+
+
+def write_source(path, size, quality):
+    synthetic_photo(size).save(path, 'JPEG', quality=quality)
+
+
+def decode_once(path, service, draft):
+    """Decode and resize path for service in this process; returns (seconds, peak RSS growth in MB, size)"""
+    from PIL import Image
+    from services.image_optimizer import ImageOptimizer
+
+    config = ImageOptimizer._get_config(service)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    with Image.open(path) as img:
+        if draft:
+            ImageOptimizer._draft_for_target(img, config)
+        img.load()
+        resized, _ = ImageOptimizer._resize_image(ImageOptimizer._fix_orientation(img.convert('RGB')), config)
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return elapsed, (peak_kb - baseline_kb) / 1024, resized.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=8000)
+    parser.add_argument('--height', type=int, default=6000)
+    parser.add_argument('--quality', type=int, default=92, help='JPEG quality of the source')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh-process runs per service and mode')
+    parser.add_argument('--services', default='magix,training', help='Comma-separated ImageOptimizer.SERVICE_CONFIGS entries')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'large.jpg')
+        with context.Pool(1) as pool:
+            pool.apply(write_source, (path, (args.width, args.height), args.quality))
+        megapixels = args.width * args.height / 1e6
+        print(f"{args.width}x{args.height} ({megapixels:.0f} MP) JPEG q{args.quality}, "
+              f"{os.path.getsize(path) / (1024 * 1024):.1f} MB, {args.runs} runs each\n")
+        print(f"{'service':<10} {'mode':<6} {'output':>10}  {'time ms p50 / p95 / max':>25}  {'peak RSS':>9}")
+
+        for service in args.services.split(','):
+            for mode in ('full', 'draft'):
+                times, peaks = [], []
+                for _ in range(args.runs):
+                    with context.Pool(1) as pool:
+                        elapsed, peak_mb, size = pool.apply(decode_once, (path, service, mode == 'draft'))
+                    times.append(elapsed)
+                    peaks.append(peak_mb)
+                output = f"{size[0]}x{size[1]}"
+                print(f"{service:<10} {mode:<6} {output:>10}  {summarize_ms(times):>25}  {max(peaks):+7.0f}MB")
+
+
+if __name__ == '__main__':
+    main()
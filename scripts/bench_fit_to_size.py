@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark ImageOptimizer._fit_to_size against the stepping loop it replaced.
+
+Seeded synthetic phone photos are resized for a service (the resize is
+not timed), then fitted to each target size two ways:
+
+- stepped: the previous loop, lowering JPEG quality by 5 down to 60 and
+           then shrinking by 0.8, 0.7, ... about 0.3; reproduced below
+- search:  _fit_to_size, a probe-guided quality search, then a computed scale
+
+For each target it reports full encodes (plus probe encodes for the
+search), time, and the mean final quality and scale.
+
+Usage:
+    python scripts/bench_fit_to_size.py [--images 8] [--service fal] [--targets 0.25,0.08,0.02]
+"""
+
+import time
+import logging
+import argparse
+import statistics
+
+from PIL import Image
+
+from bench_common import synthetic_photo
+
+from services.image_optimizer import ImageOptimizer
+
+
+def stepped_fit(img, config):
+    """The size loops _fit_to_size replaced; returns (encoded, image, quality, encodes)"""
+    encodes = 1
+    encoded = ImageOptimizer._compress_image(img, config)
+    quality = config['quality']
+    max_size_bytes = config['max_file_size_mb'] * 1024 * 1024
+
+    while len(encoded) > max_size_bytes and quality > 60:
+        quality -= 5
+        encoded = ImageOptimizer._compress_image(img, {**config, 'quality': quality})
+        encodes += 1
+
+    final = img
+    if len(encoded) > max_size_bytes:
+        scale_factor = 0.8
+        while len(encoded) > max_size_bytes and scale_factor > 0.3:
+            final = img.resize((int(img.width * scale_factor), int(img.height * scale_factor)), Image.Resampling.LANCZOS)
+            encoded = ImageOptimizer._compress_image(final, {**config, 'quality': quality})
+            encodes += 1
+            scale_factor -= 0.1
+    return encoded, final, quality, encodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=8)
+    parser.add_argument('--width', type=int, default=4032)
+    parser.add_argument('--height', type=int, default=3024)
+    parser.add_argument('--service', default='fal', help='ImageOptimizer.SERVICE_CONFIGS entry')
+    parser.add_argument('--targets', default='0.25,0.08,0.02', help='Comma-separated target sizes in MB')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    config = ImageOptimizer._get_config(args.service)
+    corpus = [
+        ImageOptimizer._resize_image(synthetic_photo((args.width, args.height), seed), config)[0]
+        for seed in range(args.images)
+    ]
+    print(f"{args.images} {args.width}x{args.height} photos resized to {corpus[0].width}x{corpus[0].height} "
+          f"for '{args.service}' (quality {config['quality']})\n")
+    print(f"{'target':>8}  {'method':<8} {'encodes':>16} {'time':>8} {'quality':>8} {'scale':>6} {'over':>5}")
+
+    for target in (float(value) for value in args.targets.split(',')):
+        target_config = {**config, 'max_file_size_mb': target}
+        max_bytes = target * 1024 * 1024
+        for method in ('stepped', 'search'):
+            encodes = probes = 0
+            qualities, scales, over = [], [], 0
+            started = time.perf_counter()
+            for img in corpus:
+                if method == 'stepped':
+                    encoded, final, quality, passes = stepped_fit(img, target_config)
+                    encodes += passes
+                else:
+                    encoded, final, quality, _, stats = ImageOptimizer._fit_to_size(
+                        img, target_config, time.monotonic() + 600
+                    )
+                    encodes += stats['encode_passes']
+                    probes += stats['probe_encodes']
+                qualities.append(quality)
+                scales.append(final.width / img.width)
+                over += len(encoded) > max_bytes
+            elapsed = time.perf_counter() - started
+            passes = f"{encodes} + {probes} probe" if method == 'search' else str(encodes)
+            print(f"{target:>6}MB  {method:<8} {passes:>16} {elapsed:7.2f}s "
+                  f"{statistics.mean(qualities):8.1f} {statistics.mean(scales):6.2f} {over:>5}")
+
+
+if __name__ == '__main__':
+    main()
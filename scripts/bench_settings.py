@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark reads of the settings singletons through the shared snapshot.
+
+Runs against a throwaway SQLite database (or --db). Reports:
+
+- lookups: time per call of SystemSettings, APISettings and AuthSettings
+  read with get_settings() (a query, plus key decryption for API keys)
+  versus get_cached() (the process-wide snapshot)
+- routes: SQL statements and latency of warm test-client requests to
+  routes that read settings on every hit, including /generate/image with
+  the FAL call stubbed out; each route is measured with the snapshot and
+  again with get_cached() swapped for get_settings(), as before the snapshot
+
+Usage:
+    python scripts/bench_settings.py [--requests 200] [--lookups 2000] [--db sqlite:///path.db]
+"""
+
+import time
+import argparse
+import tempfile
+from contextlib import contextmanager, nullcontext
+
+from bench_common import (count_statements, summarize_ms, load_app, add_user, logged_in_client, stub_fal,
+                          silence_stdout)
+
+
+@contextmanager
+def uncached_settings():
+    """Make get_cached() query (and decrypt) like get_settings(), as every read did before the snapshot"""
+    from models import SystemSettings, APISettings, AuthSettings
+
+    classes = (SystemSettings, APISettings, AuthSettings)
+    originals = [cls.__dict__['get_cached'] for cls in classes]
+    for cls in classes:
+        cls.get_cached = staticmethod(cls.get_settings)
+    try:
+        yield
+    finally:
+        for cls, original in zip(classes, originals):
+            cls.get_cached = original
+
+
+def time_calls(fn, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - started) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='Timed requests per route')
+    parser.add_argument('--lookups', type=int, default=2000, help='Timed calls per lookup')
+    parser.add_argument('--db', help='Database URL (default: a temporary SQLite file)')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    app = load_app(work_dir, args.db)
+    from extensions import db
+    from models import SystemSettings, APISettings, AuthSettings
+
+    with app.app_context():
+        user_id = add_user(db)
+
+        print(f"{'lookup':<32} {'get_settings()':>15} {'get_cached()':>13}")
+        lookups = [
+            ('SystemSettings', lambda: SystemSettings.get_settings(), lambda: SystemSettings.get_cached()),
+            ('AuthSettings', lambda: AuthSettings.get_settings(), lambda: AuthSettings.get_cached()),
+            ('APISettings + FAL key', lambda: APISettings.get_settings().get_fal_key(),
+             lambda: APISettings.get_cached().get_fal_key()),
+        ]
+        for label, uncached, cached in lookups:
+            cached()  # Load the snapshot outside the timing
+            print(f"{label:<32} {time_calls(uncached, args.lookups) * 1e6:12.1f} us "
+                  f"{time_calls(cached, args.lookups) * 1e6:10.1f} us")
+            db.session.rollback()
+        engine = db.engine
+
+    stub_fal(work_dir)
+    client = logged_in_client(app, user_id)
+    anonymous = app.test_client()
+    generate_body = {
+        'prompt': 'a lighthouse at dusk',
+        'model': 'fal-ai/flux/dev',
+        'num_images': 1,
+        'image_size': {'width': 512, 'height': 512}
+    }
+    routes = (
+        ('GET /pricing', anonymous, 'GET', '/pricing', None),
+        ('GET /login', anonymous, 'GET', '/login', None),
+        ('GET /dashboard', client, 'GET', '/dashboard', None),
+        ('POST /generate/image', client, 'POST', '/generate/image', generate_body),
+    )
+
+    report = silence_stdout()
+    print(f"\n{'route':<24} {'settings':<14} {'statements':>10}   latency p50 / p95 / max (ms)", file=report)
+    for label, test_client, method, url, body in routes:
+        for mode in ('get_settings()', 'snapshot'):
+            with uncached_settings() if mode == 'get_settings()' else nullcontext():
+                test_client.open(url, method=method, json=body)  # Warm the snapshot and template caches
+                with count_statements(engine) as statements:
+                    status = test_client.open(url, method=method, json=body).status_code
+                samples = []
+                for _ in range(args.requests):
+                    started = time.perf_counter()
+                    test_client.open(url, method=method, json=body)
+                    samples.append(time.perf_counter() - started)
+            print(f"{label:<24} {mode:<14} {len(statements):>10}   {summarize_ms(samples)}  (HTTP {status})",
+                  file=report)
+
+
+if __name__ == '__main__':
+    main()
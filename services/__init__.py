@@ -5,5 +5,13 @@ Contains background services and utilities.
 """
 
 from .scheduler import subscription_scheduler
+from .job_queue import generation_queue
+from .downloader import image_downloader
+from .storage import image_storage
+from .derivatives import derivative_encoder, derivative_cache
+from .exports import gallery_exporter
+from .optimization_cache import optimization_cache
+from .fal_uploads import fal_uploader
+from .training_reconciler import training_reconciler
 
-__all__ = ['subscription_scheduler']
\ No newline at end of file
+__all__ = ['subscription_scheduler', 'generation_queue', 'image_downloader', 'image_storage', 'derivative_encoder', 'derivative_cache', 'gallery_exporter', 'optimization_cache', 'fal_uploader', 'training_reconciler']
\ No newline at end of file
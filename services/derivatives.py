@@ -0,0 +1,412 @@
+"""
+Image derivative encoding and the on-demand derivative cache
+
+Every generated image is stored once, as its primary (PNG for generated
+images), in image storage. WebP and JPEG copies are encoded the first
+time someone downloads them and kept in a size-bounded cache directory
+(static/derivatives) with LRU eviction; the DerivativeCacheEntry table is
+the cache index shared by all workers.
+
+Gallery previews are encoded eagerly when an image is saved, since every
+gallery page shows them: a small WebP thumbnail, stored alongside the
+primary, and an inline placeholder (a tiny WebP data URL on the Image
+row) that pages paint while the thumbnail loads.
+
+Encoding is CPU-bound and holds the GIL, so it runs in worker processes
+instead of on gunicorn's request/worker threads.
+"""
+
+import os
+import io
+import uuid
+import base64
+import logging
+import threading
+from datetime import datetime, timedelta
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image as PILImage
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from models import db, Image, DerivativeCacheEntry
+from services.image_optimizer import ImageOptimizer
+from services.storage import image_storage, file_digest
+
+logger = logging.getLogger(__name__)
+
+# Derivative extension -> PIL format
+DERIVATIVE_FORMATS = {
+    'png': 'PNG',
+    'webp': 'WEBP',
+    'jpeg': 'JPEG'
+}
+
+# Longest side and quality of inline placeholders; ~150-300 bytes each
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 40
+
+
+# The encode functions run in worker processes: they must stay module-level
+# (picklable) and avoid logging, whose locks may be held at fork time.
+
+def _save_atomic(img, filepath, format, **params):
+    """Save through a temporary file so readers never see a partial image"""
+    # Unique per writer: two workers may encode the same derivative at once
+    temp_path = f"{filepath}.{uuid.uuid4().hex}.part"
+    try:
+        img.save(temp_path, format, **params)
+        os.replace(temp_path, filepath)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _write_thumbnail(img, thumbnail_path, max_width, max_height, quality):
+    """Write a WebP thumbnail (downscaling img in place) and return the placeholder data URL"""
+    img.thumbnail((max_width, max_height), PILImage.Resampling.LANCZOS)
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.has_transparency_data else 'RGB')
+    _save_atomic(img, thumbnail_path, 'WEBP', quality=quality, method=4)
+
+    # The placeholder is scaled down from the thumbnail, which is far cheaper
+    # than going back to the full image; browsers blur it when stretched
+    img.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), PILImage.Resampling.BOX)
+    buffer = io.BytesIO()
+    img.save(buffer, 'WEBP', quality=PLACEHOLDER_QUALITY)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def prepare_image(source_path, convert_to_png, thumbnail_path, max_width, max_height, quality):
+    """
+    Encode everything a new gallery image needs from one decode of the
+    downloaded file: the primary (PNG when convert_to_png, unless it
+    already is one), the thumbnail and the placeholder.
+    """
+    with PILImage.open(source_path) as img:
+        img.load()
+        width, height = img.size
+        primary_path = source_path
+        if convert_to_png and img.format != 'PNG':
+            primary_path = f"{os.path.splitext(source_path)[0]}_primary.png"
+            _save_atomic(img, primary_path, 'PNG')
+        placeholder = _write_thumbnail(img, thumbnail_path, max_width, max_height, quality)
+
+    if primary_path != source_path:
+        os.remove(source_path)
+    return {
+        'primary_path': primary_path,
+        'primary_digest': file_digest(primary_path),
+        'thumbnail_digest': file_digest(thumbnail_path),
+        'placeholder': placeholder,
+        'width': width,
+        'height': height
+    }
+
+
+def encode_previews(source_path, thumbnail_path, max_width, max_height, quality):
+    """Encode the thumbnail and placeholder of an existing image"""
+    with PILImage.open(source_path) as img:
+        placeholder = _write_thumbnail(img, thumbnail_path, max_width, max_height, quality)
+    return {
+        'thumbnail_digest': file_digest(thumbnail_path),
+        'placeholder': placeholder
+    }
+
+
+def encode_derivative(source_path, target_path, ext):
+    """Encode one format derivative of an image and return its size in bytes"""
+    with PILImage.open(source_path) as img:
+        img.load()
+        # Convert to RGB mode for JPEG
+        if ext == 'jpeg' and img.mode in ('RGBA', 'P'):
+            img = img.convert('RGB')
+        _save_atomic(img, target_path, DERIVATIVE_FORMATS[ext])
+    return os.path.getsize(target_path)
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class DerivativeEncoder:
+    THUMBNAIL_CONFIG = ImageOptimizer.SERVICE_CONFIGS['thumbnail']
+
+    def __init__(self, app=None):
+        self.app = app
+        self.max_workers = 2
+        self.executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure the pool size; processes start on first use"""
+        self.app = app
+        self.max_workers = int(os.getenv('DERIVATIVE_WORKERS', '2'))
+
+    def stop(self):
+        """Finish pending encodes and stop the worker processes"""
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+            logger.info("Derivative encoder stopped")
+
+    def _submit(self, fn, *args):
+        # Processes are created lazily so each gunicorn worker forks its own
+        # pool after startup; a crashed pool is replaced once
+        for attempt in range(2):
+            with self._lock:
+                if self.executor is None:
+                    self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                    logger.info(f"Derivative encoder started with {self.max_workers} processes")
+                executor = self.executor
+            try:
+                return executor.submit(fn, *args)
+            except BrokenProcessPool:
+                logger.error("Derivative encoder pool broke; restarting it")
+                with self._lock:
+                    if self.executor is executor:
+                        self.executor = None
+                if attempt:
+                    raise
+
+    def _thumbnail_args(self):
+        config = self.THUMBNAIL_CONFIG
+        return config['max_width'], config['max_height'], config['quality']
+
+    def ingest(self, source_paths, convert_to_png=True):
+        """
+        Turn staged downloads into stored gallery images, encoding them in parallel.
+
+        Returns, in order, the Image columns for each source (filename,
+        width, height, thumbnail_filename, placeholder), or None where
+        processing failed or the source is None (a failed download);
+        failures are logged.
+        """
+        pending = []
+        for source_path in source_paths:
+            if source_path is None:
+                pending.append(None)
+                continue
+            thumbnail_path = image_storage.staging_path('webp')
+            future = self._submit(prepare_image, source_path, convert_to_png, thumbnail_path, *self._thumbnail_args())
+            pending.append((source_path, thumbnail_path, future))
+
+        images = []
+        for item in pending:
+            if item is None:
+                images.append(None)
+                continue
+            source_path, thumbnail_path, future = item
+            try:
+                prepared = future.result()
+                images.append({
+                    'filename': image_storage.store(prepared['primary_path'], prepared['primary_digest']),
+                    'width': prepared['width'],
+                    'height': prepared['height'],
+                    'thumbnail_filename': image_storage.store(thumbnail_path, prepared['thumbnail_digest']),
+                    'placeholder': prepared['placeholder']
+                })
+            except Exception as e:
+                logger.error(f"Failed to process image {source_path}: {e}")
+                _discard(source_path)
+                _discard(thumbnail_path)
+                images.append(None)
+        return images
+
+    def encode(self, source_path, target_path, ext):
+        """Encode a format derivative and wait for it; returns its size in bytes"""
+        return self._submit(encode_derivative, source_path, target_path, ext).result()
+
+    def create_previews(self, keys):
+        """
+        Encode gallery thumbnails and placeholders for already stored images, in parallel.
+
+        Returns {key: {'thumbnail_filename': ..., 'placeholder': ...}},
+        ready to pass as Image columns. Failures are logged and left out, so
+        the gallery falls back to the full image.
+        """
+        previews = {}
+        with ExitStack() as stack:
+            pending = []
+            for key in keys:
+                try:
+                    source_path = stack.enter_context(image_storage.local_copy(key))
+                except Exception as e:
+                    logger.error(f"Failed to read {key}: {e}")
+                    continue
+                thumbnail_path = image_storage.staging_path('webp')
+                future = self._submit(encode_previews, source_path, thumbnail_path, *self._thumbnail_args())
+                pending.append((key, thumbnail_path, future))
+
+            for key, thumbnail_path, future in pending:
+                try:
+                    encoded = future.result()
+                    previews[key] = {
+                        'thumbnail_filename': image_storage.store(thumbnail_path, encoded['thumbnail_digest']),
+                        'placeholder': encoded['placeholder']
+                    }
+                except Exception as e:
+                    logger.error(f"Failed to create previews for {key}: {e}")
+                    _discard(thumbnail_path)
+        return previews
+
+
+class DerivativeCache:
+    # Hits only refresh last_accessed_at this often, so popular files don't write on every download
+    TOUCH_INTERVAL = timedelta(minutes=1)
+
+    def __init__(self, app=None):
+        self.app = app
+        self.cache_dir = None
+        self.max_bytes = 1024 * 1024 * 1024
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure the cache directory and size budget with Flask app"""
+        self.app = app
+        self.cache_dir = os.path.join(app.root_path, 'static', 'derivatives')
+        self.max_bytes = int(os.getenv('DERIVATIVE_CACHE_MAX_MB', '1024')) * 1024 * 1024
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get(self, source_filename, ext):
+        """
+        Return the cached path of a derivative, encoding it on first access.
+
+        source_filename is the primary's Image.filename (its storage key),
+        which keys the cache index.
+        """
+        entry = DerivativeCacheEntry.query.filter_by(source_filename=source_filename, format=ext).first()
+        if entry:
+            path = os.path.join(self.cache_dir, entry.filename)
+            if os.path.exists(path):
+                self._touch(entry)
+                return path
+            # File was removed behind the index's back; rebuild it
+            db.session.delete(entry)
+            db.session.commit()
+
+        # Storage keys are content hashes (or legacy uuids), so the base name is unique
+        filename = f"{os.path.splitext(os.path.basename(source_filename))[0]}.{ext}"
+        path = os.path.join(self.cache_dir, filename)
+        with image_storage.local_copy(source_filename) as source_path:
+            size = derivative_encoder.encode(source_path, path, ext)
+
+        try:
+            entry = DerivativeCacheEntry(
+                filename=filename,
+                source_filename=source_filename,
+                format=ext,
+                size_bytes=size
+            )
+            db.session.add(entry)
+            db.session.commit()
+        except IntegrityError:
+            # Another worker encoded the same derivative concurrently
+            db.session.rollback()
+            return path
+
+        logger.info(f"Cached {ext} derivative of {source_filename} ({size} bytes)")
+        self.evict(keep_id=entry.id)
+        return path
+
+    def open_cached(self, source_filename, ext):
+        """
+        Open an already cached derivative for reading, or return None if it isn't cached.
+
+        The open file stays readable even if the entry is evicted meanwhile.
+        """
+        entry = DerivativeCacheEntry.query.filter_by(source_filename=source_filename, format=ext).first()
+        if not entry:
+            return None
+        try:
+            cached_file = open(os.path.join(self.cache_dir, entry.filename), 'rb')
+        except FileNotFoundError:
+            return None
+        self._touch(entry)
+        return cached_file
+
+    def _touch(self, entry):
+        now = datetime.utcnow()
+        if entry.last_accessed_at is None or now - entry.last_accessed_at > self.TOUCH_INTERVAL:
+            entry.last_accessed_at = now
+            db.session.commit()
+
+    def evict(self, keep_id=None):
+        """Delete least recently used derivatives until the cache fits its budget"""
+        total = db.session.query(func.coalesce(func.sum(DerivativeCacheEntry.size_bytes), 0)).scalar()
+        if total <= self.max_bytes:
+            return 0
+
+        evicted = 0
+        candidates = db.session.query(
+            DerivativeCacheEntry.id,
+            DerivativeCacheEntry.filename,
+            DerivativeCacheEntry.size_bytes
+        ).filter(
+            DerivativeCacheEntry.id != keep_id
+        ).order_by(DerivativeCacheEntry.last_accessed_at.asc()).all()
+
+        for entry_id, filename, size_bytes in candidates:
+            if total <= self.max_bytes:
+                break
+            # Only the worker whose delete succeeds removes the file
+            deleted = DerivativeCacheEntry.query.filter_by(id=entry_id).delete(synchronize_session=False)
+            db.session.commit()
+            total -= size_bytes
+            if deleted:
+                self._remove_file(filename)
+                evicted += 1
+
+        if evicted:
+            logger.info(f"Evicted {evicted} cached derivatives")
+        return evicted
+
+    def remove(self, source_filename):
+        """Drop every cached derivative of an image (uncommitted)"""
+        entries = DerivativeCacheEntry.query.filter_by(source_filename=source_filename).all()
+        for entry in entries:
+            self._remove_file(entry.filename)
+            db.session.delete(entry)
+
+    def _remove_file(self, filename):
+        try:
+            os.remove(os.path.join(self.cache_dir, filename))
+        except FileNotFoundError:
+            pass
+
+
+# Global instances
+derivative_encoder = DerivativeEncoder()
+derivative_cache = DerivativeCache()
+
+
+def remove_image_files(image):
+    """
+    Delete an image's stored files and cached derivatives (uncommitted).
+
+    Storage is content-addressed, so files another row still points at are kept.
+    """
+    shared = db.session.query(Image.id).filter(
+        Image.filename == image.filename,
+        Image.id != image.id
+    ).first()
+    if shared:
+        return
+
+    image_storage.delete(image.filename)
+    if image.thumbnail_filename:
+        image_storage.delete(image.thumbnail_filename)
+    if '/' not in image.filename:
+        # Flat legacy rows may still have format copies next to the primary
+        base_filename = os.path.splitext(image.filename)[0]
+        for ext in ('png', 'webp', 'jpeg', 'jpg'):
+            image_storage.delete(f"{base_filename}.{ext}")
+    derivative_cache.remove(image.filename)
+
@@ -0,0 +1,126 @@
+"""
+Pooled HTTP downloader for generated images
+
+FAL returns result images as URLs. Downloads share one keep-alive session
+(bounded connections per host, timeouts, retries on transient errors), run
+concurrently, and stream to disk in chunks instead of buffering whole
+responses in memory.
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class ImageDownloader:
+    CHUNK_SIZE = 64 * 1024
+    CONNECT_TIMEOUT = 10  # seconds
+    READ_TIMEOUT = 60  # seconds between bytes, not for the whole body
+
+    def __init__(self):
+        self.max_workers = int(os.getenv('DOWNLOAD_WORKERS', '8'))
+        self.connections_per_host = int(os.getenv('DOWNLOAD_CONNECTIONS_PER_HOST', '8'))
+        self._session = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """Shared session, created on first use"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    retry = Retry(
+                        total=3,
+                        backoff_factor=0.5,
+                        status_forcelist=[429, 500, 502, 503, 504],
+                        allowed_methods=['GET']
+                    )
+                    # pool_block caps open connections per host instead of opening extras
+                    adapter = HTTPAdapter(
+                        pool_connections=4,
+                        pool_maxsize=self.connections_per_host,
+                        pool_block=True,
+                        max_retries=retry
+                    )
+                    session = requests.Session()
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix='image-download'
+                    )
+        return self._executor
+
+    def download(self, url, filepath):
+        """
+        Stream a URL to filepath and return filepath.
+
+        The body is written to a temporary file that is renamed into place,
+        so a failed download never leaves a truncated image behind.
+        """
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        temp_path = f"{filepath}.part"
+
+        try:
+            with self.session.get(
+                url,
+                stream=True,
+                timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT)
+            ) as response:
+                response.raise_for_status()
+                with open(temp_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                        f.write(chunk)
+            os.replace(temp_path, filepath)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return filepath
+
+    def download_all(self, downloads):
+        """
+        Download (url, filepath) pairs concurrently.
+
+        Returns the file paths in input order, with None for downloads that
+        failed; failures are logged and leave no file behind, so one bad
+        image doesn't cost the others.
+        """
+        downloads = list(downloads)
+        if len(downloads) == 1:
+            return [self._download_or_none(*downloads[0])]
+        return list(self.executor.map(lambda download: self._download_or_none(*download), downloads))
+
+    def _download_or_none(self, url, filepath):
+        try:
+            return self.download(url, filepath)
+        except Exception as e:
+            logger.error(f"Image download failed for {url}: {e}")
+            return None
+
+    def stop(self):
+        """Release pooled connections and download threads"""
+        if self._executor:
+            self._executor.shutdown(wait=False)
+        if self._session:
+            self._session.close()
+
+
+# Global downloader instance
+image_downloader = ImageDownloader()
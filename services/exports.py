@@ -0,0 +1,186 @@
+"""
+Streaming ZIP export of gallery images
+
+An export is written incrementally: each image is copied into the
+archive in chunks and the archive bytes are yielded as soon as they are
+produced, so memory use stays constant however many images are
+exported. Images are already compressed (PNG/JPEG/WebP), so entries are
+stored rather than deflated.
+
+While streaming, the archive is also written to a cache directory under
+a key derived from the selection. Repeat requests for the same selection are served from
+that file, with Range support (or by nginx, see send_image_file), so an
+interrupted download can resume. Cached exports expire after
+EXPORT_CACHE_HOURS.
+
+Formats other than an image's primary are read from the derivative cache
+when already cached there; otherwise they are encoded to a private
+staging file for the export alone, so a bulk export neither evicts the
+derivatives people are downloading nor loses files to eviction while it
+runs. An image that can't be read aborts the export rather than leaving
+it silently incomplete.
+"""
+
+import io
+import os
+import hmac
+import time
+import uuid
+import hashlib
+import logging
+import zipfile
+from datetime import datetime
+from contextlib import ExitStack
+from models import DerivativeCacheEntry
+from services.storage import image_storage
+from services.derivatives import derivative_cache, derivative_encoder
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from each image per write into the archive
+CHUNK_SIZE = 256 * 1024
+
+# Earliest timestamp a ZIP entry can carry
+ZIP_EPOCH = datetime(1980, 1, 1)
+
+
+class _ArchiveSink(io.RawIOBase):
+    """Unseekable sink for ZipFile that collects its output and copies it to the cache file"""
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self.cache_file.write(data)
+        self.chunks.append(data)
+        return len(data)
+
+    def drain(self):
+        """Return and forget everything written since the last drain"""
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _flush(sink):
+    data = sink.drain()
+    if data:
+        yield data
+
+
+class GalleryExporter:
+    def __init__(self, app=None):
+        self.app = app
+        self.cache_dir = None
+        self.max_age = 24 * 3600
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure the export cache directory with Flask app"""
+        self.app = app
+        self.cache_dir = os.path.join(app.root_path, 'static', 'exports')
+        self.max_age = int(os.getenv('EXPORT_CACHE_HOURS', '24')) * 3600
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def export_key(self, user_id, fmt, images):
+        """
+        Identify an export by its owner, format and exact image files.
+
+        Keyed with the app's secret: cached archives live under static/,
+        so their names must not be guessable.
+        """
+        selection = ','.join(f"{image.id}:{image.filename}" for image in images)
+        message = f"{user_id}:{fmt}:{selection}".encode()
+        return hmac.new(self.app.secret_key.encode(), message, hashlib.sha256).hexdigest()
+
+    def cached_path(self, export_key):
+        """Path of a finished cached export, or None"""
+        path = os.path.join(self.cache_dir, f"{export_key}.zip")
+        if os.path.exists(path) and time.time() - os.path.getmtime(path) < self.max_age:
+            return path
+        return None
+
+    def stream(self, export_key, fmt, images):
+        """
+        Yield a ZIP of the images in a format, caching it under export_key once complete.
+
+        Must run inside an app context (wrap it in stream_with_context):
+        the derivative cache is consulted on the way. Raises if an image
+        can't be read, which cuts the download short.
+        """
+        self._expire()
+        cache_path = os.path.join(self.cache_dir, f"{export_key}.zip")
+        part_path = f"{cache_path}.{uuid.uuid4().hex}.part"
+        complete = False
+        try:
+            with open(part_path, 'wb') as cache_file:
+                sink = _ArchiveSink(cache_file)
+                with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+                    for image in images:
+                        yield from self._write_image(archive, sink, image, fmt)
+                yield from _flush(sink)
+            os.replace(part_path, cache_path)
+            complete = True
+        finally:
+            # Interrupted downloads leave no cache entry behind
+            if not complete:
+                self._remove(part_path)
+
+    def _write_image(self, archive, sink, image, fmt):
+        with ExitStack() as stack:
+            try:
+                source = self._open_source(image, fmt, stack)
+            except Exception as e:
+                logger.error(f"Aborting export: cannot read {image.filename} as {fmt}: {e}")
+                raise
+
+            created_at = image.created_at or ZIP_EPOCH
+            info = zipfile.ZipInfo(f"sketchmaker_{image.id}.{fmt}", created_at.timetuple()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = os.fstat(source.fileno()).st_size
+            with archive.open(info, 'w') as entry:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    entry.write(chunk)
+                    yield from _flush(sink)
+        yield from _flush(sink)
+
+    def _open_source(self, image, fmt, stack):
+        """Open the file to archive for an image: its primary, a cached derivative or a private encode"""
+        if image.file_extension in DerivativeCacheEntry.FORMAT_EXTENSIONS[fmt]:
+            return stack.enter_context(open(stack.enter_context(image_storage.local_copy(image.filename)), 'rb'))
+
+        cached_file = derivative_cache.open_cached(image.filename, fmt)
+        if cached_file:
+            return stack.enter_context(cached_file)
+
+        source_path = stack.enter_context(image_storage.local_copy(image.filename))
+        target_path = image_storage.staging_path(fmt)
+        stack.callback(self._remove, target_path)
+        derivative_encoder.encode(source_path, target_path, fmt)
+        return stack.enter_context(open(target_path, 'rb'))
+
+    def _expire(self):
+        """Delete cached exports (and abandoned partial ones) older than max_age"""
+        cutoff = time.time() - self.max_age
+        for entry in os.scandir(self.cache_dir):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# Global exporter instance
+gallery_exporter = GalleryExporter()
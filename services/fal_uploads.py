@@ -0,0 +1,89 @@
+"""
+Binary image uploads to FAL storage
+
+Nano Studio, Virtual Try-On and LoRA training post their source images as
+multipart/form-data. Werkzeug spools each part to a temporary file; it is
+saved into a per-request workspace, optimized from disk (in the optimizer
+pool when there are several) and uploaded once to FAL's CDN, so FAL
+arguments carry a URL instead of a multi-megabyte base64 data URI.
+
+Training datasets are written into a ZIP in the same workspace and
+uploaded as one file.
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+import mimetypes
+import zipfile
+from contextlib import contextmanager
+from werkzeug.utils import secure_filename
+from services.image_optimizer import ImageOptimizer
+
+logger = logging.getLogger(__name__)
+
+
+class FalUploader:
+    def __init__(self, app=None):
+        self.app = app
+        self.upload_dir = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure the upload workspace directory with Flask app"""
+        self.app = app
+        self.upload_dir = os.path.join(app.instance_path, 'fal_uploads')
+        os.makedirs(self.upload_dir, exist_ok=True)
+
+    def upload_images(self, client, files, service):
+        """Optimize uploaded files for an optimizer service and upload each; return their FAL URLs"""
+        with self._workspace() as workspace:
+            paths = self._optimize(workspace, files, service)
+            return [client.upload_file(path) for path in paths]
+
+    def upload_training_archive(self, client, files):
+        """Optimize uploaded training images into a ZIP and upload it; return its FAL URL"""
+        with self._workspace() as workspace:
+            paths = self._optimize(workspace, files, 'training')
+            archive_path = os.path.join(workspace, 'training_images.zip')
+            # JPEGs don't deflate, so entries are stored
+            with zipfile.ZipFile(archive_path, 'w', compression=zipfile.ZIP_STORED) as archive:
+                for index, (file, path) in enumerate(zip(files, paths)):
+                    name = os.path.splitext(secure_filename(file.filename or ''))[0] or 'image'
+                    archive.write(path, f"{index:02d}_{name}{os.path.splitext(path)[1]}")
+            logger.info(f"Training archive of {len(paths)} images: {os.path.getsize(archive_path)} bytes")
+            return client.upload_file(archive_path)
+
+    def _optimize(self, workspace, files, service):
+        """Save uploaded files into the workspace and optimize them; return the paths to upload"""
+        staged = []
+        for index, file in enumerate(files):
+            source_path = os.path.join(workspace, f"source_{index}{self._extension(file)}")
+            file.save(source_path)
+            # Every optimizer profile encodes JPEG
+            staged.append((source_path, os.path.join(workspace, f"{index}.jpg")))
+        return [path for path, _ in ImageOptimizer.optimize_files(staged, service)]
+
+    def _extension(self, file):
+        # Kept so a file that fails to optimize is still uploaded with its type;
+        # the part's content type wins over a name the browser may have kept
+        # for a re-encoded image
+        if file.mimetype and file.mimetype.startswith('image/'):
+            ext = mimetypes.guess_extension(file.mimetype)
+            if ext:
+                return ext
+        return os.path.splitext(secure_filename(file.filename or ''))[1].lower()
+
+    @contextmanager
+    def _workspace(self):
+        path = tempfile.mkdtemp(dir=self.upload_dir)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+# Global uploader instance
+fal_uploader = FalUploader()
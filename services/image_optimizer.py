@@ -6,9 +6,18 @@ Handles resizing, compression, and format conversion.
 
 from PIL import Image
 import io
+import os
+import math
+import time
 import base64
-from typing import Tuple, Optional, Dict, Any
+import signal
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Tuple, Optional, Dict, Any, Iterator
 import logging
+from services.optimization_cache import optimization_cache
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +32,36 @@ class ImageOptimizer:
     DEFAULT_MAX_HEIGHT = 1920
     DEFAULT_QUALITY = 85
     DEFAULT_MAX_FILE_SIZE_MB = 5
+
+    # Per-image budgets; override with 'time_budget_seconds' / 'memory_budget_mb' in a config
+    DEFAULT_TIME_BUDGET_SECONDS = 10
+    DEFAULT_MEMORY_BUDGET_MB = 512
+
+    # Size targeting: lowest JPEG quality and scale tried, and how much the
+    # quality-search probe is downsampled per side
+    MIN_QUALITY = 60
+    QUALITY_SEARCH_ROUNDS = 4
+    MIN_SCALE = 0.1
+    PROBE_FACTOR = 4
+
+    # Large resizes first reduce() by an integer factor to no less than this
+    # multiple of the target size, then resample with LANCZOS; 2+ is visually
+    # indistinguishable from resampling the whole image
+    REDUCING_GAP = 2.0
+
+    # Part of every optimization cache key; bump when output for the same input and config changes
+    CACHE_VERSION = 1
+
+    # Pool processes back the budgets with hard limits: an image still running
+    # at this multiple of its time budget is abandoned, and a process's address
+    # space may grow by this much, so an oversized decode raises MemoryError
+    # there instead of getting the process killed
+    WORKER_TIME_LIMIT_FACTOR = 2
+    WORKER_MEMORY_LIMIT_MB = 3 * DEFAULT_MEMORY_BUDGET_MB
+
+    # Worker processes for parallel batches, created on first use
+    _pool = None
+    _pool_lock = threading.Lock()
     
     # Specific settings for different services
     SERVICE_CONFIGS = {
@@ -75,83 +114,273 @@ class ImageOptimizer:
             Tuple of (optimized_image_data, metadata)
         """
         try:
-            # Get configuration
-            config = cls._get_config(service, custom_config)
-            
-            # Parse image data
-            image_bytes = cls._parse_image_data(image_data)
-            
-            # Open image with PIL
-            img = Image.open(io.BytesIO(image_bytes))
-            original_format = img.format
-            original_size = len(image_bytes)
-            original_dimensions = img.size
-            
-            # Convert RGBA to RGB if needed (for JPEG)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                # Create a white background
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            elif img.mode not in ('RGB', 'L'):
-                img = img.convert('RGB')
-            
-            # Fix orientation based on EXIF data (important for iPhone images)
-            img = cls._fix_orientation(img)
-            
-            # Resize if needed
-            img, was_resized = cls._resize_image(img, config)
-            
-            # Compress and convert format
-            optimized_bytes = cls._compress_image(img, config)
-            
-            # Further compress if still too large
-            quality = config['quality']
-            max_size_bytes = config['max_file_size_mb'] * 1024 * 1024
-            
-            while len(optimized_bytes) > max_size_bytes and quality > 60:
-                quality -= 5
-                optimized_bytes = cls._compress_image(img, {**config, 'quality': quality})
-            
-            # If still too large, resize more aggressively
-            if len(optimized_bytes) > max_size_bytes:
-                scale_factor = 0.8
-                while len(optimized_bytes) > max_size_bytes and scale_factor > 0.3:
-                    new_size = (int(img.width * scale_factor), int(img.height * scale_factor))
-                    temp_img = img.resize(new_size, Image.Resampling.LANCZOS)
-                    optimized_bytes = cls._compress_image(temp_img, {**config, 'quality': quality})
-                    scale_factor -= 0.1
-                    img = temp_img
-                    was_resized = True
-            
-            # Convert to base64 data URL
-            optimized_data = cls._to_data_url(optimized_bytes, config['format'])
-            
-            # Prepare metadata
-            metadata = {
-                'original_size_bytes': original_size,
-                'optimized_size_bytes': len(optimized_bytes),
-                'compression_ratio': round(len(optimized_bytes) / original_size * 100, 2),
-                'original_dimensions': original_dimensions,
-                'optimized_dimensions': img.size,
-                'was_resized': was_resized,
-                'final_quality': quality,
-                'format': config['format']
-            }
-            
-            logger.info(f"Image optimized: {original_size} -> {len(optimized_bytes)} bytes "
+            cache_key = cls._cache_key(image_data, service, custom_config)
+            if cache_key:
+                cached = optimization_cache.get(cache_key)
+                if cached:
+                    return cached
+
+            optimized_data, metadata = cls._optimize(image_data, service, custom_config)
+            cls._cache_result(cache_key, optimized_data, metadata)
+
+            logger.info(f"Image optimized: {metadata['original_size_bytes']} -> {metadata['optimized_size_bytes']} bytes "
                        f"({metadata['compression_ratio']}%), "
-                       f"dimensions: {original_dimensions} -> {img.size}")
-            
+                       f"dimensions: {metadata['original_dimensions']} -> {metadata['optimized_dimensions']}")
+
             return optimized_data, metadata
-            
+
         except Exception as e:
             logger.error(f"Error optimizing image: {str(e)}")
             # Return original image if optimization fails
             return image_data, {'error': str(e), 'optimization_failed': True}
-    
+
+    @classmethod
+    def _cache_key(
+        cls,
+        image_data: str,
+        service: str,
+        custom_config: Optional[Dict[str, Any]]
+    ) -> Optional[str]:
+        """Optimization cache key for an input, or None when the cache isn't configured"""
+        if not optimization_cache.enabled:
+            return None
+        return optimization_cache.make_key(image_data, cls._get_config(service, custom_config), cls.CACHE_VERSION)
+
+    @classmethod
+    def _cache_result(cls, cache_key: Optional[str], optimized_data: str, metadata: Dict[str, Any]) -> None:
+        """Cache a complete result; failures and budget-cut results are retried next time"""
+        if cache_key and not metadata.get('optimization_failed') and not metadata.get('time_budget_exceeded'):
+            optimization_cache.put(cache_key, optimized_data, metadata)
+
+    @classmethod
+    def _optimize(
+        cls,
+        image_data: str,
+        service: str = 'fal',
+        custom_config: Optional[Dict[str, Any]] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Optimize an image without logging; raises on failure.
+
+        Runs in optimizer worker processes too, where logging is unsafe
+        (its locks may be held by another thread at fork time).
+        """
+        # Parse image data
+        image_bytes = cls._parse_image_data(image_data)
+
+        config = cls._get_config(service, custom_config)
+        optimized_bytes, metadata = cls._encode(io.BytesIO(image_bytes), len(image_bytes), config)
+
+        # Convert to base64 data URL
+        return cls._to_data_url(optimized_bytes, config['format']), metadata
+
+    @classmethod
+    def _optimize_file(
+        cls,
+        source_path: str,
+        target_path: str,
+        service: str = 'fal',
+        custom_config: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Optimize an image file into target_path without logging; raises on failure"""
+        config = cls._get_config(service, custom_config)
+        optimized_bytes, metadata = cls._encode(source_path, os.path.getsize(source_path), config)
+        with open(target_path, 'wb') as f:
+            f.write(optimized_bytes)
+        return metadata
+
+    @classmethod
+    def _encode(cls, source, original_size: int, config: Dict[str, Any]) -> Tuple[bytes, Dict[str, Any]]:
+        """Decode, resize and re-encode an image (a path or file object) per config"""
+        deadline = time.monotonic() + config.get('time_budget_seconds', cls.DEFAULT_TIME_BUDGET_SECONDS)
+
+        # Open image with PIL
+        img = Image.open(source)
+        original_dimensions = img.size
+
+        # Let the JPEG decoder scale down while decoding, if the target allows
+        cls._draft_for_target(img, config)
+
+        # Only the header has been read so far; refuse images whose decoded
+        # pixels (plus a resized copy) would blow the memory budget
+        memory_budget_mb = config.get('memory_budget_mb', cls.DEFAULT_MEMORY_BUDGET_MB)
+        estimated_mb = img.width * img.height * max(len(img.getbands()), 3) * 2 / (1024 * 1024)
+        if estimated_mb > memory_budget_mb:
+            raise ValueError(f"Image too large to optimize: {img.width}x{img.height} "
+                             f"needs ~{estimated_mb:.0f}MB, budget is {memory_budget_mb}MB")
+
+        # Convert RGBA to RGB if needed (for JPEG)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            # Create a white background
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+            img = background
+        elif img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+
+        # Fix orientation based on EXIF data (important for iPhone images)
+        img = cls._fix_orientation(img)
+
+        # Resize if needed
+        img, was_resized = cls._resize_image(img, config)
+
+        # Compress and convert format, searching quality/scale until it fits
+        optimized_bytes, img, quality, scaled, stats = cls._fit_to_size(img, config, deadline)
+        was_resized = was_resized or scaled
+
+        # Prepare metadata
+        metadata = {
+            'original_size_bytes': original_size,
+            'optimized_size_bytes': len(optimized_bytes),
+            'compression_ratio': round(len(optimized_bytes) / original_size * 100, 2),
+            'original_dimensions': original_dimensions,
+            'optimized_dimensions': img.size,
+            'was_resized': was_resized,
+            'final_quality': quality,
+            'format': config['format'],
+            'encode_passes': stats['encode_passes'],
+            'probe_encodes': stats['probe_encodes']
+        }
+        if stats['over_budget']:
+            # Best result reached within the time budget; may exceed max_file_size_mb
+            metadata['time_budget_exceeded'] = True
+
+        return optimized_bytes, metadata
+
+    @classmethod
+    def _draft_for_target(cls, img: Image.Image, config: Dict[str, Any]) -> None:
+        """
+        Have a not yet decoded JPEG decode at a reduced size (DCT scaling by
+        1/2, 1/4 or 1/8) that is still at least the final size. DCT scaling
+        averages like a box filter, so the LANCZOS resize that finishes the
+        job keeps its quality (SSIM >= 0.995 against a full decode).
+        """
+        if img.format != 'JPEG':
+            return
+
+        # The target box applies after EXIF rotation
+        width, height = img.size
+        if img.getexif().get(274) in (5, 6, 7, 8):
+            width, height = height, width
+        ratio = min(config['max_width'] / width, config['max_height'] / height)
+        if ratio >= 1:
+            return
+
+        img.draft(None, (math.ceil(img.width * ratio), math.ceil(img.height * ratio)))
+
+    @classmethod
+    def _fit_to_size(
+        cls,
+        img: Image.Image,
+        config: Dict[str, Any],
+        deadline: float
+    ) -> Tuple[bytes, Image.Image, int, bool, Dict[str, Any]]:
+        """
+        Encode an image within max_file_size_mb, keeping as much quality and size as possible.
+
+        JPEG quality is binary searched on a downsampled probe, whose size
+        (scaled by its measured ratio to the full encode) predicts the full
+        image's; only the chosen quality is encoded at full size. If even
+        MIN_QUALITY is too big, the scale that should fit is computed from
+        the pixel count and refined from each actual encode.
+
+        Returns:
+            Tuple of (encoded_bytes, final_image, quality, was_resized, stats),
+            where stats counts full encodes, probe encodes and whether the
+            time budget ran out
+        """
+        max_size_bytes = config['max_file_size_mb'] * 1024 * 1024
+        quality = config['quality']
+        stats = {'encode_passes': 0, 'probe_encodes': 0, 'over_budget': False}
+
+        def encode(image, q):
+            stats['encode_passes'] += 1
+            return cls._compress_image(image, {**config, 'quality': q})
+
+        def out_of_time():
+            stats['over_budget'] = stats['over_budget'] or time.monotonic() > deadline
+            return stats['over_budget']
+
+        encoded = encode(img, quality)
+        if len(encoded) <= max_size_bytes or out_of_time():
+            return encoded, img, quality, False, stats
+
+        # Only JPEG encodes take a quality
+        min_quality = min(quality, cls.MIN_QUALITY) if config['format'] == 'JPEG' else quality
+        if min_quality < quality:
+            probe = img
+            if min(img.size) >= cls.PROBE_FACTOR * 64:
+                probe = img.reduce(cls.PROBE_FACTOR)
+
+            probe_sizes = {}
+
+            def probe_size(q):
+                if q not in probe_sizes:
+                    stats['probe_encodes'] += 1
+                    probe_sizes[q] = len(cls._compress_image(probe, {**config, 'quality': q}))
+                return probe_sizes[q]
+
+            # Full/probe size ratios measured so far, by quality; the ratio
+            # drifts with quality, so predictions interpolate between them
+            ratios = {quality: len(encoded) / probe_size(quality)}
+
+            def predicted_size(q):
+                below = max((k for k in ratios if k <= q), default=None)
+                above = min((k for k in ratios if k >= q), default=None)
+                if below is None or above is None or below == above:
+                    ratio = ratios[above if below is None else below]
+                else:
+                    weight = (q - below) / (above - below)
+                    ratio = ratios[below] + (ratios[above] - ratios[below]) * weight
+                return probe_size(q) * ratio
+
+            # Each round predicts the highest fitting quality from the probe
+            # and checks it with one full encode, narrowing [low, high] like a
+            # binary search while the measurements sharpen the prediction
+            low, high, best = min_quality, quality - 1, None
+            for _ in range(cls.QUALITY_SEARCH_ROUNDS):
+                if low > high or out_of_time():
+                    break
+                candidate, lo, hi = low, low, high
+                while lo <= hi:
+                    mid = (lo + hi) // 2
+                    if predicted_size(mid) <= max_size_bytes:
+                        candidate, lo = mid, mid + 1
+                    else:
+                        hi = mid - 1
+
+                attempt = encode(img, candidate)
+                ratios[candidate] = len(attempt) / probe_size(candidate)
+                if len(attempt) <= max_size_bytes:
+                    best, low = (candidate, attempt), candidate + 1
+                else:
+                    high = candidate - 1
+
+            if best:
+                quality, encoded = best
+                return encoded, img, quality, False, stats
+
+            quality = min_quality
+            if high >= min_quality:
+                # Ran out of rounds or time before trying the lowest quality
+                encoded = encode(img, quality)
+            else:
+                encoded = attempt
+            if len(encoded) <= max_size_bytes or out_of_time():
+                return encoded, img, quality, False, stats
+
+        # Size falls roughly with pixel count: pick the scale that should fit, then refine
+        scaled = img
+        scale = 1.0
+        while len(encoded) > max_size_bytes and scale > cls.MIN_SCALE and not out_of_time():
+            scale = max(cls.MIN_SCALE, scale * (max_size_bytes / len(encoded)) ** 0.5 * 0.95)
+            new_size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+            scaled = img.resize(new_size, Image.Resampling.LANCZOS)
+            encoded = encode(scaled, quality)
+        return encoded, scaled, quality, scaled is not img, stats
+
     @classmethod
     def _get_config(cls, service: str, custom_config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Get configuration for the service."""
@@ -240,8 +469,8 @@ class ImageOptimizer:
         ratio = min(max_width / img.width, max_height / img.height)
         new_size = (int(img.width * ratio), int(img.height * ratio))
         
-        # Use high-quality resampling
-        resized_img = img.resize(new_size, Image.Resampling.LANCZOS)
+        # Use high-quality resampling, after a cheap integer reduce() for big downscales
+        resized_img = img.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=cls.REDUCING_GAP)
         
         return resized_img, True
     
@@ -282,7 +511,8 @@ class ImageOptimizer:
         cls,
         images: list,
         service: str = 'fal',
-        custom_config: Optional[Dict[str, Any]] = None
+        custom_config: Optional[Dict[str, Any]] = None,
+        parallel: bool = True
     ) -> list:
         """
         Optimize multiple images at once.
@@ -291,16 +521,204 @@ class ImageOptimizer:
             images: List of base64 encoded images
             service: Service name for optimization settings
             custom_config: Optional custom configuration
+            parallel: Optimize in the worker process pool instead of one by one
             
         Returns:
-            List of tuples (optimized_image, metadata)
+            List of tuples (optimized_image, metadata), in input order
+        """
+        if not parallel or len(images) < 2:
+            return [cls.optimize_image(image_data, service, custom_config) for image_data in images]
+
+        results = [None] * len(images)
+        for index, optimized_data, metadata in cls.iter_optimize(images, service, custom_config):
+            results[index] = (optimized_data, metadata)
+        return results
+
+    @classmethod
+    def iter_optimize(
+        cls,
+        images: list,
+        service: str = 'fal',
+        custom_config: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Tuple[int, str, Dict[str, Any]]]:
+        """
+        Optimize images in the worker process pool, yielding each as soon as it finishes.
+        
+        Args:
+            images: List of base64 encoded images
+            service: Service name for optimization settings
+            custom_config: Optional custom configuration
+            
+        Yields:
+            Tuples (index, optimized_image, metadata) in completion order,
+            cached images first; failed images yield the original with
+            error metadata
+        """
+        config = cls._get_config(service, custom_config)
+        futures = {}
+        cache_keys = {}
+        cache_hits = []
+        for index, image_data in enumerate(images):
+            cache_key = cls._cache_key(image_data, service, custom_config)
+            cached = optimization_cache.get(cache_key) if cache_key else None
+            if cached:
+                cache_hits.append((index, *cached))
+                continue
+            cache_keys[index] = cache_key
+            futures[cls._submit(_optimize_in_worker, image_data, service, custom_config)] = index
+
+        # Cached images go first, while the workers start on the rest
+        yield from cache_hits
+
+        # Every image gets its own time budget once a worker picks it up, so
+        # the batch as a whole may take up to one budget per image; workers
+        # abandon images that overrun theirs, so none hold a process for long
+        time_budget = config.get('time_budget_seconds', cls.DEFAULT_TIME_BUDGET_SECONDS)
+        pending = set(futures)
+        try:
+            for future in as_completed(futures, timeout=time_budget * len(futures) + 5):
+                pending.discard(future)
+                yield cls._collect(future, futures[future], images, cache_keys)
+        except FuturesTimeoutError:
+            for future in pending:
+                index = futures[future]
+                if future.done():
+                    yield cls._collect(future, index, images, cache_keys)
+                else:
+                    future.cancel()
+                    logger.error(f"Timed out optimizing image {index}")
+                    yield index, images[index], {'error': 'Optimization timed out', 'optimization_failed': True}
+
+    @classmethod
+    def optimize_files(
+        cls,
+        files: list,
+        service: str = 'fal',
+        custom_config: Optional[Dict[str, Any]] = None
+    ) -> list:
         """
+        Optimize image files on disk, in the worker process pool when there are several.
+
+        Only paths cross the process boundary, so neither side holds more
+        than the image it is working on.
+        
+        Args:
+            files: List of (source_path, target_path) tuples
+            service: Service name for optimization settings
+            custom_config: Optional custom configuration
+            
+        Returns:
+            List of tuples (path, metadata), in input order; path is the
+            target, or the untouched source if optimization failed
+        """
+        config = cls._get_config(service, custom_config)
+        metadata = [None] * len(files)
+        cache_keys = {}
+        futures = {}
+        for index, (source_path, target_path) in enumerate(files):
+            cache_key = None
+            if optimization_cache.enabled:
+                cache_key = optimization_cache.make_file_key(source_path, config, cls.CACHE_VERSION)
+                cached = optimization_cache.get(cache_key)
+                if cached:
+                    with open(target_path, 'wb') as f:
+                        f.write(cls._parse_image_data(cached[0]))
+                    metadata[index] = cached[1]
+                    continue
+            cache_keys[index] = cache_key
+            if len(files) == 1:
+                # A single file isn't worth the round trip to the pool
+                metadata[index] = _optimize_file_in_worker(source_path, target_path, service, custom_config)
+            else:
+                futures[cls._submit(_optimize_file_in_worker, source_path, target_path, service, custom_config)] = index
+
+        # Every image gets its own time budget once a worker picks it up;
+        # workers abandon images that overrun theirs
+        time_budget = config.get('time_budget_seconds', cls.DEFAULT_TIME_BUDGET_SECONDS)
+        done, not_done = wait(futures, timeout=time_budget * len(futures) + 5)
+        for future in done:
+            try:
+                metadata[futures[future]] = future.result()
+            except Exception as e:
+                # e.g. BrokenProcessPool when a worker process died
+                metadata[futures[future]] = {'error': str(e), 'optimization_failed': True}
+        for future in not_done:
+            future.cancel()
+            metadata[futures[future]] = {'error': 'Optimization timed out', 'optimization_failed': True}
+
         results = []
-        for image_data in images:
-            optimized_data, metadata = cls.optimize_image(image_data, service, custom_config)
-            results.append((optimized_data, metadata))
+        for index, (source_path, target_path) in enumerate(files):
+            if metadata[index].get('optimization_failed'):
+                logger.error(f"Error optimizing {source_path}: {metadata[index]['error']}")
+                results.append((source_path, metadata[index]))
+                continue
+            if cache_keys.get(index):
+                with open(target_path, 'rb') as f:
+                    cls._cache_result(cache_keys[index], cls._to_data_url(f.read(), config['format']), metadata[index])
+            logger.info(f"Image {index} optimized: {metadata[index]['original_size_bytes']} -> "
+                       f"{metadata[index]['optimized_size_bytes']} bytes ({metadata[index]['compression_ratio']}%)")
+            results.append((target_path, metadata[index]))
         return results
-    
+
+    @classmethod
+    def _collect(cls, future, index: int, images: list, cache_keys: dict) -> Tuple[int, str, Dict[str, Any]]:
+        """Result of a finished worker future, cached and logged like optimize_image()"""
+        try:
+            optimized_data, metadata = future.result()
+        except Exception as e:
+            optimized_data, metadata = images[index], {'error': str(e), 'optimization_failed': True}
+        cls._cache_result(cache_keys[index], optimized_data, metadata)
+
+        if metadata.get('optimization_failed'):
+            logger.error(f"Error optimizing image {index}: {metadata['error']}")
+        else:
+            logger.info(f"Image {index} optimized: {metadata['original_size_bytes']} -> "
+                       f"{metadata['optimized_size_bytes']} bytes ({metadata['compression_ratio']}%)")
+        return index, optimized_data, metadata
+
+    @classmethod
+    def _submit(cls, fn, *args):
+        # The pool is created lazily so each gunicorn worker forks its own
+        # after startup; a broken pool (a worker process died) is replaced
+        for attempt in range(2):
+            with cls._pool_lock:
+                if cls._pool is None:
+                    max_workers = int(os.getenv('OPTIMIZER_WORKERS', '0')) or os.cpu_count() or 2
+                    cls._pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker)
+                    logger.info(f"Image optimizer pool started with {max_workers} processes")
+                pool = cls._pool
+            try:
+                future = pool.submit(fn, *args)
+            except BrokenProcessPool:
+                cls._drop_pool(pool)
+                if attempt:
+                    raise
+                continue
+            future.add_done_callback(lambda done, pool=pool: cls._drop_if_broken(pool, done))
+            return future
+
+    @classmethod
+    def _drop_if_broken(cls, pool, future):
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            cls._drop_pool(pool)
+
+    @classmethod
+    def _drop_pool(cls, pool):
+        """Forget a broken pool, so the next submit starts a new one"""
+        with cls._pool_lock:
+            if cls._pool is pool:
+                cls._pool = None
+                logger.error("Image optimizer pool broke; restarting it")
+
+    @classmethod
+    def shutdown_pool(cls):
+        """Stop the worker processes used for parallel optimization"""
+        with cls._pool_lock:
+            pool, cls._pool = cls._pool, None
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+            logger.info("Image optimizer pool stopped")
+
     @classmethod
     def estimate_processing_time(cls, file_size_mb: float, count: int = 1) -> float:
         """
@@ -314,4 +732,71 @@ class ImageOptimizer:
             Estimated time in seconds
         """
         # Rough estimate: 0.5 seconds per MB + 0.2 seconds overhead per image
-        return (file_size_mb * 0.5 + 0.2) * count
\ No newline at end of file
+        return (file_size_mb * 0.5 + 0.2) * count
+
+
+# Set in optimizer pool processes, which may take SIGALRM and resource limits
+_in_pool_worker = False
+
+
+def _init_worker():
+    """Cap a new pool process's address space at its current size plus WORKER_MEMORY_LIMIT_MB"""
+    global _in_pool_worker
+    _in_pool_worker = True
+    try:
+        import resource
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+        limit = current + ImageOptimizer.WORKER_MEMORY_LIMIT_MB * 1024 * 1024
+        hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    except (ImportError, OSError, ValueError):
+        # Not Linux; the pre-decode memory estimate still applies
+        pass
+
+
+@contextmanager
+def _worker_deadline(service, custom_config):
+    """
+    In a pool process, abandon the image at WORKER_TIME_LIMIT_FACTOR times
+    its time budget. Checked between Python steps, so one long C call
+    (e.g. a resize) still runs to completion first.
+    """
+    if not _in_pool_worker or not hasattr(signal, 'setitimer'):
+        yield
+        return
+
+    config = ImageOptimizer._get_config(service, custom_config)
+    time_budget = config.get('time_budget_seconds', ImageOptimizer.DEFAULT_TIME_BUDGET_SECONDS)
+    limit = time_budget * ImageOptimizer.WORKER_TIME_LIMIT_FACTOR
+
+    def expire(signum, frame):
+        raise TimeoutError(f"Optimization took longer than {limit:g}s")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, limit)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _optimize_in_worker(image_data, service, custom_config):
+    """Optimize one image in a pool process; errors come back as metadata"""
+    try:
+        with _worker_deadline(service, custom_config):
+            return ImageOptimizer._optimize(image_data, service, custom_config)
+    except Exception as e:
+        return image_data, {'error': str(e), 'optimization_failed': True}
+
+
+def _optimize_file_in_worker(source_path, target_path, service, custom_config):
+    """Optimize one image file in a pool process; returns its metadata, errors included"""
+    try:
+        with _worker_deadline(service, custom_config):
+            return ImageOptimizer._optimize_file(source_path, target_path, service, custom_config)
+    except Exception as e:
+        return {'error': str(e), 'optimization_failed': True}
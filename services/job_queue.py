@@ -0,0 +1,318 @@
+"""
+Background job queue for long-running FAL generations
+
+Generation routes reserve credits, persist a GenerationJob row and hand the
+job id to this queue. A pool of worker threads runs the registered handler
+for the job's feature type inside an app context, so request threads are
+released as soon as the job is enqueued.
+
+Every process stamps heartbeat_at on the jobs it holds (queued in its
+pool or running) once a minute. Jobs whose heartbeat stops belonged to a
+process that died; any worker's periodic sweep fails them and refunds
+their credits.
+"""
+
+import os
+import re
+import logging
+import threading
+import traceback
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from apscheduler.triggers.interval import IntervalTrigger
+import fal_client
+from models import db, GenerationJob, UserSubscription
+from services.scheduler import subscription_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class JobError(Exception):
+    """Expected job failure with a user-facing message and error type"""
+    def __init__(self, message, error_type='generation_error'):
+        super().__init__(message)
+        self.error_type = error_type
+
+
+class JobProgress:
+    """
+    FAL on_queue_update callback that records progress on a GenerationJob.
+
+    The job row is only written when the queue position, percent or log
+    count changes, so status polls that report nothing new cost nothing.
+    """
+    MAX_LOG_LINES = 200
+    PERCENT_PATTERN = re.compile(r'(\d{1,3})%')
+    STEP_PATTERN = re.compile(r'(\d+)/(\d+)')
+
+    def __init__(self, job):
+        self.job = job
+        self.queue_position = None
+        self.percent = None
+        self.log_count = 0
+        self.logs = []
+
+    @classmethod
+    def parse_percent(cls, message):
+        """Extract a completion percentage from a log line, if it has one"""
+        match = cls.PERCENT_PATTERN.search(message)
+        if match:
+            return min(int(match.group(1)), 100)
+        match = cls.STEP_PATTERN.search(message)
+        if match and int(match.group(2)) > 0:
+            return min(int(int(match.group(1)) * 100 / int(match.group(2))), 100)
+        return None
+
+    def __call__(self, update):
+        changed = False
+
+        if isinstance(update, fal_client.Queued):
+            if update.position != self.queue_position:
+                self.queue_position = update.position
+                changed = True
+        elif isinstance(update, fal_client.InProgress):
+            if self.queue_position is not None:
+                self.queue_position = None
+                changed = True
+            # FAL returns the full log list on every poll; only new lines matter
+            new_logs = [log['message'] for log in (update.logs or [])[self.log_count:]]
+            if new_logs:
+                self.log_count += len(new_logs)
+                self.logs = (self.logs + new_logs)[-self.MAX_LOG_LINES:]
+                for message in new_logs:
+                    percent = self.parse_percent(message)
+                    if percent is not None:
+                        self.percent = percent
+                changed = True
+
+        if changed:
+            self.save()
+
+    @property
+    def messages(self):
+        return list(self.logs)
+
+    def save(self):
+        self.job.progress = {
+            'queue_position': self.queue_position,
+            'percent': self.percent,
+            'log_count': self.log_count,
+            'logs': self.logs
+        }
+        db.session.commit()
+
+
+def settle_reserved_credits(job, images_produced):
+    """
+    Refund the credits a job reserved for requested images it didn't produce.
+
+    For jobs that reserve credits per requested image (job.arguments
+    'num_images') and charge per image returned. Returns the credits used.
+    """
+    requested = job.arguments.get('num_images') or images_produced
+    if not job.credits_reserved or images_produced >= requested:
+        return job.credits_reserved
+
+    credits_used = job.credits_reserved * images_produced / requested
+    subscription = db.session.get(UserSubscription, job.subscription_id)
+    if subscription:
+        subscription.refund_credits(job.credits_reserved - credits_used)
+    # A failure after this point refunds only what is still reserved
+    job.credits_reserved = credits_used
+    db.session.commit()
+    return credits_used
+
+
+class GenerationQueue:
+    # Seconds between heartbeats of the jobs this process holds
+    HEARTBEAT_INTERVAL = 60
+    # Jobs without a heartbeat for this long belonged to a dead worker process
+    STALE_JOB_TIMEOUT = timedelta(minutes=5)
+
+    def __init__(self, app=None):
+        self.app = app
+        self.executor = None
+        self.handlers = {}
+        # Job ids queued in this process's pool or running in it
+        self._held = set()
+        self._held_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Initialize the worker pool with Flask app (initialize subscription_scheduler first)"""
+        self.app = app
+        max_workers = int(os.getenv('GENERATION_WORKERS', '4'))
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='generation-worker'
+        )
+        subscription_scheduler.scheduler.add_job(
+            func=self.heartbeat,
+            trigger=IntervalTrigger(seconds=self.HEARTBEAT_INTERVAL),
+            id='generation_heartbeat',
+            name='Generation job heartbeat and stale job sweep',
+            replace_existing=True
+        )
+        logger.info(f"Generation queue started with {max_workers} workers")
+
+    def stop(self):
+        """Stop accepting jobs; running jobs are left to finish"""
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            logger.info("Generation queue stopped")
+
+    def register(self, feature_type, handler):
+        """
+        Register the handler that runs jobs of a feature type.
+
+        The handler receives the GenerationJob (status 'running') plus any
+        enqueue payload and returns the JSON-serializable result. Raise
+        JobError for expected failures.
+        """
+        self.handlers[feature_type] = handler
+
+    def enqueue(self, job, **payload):
+        """
+        Schedule a committed GenerationJob for background execution.
+
+        Keyword arguments are passed to the handler as-is and are never
+        persisted, so large inputs (e.g. image data URLs) stay in memory.
+        """
+        if job.feature_type not in self.handlers:
+            raise ValueError(f"No job handler registered for '{job.feature_type}'")
+        with self._held_lock:
+            self._held.add(job.job_id)
+        try:
+            self.executor.submit(self._run, job.job_id, payload)
+        except Exception:
+            self._release(job.job_id)
+            raise
+
+    def heartbeat(self):
+        """Stamp the jobs this process holds as alive, then fail jobs no live process holds"""
+        with self.app.app_context():
+            try:
+                with self._held_lock:
+                    held = list(self._held)
+                if held:
+                    GenerationJob.query.filter(
+                        GenerationJob.job_id.in_(held),
+                        GenerationJob.status.in_(['queued', 'running'])
+                    ).update({'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+                    db.session.commit()
+            except Exception as e:
+                logger.error(f"Error recording generation job heartbeat: {e}")
+                db.session.rollback()
+
+            self.fail_stale_jobs()
+            db.session.remove()
+
+    def _release(self, job_id):
+        with self._held_lock:
+            self._held.discard(job_id)
+
+    def _claim(self, job_id):
+        """Atomically move a job from queued to running; False if already claimed"""
+        now = datetime.utcnow()
+        claimed = GenerationJob.query.filter_by(job_id=job_id, status='queued').update(
+            {'status': 'running', 'started_at': now, 'heartbeat_at': now},
+            synchronize_session=False
+        )
+        db.session.commit()
+        return claimed == 1
+
+    def _run(self, job_id, payload):
+        with self.app.app_context():
+            try:
+                if not self._claim(job_id):
+                    return
+
+                job = GenerationJob.query.filter_by(job_id=job_id).first()
+                handler = self.handlers[job.feature_type]
+
+                try:
+                    result = handler(job, **payload)
+                except JobError as e:
+                    self.fail_job(job, str(e), e.error_type)
+                    return
+                except Exception as e:
+                    logger.error(f"Job {job_id} failed: {e}\n{traceback.format_exc()}")
+                    self.fail_job(job, str(e), 'generation_error')
+                    return
+
+                # Conditional update so a job already failed (and refunded) elsewhere stays failed
+                completed = GenerationJob.query.filter(
+                    GenerationJob.id == job.id,
+                    GenerationJob.status == 'running'
+                ).update({
+                    'status': 'completed',
+                    'result': result,
+                    'completed_at': datetime.utcnow()
+                }, synchronize_session=False)
+                db.session.commit()
+                if completed == 1:
+                    logger.info(f"Job {job_id} completed")
+                else:
+                    logger.warning(f"Job {job_id} finished after it was failed; its result was discarded")
+
+            except Exception as e:
+                logger.error(f"Error running job {job_id}: {e}\n{traceback.format_exc()}")
+                db.session.rollback()
+            finally:
+                self._release(job_id)
+                db.session.remove()
+
+    def fail_job(self, job, message, error_type='generation_error'):
+        """Mark a job failed and refund the credits reserved for it"""
+        db.session.rollback()
+
+        # Conditional update so a job finalized by another worker is never refunded twice
+        updated = GenerationJob.query.filter(
+            GenerationJob.id == job.id,
+            GenerationJob.status.in_(['queued', 'running'])
+        ).update({
+            'status': 'failed',
+            'error': message,
+            'error_type': error_type,
+            'completed_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+
+        if updated != 1:
+            return
+
+        if job.credits_reserved and job.subscription_id:
+            subscription = db.session.get(UserSubscription, job.subscription_id)
+            if subscription:
+                subscription.refund_credits(job.credits_reserved)
+                logger.info(f"Refunded {job.credits_reserved} credits for failed job {job.job_id}")
+
+    def fail_stale_jobs(self):
+        """Fail (and refund) jobs orphaned by a worker process that exited mid-job"""
+        try:
+            cutoff = datetime.utcnow() - self.STALE_JOB_TIMEOUT
+            stale_jobs = GenerationJob.query.filter(
+                GenerationJob.status.in_(['queued', 'running']),
+                db.or_(
+                    GenerationJob.heartbeat_at < cutoff,
+                    # Jobs from before heartbeats were recorded
+                    db.and_(GenerationJob.heartbeat_at.is_(None), GenerationJob.created_at < cutoff)
+                )
+            ).all()
+
+            for job in stale_jobs:
+                self.fail_job(job, 'Generation was interrupted. Credits have been refunded.', 'interrupted')
+
+            if stale_jobs:
+                logger.info(f"Failed {len(stale_jobs)} stale generation jobs")
+            return len(stale_jobs)
+
+        except Exception as e:
+            logger.error(f"Error failing stale jobs: {e}")
+            db.session.rollback()
+            return 0
+
+
+# Global queue instance
+generation_queue = GenerationQueue()
@@ -0,0 +1,260 @@
+"""
+Content-addressed cache of optimized input images
+
+Nano Studio users re-run edits on the same source photo, which used to be
+decoded, resized and re-encoded by ImageOptimizer on every call. Results
+are cached under a hash of the input image and the effective optimizer
+config, in two tiers:
+
+- memory: a per-process LRU, bounded in bytes
+- disk: JSON files in the instance folder shared by every worker, bounded
+  in bytes with least recently used eviction. The tier's size is scanned
+  from the directory, so the budget holds across workers; between scans
+  (at most DISK_SCAN_INTERVAL apart) each worker adds its own writes.
+
+Hit/miss counters are kept per process and written to the stats
+directory at most once a second, so the admin dashboard can add up every
+worker's numbers. Files of workers that stopped writing more than
+STATS_RETENTION ago are deleted.
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ('memory_hits', 'disk_hits', 'misses', 'stores', 'evictions')
+
+
+class OptimizationCache:
+    # Seconds between writes of this process's counters
+    STATS_INTERVAL = 1.0
+    # Seconds a worker's stats file is kept after its last write
+    STATS_RETENTION = 24 * 3600
+    # Seconds the disk tier's scanned size is trusted before writes trigger a rescan
+    DISK_SCAN_INTERVAL = 30.0
+
+    def __init__(self, app=None):
+        self.app = app
+        self.cache_dir = None
+        self.stats_dir = None
+        self.memory_max_bytes = 64 * 1024 * 1024
+        self.disk_max_bytes = 512 * 1024 * 1024
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._disk_scanned_at = 0
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self._stats_path = None
+        self._stats_written_at = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure the cache directories and size budgets with Flask app"""
+        self.app = app
+        self.cache_dir = os.path.join(app.instance_path, 'optimization_cache')
+        self.stats_dir = os.path.join(self.cache_dir, 'stats')
+        self.memory_max_bytes = int(os.getenv('OPTIMIZATION_CACHE_MEMORY_MB', '64')) * 1024 * 1024
+        self.disk_max_bytes = int(os.getenv('OPTIMIZATION_CACHE_DISK_MB', '512')) * 1024 * 1024
+        os.makedirs(self.stats_dir, exist_ok=True)
+        self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+        self._disk_scanned_at = time.monotonic()
+
+    @property
+    def enabled(self):
+        return self.cache_dir is not None
+
+    @staticmethod
+    def make_key(image_data, config, version):
+        """Key for base64 image data (or a data URL) optimized with a config"""
+        payload = image_data.split(',', 1)[1] if image_data.startswith('data:') else image_data
+        digest = hashlib.sha256(payload.encode('ascii', 'ignore'))
+        digest.update(json.dumps([version, config], sort_keys=True).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_file_key(path, config, version):
+        """Key for an image file optimized with a config"""
+        digest = hashlib.sha256(b'file:')
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest.update(json.dumps([version, config], sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Cached (optimized_data, metadata) for a key, or None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._count('memory_hits')
+                return entry[0], dict(entry[1])
+
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                stored = json.load(f)
+            os.utime(path)  # Recently used files are evicted last
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                self._count('misses')
+            return None
+
+        entry = (stored['data'], stored['metadata'])
+        with self._lock:
+            self._remember(key, entry)
+            self._count('disk_hits')
+        return entry[0], dict(entry[1])
+
+    def put(self, key, optimized_data, metadata):
+        """Cache an optimization result in both tiers"""
+        entry = (optimized_data, dict(metadata))
+        with self._lock:
+            self._remember(key, entry)
+            self._count('stores')
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump({'data': optimized_data, 'metadata': metadata}, f)
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.error(f"Failed to write optimization cache entry: {e}")
+            return
+
+        with self._lock:
+            # Other workers' writes since the last scan aren't counted, so rescan regularly
+            self._disk_bytes += size
+            rescan = (self._disk_bytes > self.disk_max_bytes
+                      or time.monotonic() - self._disk_scanned_at >= self.DISK_SCAN_INTERVAL)
+        if rescan:
+            self._evict_disk()
+
+    def stats(self):
+        """Counters summed over every worker, plus this process's memory tier and the disk tier"""
+        with self._lock:
+            self._write_stats()
+            totals = dict.fromkeys(COUNTERS, 0)
+            memory = {'entries': len(self._memory), 'bytes': self._memory_bytes}
+
+        expired_before = time.time() - self.STATS_RETENTION
+        for entry in os.scandir(self.stats_dir):
+            try:
+                if entry.stat().st_mtime < expired_before:
+                    # A worker that exited (or has been idle) long ago
+                    os.remove(entry.path)
+                    continue
+                if not entry.name.endswith('.json'):
+                    continue
+                with open(entry.path) as f:
+                    counters = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            for counter in COUNTERS:
+                totals[counter] += counters.get(counter, 0)
+
+        lookups = totals['memory_hits'] + totals['disk_hits'] + totals['misses']
+        hits = totals['memory_hits'] + totals['disk_hits']
+        disk_entries = self._disk_entries()
+        return {
+            **totals,
+            'hit_rate': round(hits / lookups * 100, 1) if lookups else 0,
+            'memory_entries': memory['entries'],
+            'memory_mb': round(memory['bytes'] / (1024 * 1024), 1),
+            'disk_entries': len(disk_entries),
+            'disk_mb': round(sum(size for _, size, _ in disk_entries) / (1024 * 1024), 1)
+        }
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key, entry):
+        # Caller holds the lock
+        size = len(entry[0])
+        if size > self.memory_max_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous[0])
+        self._memory[key] = entry
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted[0])
+
+    def _count(self, counter):
+        # Caller holds the lock
+        self._counters[counter] += 1
+        if time.monotonic() - self._stats_written_at >= self.STATS_INTERVAL:
+            self._write_stats()
+
+    def _write_stats(self):
+        # Caller holds the lock; each process owns one file for its lifetime
+        if self._stats_path is None:
+            self._stats_path = os.path.join(self.stats_dir, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+        temp_path = f"{self._stats_path}.part"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(self._counters, f)
+            os.replace(temp_path, self._stats_path)
+        except OSError as e:
+            logger.error(f"Failed to write optimization cache stats: {e}")
+        self._stats_written_at = time.monotonic()
+
+    def _disk_entries(self):
+        """(path, size, mtime) of every cached file"""
+        entries = []
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir() or shard.path == self.stats_dir:
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict_disk(self):
+        """
+        Rescan the disk tier's size and, if it is over budget, delete least
+        recently used files until it is at 90% of its budget.
+        """
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_max_bytes * 0.9 if total > self.disk_max_bytes else total
+        evicted = 0
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                evicted += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+        with self._lock:
+            self._disk_bytes = total
+            self._disk_scanned_at = time.monotonic()
+            self._counters['evictions'] += evicted
+        if evicted:
+            logger.info(f"Evicted {evicted} optimization cache entries")
+
+
+# Global cache instance
+optimization_cache = OptimizationCache()
@@ -1,32 +1,51 @@
 """
 APScheduler service for managing subscription credit resets
 
-This service handles automatic credit resets for each user based on their
-individual subscription start dates.
+Credits reset monthly on the anniversary of each subscription's start
+date, which is kept in UserSubscription.next_reset_at (set when the
+subscription is created and advanced on each reset). A single periodic
+sweep resets every active subscription whose next_reset_at has passed,
+in batches, one transaction per batch with its UsageHistory rows
+inserted in bulk.
+
+Every worker runs the sweep job, but it only does work in the worker
+holding the 'credit_reset_sweep' SchedulerLock lease; the lease is
+renewed on each sweep and taken over when its holder stops renewing it.
 """
 
+import os
+import uuid
+import socket
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.date import DateTrigger
-from flask import current_app
-from models import db, UserSubscription, UsageHistory
+from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy import bindparam, insert, update
+from models import db, User, UserSubscription, UsageHistory, SubscriptionPlanModel, SchedulerLock
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class SubscriptionScheduler:
+    LOCK_NAME = 'credit_reset_sweep'
+    # Subscriptions reset per transaction
+    BATCH_SIZE = 500
+
     def __init__(self, app=None):
         self.scheduler = None
         self.app = app
+        self.sweep_interval = 60
+        # Identifies this process as the holder of the sweep lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
         if app is not None:
             self.init_app(app)
-    
+
     def init_app(self, app):
         """Initialize the scheduler with Flask app"""
         self.app = app
-        
+        self.sweep_interval = int(os.getenv('CREDIT_RESET_SWEEP_SECONDS', '60'))
+
         # Configure scheduler
         self.scheduler = BackgroundScheduler(
             timezone='UTC',
@@ -36,157 +55,210 @@ class SubscriptionScheduler:
                 'misfire_grace_time': 3600  # 1 hour grace time
             }
         )
-        
+
         # Start scheduler when app starts
         with app.app_context():
             self.start()
-            self.schedule_all_users()
-    
+            self.scheduler.add_job(
+                func=self.sweep_credit_resets,
+                trigger=IntervalTrigger(seconds=self.sweep_interval),
+                id='credit_reset_sweep',
+                name='Credit reset sweep',
+                replace_existing=True
+            )
+
     def start(self):
         """Start the scheduler"""
         if not self.scheduler.running:
             self.scheduler.start()
             logger.info("Subscription scheduler started")
-    
+
     def stop(self):
         """Stop the scheduler"""
         if self.scheduler and self.scheduler.running:
             self.scheduler.shutdown(wait=False)
             logger.info("Subscription scheduler stopped")
-    
-    def schedule_user_reset(self, subscription_id):
-        """Schedule credit reset for a specific user subscription"""
-        try:
-            with self.app.app_context():
-                subscription = UserSubscription.query.get(subscription_id)
-                if not subscription or not subscription.is_active:
-                    return False
-                
-                next_reset_date = subscription.get_next_reset_date()
-                
-                # Remove existing job for this user if it exists
-                job_id = f"credit_reset_{subscription_id}"
-                try:
-                    self.scheduler.remove_job(job_id)
-                except:
-                    pass  # Job doesn't exist, which is fine
-                
-                # Schedule new job
-                self.scheduler.add_job(
-                    func=self._reset_user_credits,
-                    trigger=DateTrigger(run_date=next_reset_date),
-                    args=[subscription_id],
-                    id=job_id,
-                    name=f"Credit reset for user {subscription.user.username}",
-                    replace_existing=True
-                )
-                
-                logger.info(f"Scheduled credit reset for user {subscription.user.username} at {next_reset_date}")
-                return True
-                
-        except Exception as e:
-            logger.error(f"Error scheduling credit reset for subscription {subscription_id}: {e}")
-            return False
-    
-    def schedule_all_users(self):
-        """Schedule credit resets for all active subscriptions"""
-        try:
-            with self.app.app_context():
-                # Check if the table exists first
-                from sqlalchemy import inspect
-                inspector = inspect(db.engine)
-                if 'user_subscriptions' not in inspector.get_table_names():
-                    logger.info("Database tables not yet created, skipping user scheduling")
-                    return
-                
-                active_subscriptions = UserSubscription.query.filter_by(is_active=True).all()
-                
-                scheduled_count = 0
-                for subscription in active_subscriptions:
-                    if self.schedule_user_reset(subscription.id):
-                        scheduled_count += 1
-                
-                logger.info(f"Scheduled credit resets for {scheduled_count} users")
-                return scheduled_count
-                
-        except Exception as e:
-            logger.error(f"Error scheduling credit resets for all users: {e}")
-            return 0
-    
-    def _reset_user_credits(self, subscription_id):
-        """Internal method to reset credits for a user"""
-        try:
-            with self.app.app_context():
-                subscription = UserSubscription.query.get(subscription_id)
-                if not subscription or not subscription.is_active:
-                    logger.warning(f"Subscription {subscription_id} not found or inactive")
-                    return
-                
-                old_credits = subscription.credits_remaining
-                subscription.reset_monthly_credits()
-                
-                # Log the credit reset
-                usage = UsageHistory(
-                    user_id=subscription.user_id,
-                    subscription_id=subscription.id,
-                    action='monthly_reset',
-                    credits_used=0,  # This is a reset, not usage
-                    extra_data={
-                        'old_credits': old_credits,
-                        'new_credits': subscription.credits_remaining,
-                        'reset_type': 'automatic_monthly',
-                        'reset_date': datetime.utcnow().isoformat()
-                    }
-                )
-                db.session.add(usage)
-                db.session.commit()
-                
-                logger.info(f"Reset credits for user {subscription.user.username}: {old_credits} -> {subscription.credits_remaining}")
-                
-                # Schedule next reset
-                self.schedule_user_reset(subscription_id)
-                
-        except Exception as e:
-            logger.error(f"Error resetting credits for subscription {subscription_id}: {e}")
-            # Rollback any partial changes
+            # Let another worker take over the sweep without waiting for the lease to expire
             try:
+                with self.app.app_context():
+                    SchedulerLock.release(self.LOCK_NAME, self.owner)
+            except Exception as e:
+                logger.error(f"Error releasing credit reset sweep lock: {e}")
+
+    def sweep_credit_resets(self):
+        """Reset credits of every active subscription due for a reset, if this process leads; returns how many"""
+        with self.app.app_context():
+            try:
+                # Held for three intervals, so a stalled leader is replaced soon after
+                if not SchedulerLock.acquire(self.LOCK_NAME, self.owner, self.sweep_interval * 3):
+                    return 0
+
+                self._fill_next_reset_dates()
+
+                now = datetime.utcnow()
+                reset_count = 0
+                while True:
+                    due = self._reset_query().filter(
+                        UserSubscription.is_active == True,
+                        UserSubscription.next_reset_at <= now
+                    ).order_by(UserSubscription.next_reset_at).limit(self.BATCH_SIZE).with_for_update(of=UserSubscription, skip_locked=True).all()
+                    if due:
+                        reset_count += self._reset_subscriptions(due, 'automatic_monthly', due_before=now)
+                    if len(due) < self.BATCH_SIZE:
+                        break
+
+                if reset_count:
+                    logger.info(f"Reset credits for {reset_count} subscriptions")
+                return reset_count
+
+            except Exception as e:
+                logger.error(f"Error sweeping credit resets: {e}")
                 db.session.rollback()
-            except:
-                pass
-    
-    def unschedule_user(self, subscription_id):
-        """Remove scheduled credit reset for a user"""
-        try:
-            job_id = f"credit_reset_{subscription_id}"
-            self.scheduler.remove_job(job_id)
-            logger.info(f"Unscheduled credit reset for subscription {subscription_id}")
-            return True
-        except:
-            return False
-    
-    def get_scheduled_jobs(self):
-        """Get list of all scheduled credit reset jobs"""
-        jobs = []
-        for job in self.scheduler.get_jobs():
-            if job.id.startswith('credit_reset_'):
-                jobs.append({
-                    'job_id': job.id,
-                    'subscription_id': int(job.id.split('_')[-1]),
-                    'next_run_time': job.next_run_time,
-                    'name': job.name
-                })
-        return jobs
-    
+                return 0
+            finally:
+                db.session.remove()
+
+    def _reset_query(self):
+        """Columns needed to reset subscriptions, without loading them as objects"""
+        return db.session.query(
+            UserSubscription.id,
+            UserSubscription.user_id,
+            UserSubscription.subscription_start,
+            UserSubscription.credits_remaining,
+            SubscriptionPlanModel.monthly_credits
+        ).join(SubscriptionPlanModel, UserSubscription.plan_id == SubscriptionPlanModel.id)
+
+    def _reset_subscriptions(self, rows, reset_type, due_before=None):
+        """
+        Reset a batch of subscriptions from _reset_query() and log each reset,
+        in one transaction; returns how many were reset.
+        """
+        now = datetime.utcnow()
+        table = UserSubscription.__table__
+        statement = update(table).where(table.c.id == bindparam('subscription_id'))
+        if due_before is not None:
+            # Skip rows reset since they were selected
+            statement = statement.where(table.c.next_reset_at <= due_before)
+        statement = statement.values(
+            credits_remaining=bindparam('credits'),
+            credits_used_this_month=0,
+            last_credit_reset=now,
+            next_reset_at=bindparam('next_reset'),
+            updated_at=now
+        )
+        # One statement per row: an executemany rowcount can't tell which rows were skipped
+        reset = [
+            row for row in rows
+            if db.session.execute(statement, {
+                'subscription_id': row.id,
+                'credits': row.monthly_credits,
+                'next_reset': UserSubscription.anniversary_after(row.subscription_start, now) if row.subscription_start else None
+            }).rowcount == 1
+        ]
+        if not reset:
+            db.session.commit()
+            return 0
+
+        db.session.execute(insert(UsageHistory), [
+            {
+                'user_id': row.user_id,
+                'subscription_id': row.id,
+                'action': 'monthly_reset',
+                'credits_used': 0,  # This is a reset, not usage
+                'extra_data': {
+                    'old_credits': row.credits_remaining,
+                    'new_credits': row.monthly_credits,
+                    'reset_type': reset_type,
+                    'reset_date': now.isoformat()
+                },
+                'created_at': now
+            }
+            for row in reset
+        ])
+        db.session.commit()
+
+        for row in reset:
+            User.forget_subscription(row.user_id)
+        return len(reset)
+
+    def _fill_next_reset_dates(self):
+        """Set next_reset_at on active subscriptions from before it existed"""
+        table = UserSubscription.__table__
+        while True:
+            rows = db.session.query(
+                UserSubscription.id,
+                UserSubscription.subscription_start,
+                UserSubscription.last_credit_reset
+            ).filter(
+                UserSubscription.is_active == True,
+                UserSubscription.next_reset_at.is_(None),
+                UserSubscription.subscription_start.isnot(None)
+            ).limit(self.BATCH_SIZE).all()
+            if not rows:
+                return
+            db.session.execute(
+                update(table)
+                .where(table.c.id == bindparam('subscription_id'))
+                .values(next_reset_at=bindparam('next_reset')),
+                [
+                    # A reset missed since the last one is due right away
+                    {
+                        'subscription_id': row.id,
+                        'next_reset': UserSubscription.anniversary_after(
+                            row.subscription_start, row.last_credit_reset or row.subscription_start
+                        )
+                    }
+                    for row in rows
+                ]
+            )
+            db.session.commit()
+
+    def get_scheduled_jobs(self, limit=200):
+        """Get the upcoming credit resets, soonest first"""
+        rows = db.session.query(
+            UserSubscription.id,
+            UserSubscription.next_reset_at,
+            UserSubscription.credits_remaining,
+            User.username,
+            SubscriptionPlanModel.display_name
+        ).join(User, UserSubscription.user_id == User.id).join(
+            SubscriptionPlanModel, UserSubscription.plan_id == SubscriptionPlanModel.id
+        ).filter(
+            UserSubscription.is_active == True,
+            UserSubscription.next_reset_at.isnot(None)
+        ).order_by(UserSubscription.next_reset_at).limit(limit).all()
+
+        return [{
+            'job_id': f"credit_reset_{row.id}",
+            'subscription_id': row.id,
+            # Timezone-aware like the times APScheduler reported for per-user jobs
+            'next_run_time': row.next_reset_at.replace(tzinfo=timezone.utc),
+            'name': f"Credit reset for user {row.username}",
+            'username': row.username,
+            'plan_name': row.display_name,
+            'credits_remaining': row.credits_remaining
+        } for row in rows]
+
     def force_reset_user(self, subscription_id):
         """Manually trigger a credit reset for a user"""
         try:
             with self.app.app_context():
-                self._reset_user_credits(subscription_id)
+                row = self._reset_query().filter(
+                    UserSubscription.id == subscription_id,
+                    UserSubscription.is_active == True
+                ).first()
+                if not row:
+                    logger.warning(f"Subscription {subscription_id} not found or inactive")
+                    return False
+
+                self._reset_subscriptions([row], 'manual')
+                logger.info(f"Reset credits for subscription {subscription_id}: {row.credits_remaining} -> {row.monthly_credits}")
                 return True
         except Exception as e:
             logger.error(f"Error forcing credit reset for subscription {subscription_id}: {e}")
+            db.session.rollback()
             return False
 
 
 # Global scheduler instance
-subscription_scheduler = SubscriptionScheduler()
\ No newline at end of file
+subscription_scheduler = SubscriptionScheduler()
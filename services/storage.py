@@ -0,0 +1,221 @@
+"""
+Content-addressed image storage
+
+Gallery files (primaries and thumbnails) are stored under a key derived
+from their content: the SHA-256 of the bytes, sharded over two directory
+levels (ab/cd/<sha256>.<ext>). No directory grows past a few hundred
+entries however large the gallery gets, and identical images are stored
+once.
+
+Producers download and encode into the staging directory, then hand the
+finished file to store(), which moves it into the backend:
+
+- local (default): files under static/images, served as static files
+- s3: any S3-compatible bucket (AWS S3, MinIO, R2, ...) through boto3
+
+Rows saved before this layout keep flat keys (uuid.png), which the local
+backend still resolves.
+"""
+
+import os
+import uuid
+import shutil
+import hashlib
+import logging
+import mimetypes
+import tempfile
+from contextlib import contextmanager
+import boto3
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+# Stored files never change, so they can be cached forever
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def file_digest(path):
+    """SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_key(digest, ext):
+    """Sharded storage key for a content digest"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+class LocalStorage:
+    def __init__(self, root, url_prefix):
+        self.root = os.path.realpath(root)
+        self.url_prefix = url_prefix
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        """Filesystem path of a key; refuses keys that escape the root"""
+        path = os.path.realpath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def put(self, source_path, key):
+        target = self.path(key)
+        if os.path.exists(target):
+            # Same content is already stored
+            os.remove(source_path)
+            return
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.replace(source_path, target)
+        except OSError:
+            # Staging is on another filesystem; copy so readers never see a partial file
+            temp_path = f"{target}.{uuid.uuid4().hex}.part"
+            shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, target)
+            os.remove(source_path)
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key, download_name=None):
+        return f"{self.url_prefix}/{key}"
+
+    def local_path(self, key):
+        return self.path(key)
+
+    @contextmanager
+    def local_copy(self, key):
+        yield self.path(key)
+
+
+class S3Storage:
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, public_url=None, url_expiry=3600):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_url = public_url.rstrip('/') if public_url else None
+        self.url_expiry = url_expiry
+        # boto3 clients are thread-safe and pool their connections
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+
+    def _object_key(self, key):
+        return f"{self.prefix}{key}"
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def put(self, source_path, key):
+        if not self.exists(key):
+            self.client.upload_file(
+                source_path,
+                self.bucket,
+                self._object_key(key),
+                ExtraArgs={
+                    'ContentType': mimetypes.guess_type(key)[0] or 'application/octet-stream',
+                    'CacheControl': CACHE_CONTROL
+                }
+            )
+        os.remove(source_path)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def url(self, key, download_name=None):
+        if self.public_url and not download_name:
+            return f"{self.public_url}/{self._object_key(key)}"
+
+        params = {'Bucket': self.bucket, 'Key': self._object_key(key)}
+        if download_name:
+            params['ResponseContentDisposition'] = f'attachment; filename="{download_name}"'
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.url_expiry)
+
+    def local_path(self, key):
+        return None
+
+    @contextmanager
+    def local_copy(self, key):
+        fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self._object_key(key), temp_path)
+            yield temp_path
+        finally:
+            os.remove(temp_path)
+
+
+class ImageStorage:
+    def __init__(self, app=None):
+        self.app = app
+        self.backend = None
+        self.staging_dir = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure the storage backend and staging directory with Flask app"""
+        self.app = app
+        backend = os.getenv('STORAGE_BACKEND', 'local')
+        if backend == 'local':
+            self.backend = LocalStorage(os.path.join(app.root_path, 'static', 'images'), '/static/images')
+        elif backend == 's3':
+            self.backend = S3Storage(
+                bucket=os.environ['STORAGE_S3_BUCKET'],
+                prefix=os.getenv('STORAGE_S3_PREFIX', ''),
+                endpoint_url=os.getenv('STORAGE_S3_ENDPOINT_URL') or None,
+                region=os.getenv('STORAGE_S3_REGION') or None,
+                public_url=os.getenv('STORAGE_S3_PUBLIC_URL') or None
+            )
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+        self.staging_dir = os.path.join(app.instance_path, 'image_staging')
+        os.makedirs(self.staging_dir, exist_ok=True)
+        logger.info(f"Image storage using the {backend} backend")
+
+    def staging_path(self, ext):
+        """Fresh path in the staging directory for a file about to be stored"""
+        return os.path.join(self.staging_dir, f"{uuid.uuid4().hex}.{ext}")
+
+    def store(self, path, digest=None):
+        """Move a finished file into storage and return its key"""
+        ext = os.path.splitext(path)[1].lstrip('.').lower()
+        key = content_key(digest or file_digest(path), ext)
+        self.backend.put(path, key)
+        return key
+
+    def exists(self, key):
+        return self.backend.exists(key)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def url(self, key, download_name=None):
+        """Public URL of a key; download_name asks for an attachment where supported"""
+        return self.backend.url(key, download_name)
+
+    def local_path(self, key):
+        """Filesystem path of a key, or None if the backend is remote"""
+        return self.backend.local_path(key)
+
+    def local_copy(self, key):
+        """Context manager yielding a local file with the key's content"""
+        return self.backend.local_copy(key)
+
+
+# Global storage instance
+image_storage = ImageStorage()
@@ -0,0 +1,229 @@
+"""
+Background reconciliation of in-flight LoRA trainings
+
+The signed webhook normally keeps TrainingHistory rows current. For
+trainings whose webhook is late or lost, a job on the shared APScheduler
+instance periodically checks every in_progress row with FAL, a few at a
+time on a bounded thread pool, and finalizes completed or failed ones.
+The status API only reads the database.
+
+- Each row is claimed with TrainingHistory.claim_status_refresh(), so
+  only one process checks it per TRAINING_STATUS_REFRESH_SECONDS, and
+  rows a webhook just updated are skipped.
+- A training whose checks bring nothing new (queued at FAL, or FAL
+  erroring) is checked less and less often, up to MAX_BACKOFF_SECONDS.
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from apscheduler.triggers.interval import IntervalTrigger
+import fal_client
+from models import db, TrainingHistory
+from services.scheduler import subscription_scheduler
+
+logger = logging.getLogger(__name__)
+
+FAL_TRAINING_APP = "fal-ai/flux-lora-fast-training"
+
+
+def is_training_completed(logs):
+    """Check if training is completed based on logs"""
+    if not logs:
+        return False
+
+    # Convert logs to string if needed
+    logs_str = logs if isinstance(logs, str) else format_logs(logs)
+
+    # Check for completion indicators
+    completion_indicators = [
+        'Model saved to',
+        '100/100',
+        'Training completed'
+    ]
+
+    return any(indicator in logs_str for indicator in completion_indicators)
+
+def format_logs(logs):
+    """Format logs into a string"""
+    return '\n'.join(log_lines(logs))
+
+def log_lines(logs):
+    """Split logs into lines"""
+    if not logs:
+        return []
+
+    # Handle array of log objects
+    if isinstance(logs, list):
+        return [
+            log.get('message', str(log)) if isinstance(log, dict) else str(log)
+            for log in logs
+        ]
+    # Handle string logs
+    elif isinstance(logs, str):
+        return logs.split('\n')
+    # Handle other types
+    return str(logs).split('\n')
+
+def check_training_status(client, request_id):
+    """Check training status and get logs"""
+    try:
+        status = client.status(FAL_TRAINING_APP, request_id, with_logs=True)
+        logger.debug(f"Status check response: {status}")
+
+        # Split logs if present; completion is detected on the lines that are new to the caller
+        if hasattr(status, 'logs'):
+            status.logs = log_lines(status.logs)
+
+        return status
+    except Exception as e:
+        logger.error(f"Error checking status: {str(e)}")
+        return None
+
+def get_training_result(client, request_id):
+    """Get training result once completed"""
+    try:
+        result = client.result(FAL_TRAINING_APP, request_id)
+        logger.info(f"Got training result: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Error getting result: {str(e)}")
+        return None
+
+def refresh_training_status(client, training):
+    """
+    Update an in-progress training from FAL, committing only if its status or logs changed.
+
+    Returns True if something changed, False if not, None if FAL couldn't be asked.
+    """
+    try:
+        status = check_training_status(client, training.queue_id)
+        if not status:
+            return None
+
+        new_lines = training.record_logs(status.logs) if hasattr(status, 'logs') else []
+        changed = bool(new_lines)
+
+        # Check for completion
+        # Markers only count in new lines; FAL's Completed status covers a result fetch that failed last time
+        completed = isinstance(status, fal_client.Completed) or getattr(status, 'status', None) == 'completed'
+        if completed or is_training_completed(new_lines):
+            result = get_training_result(client, training.queue_id)
+            if result:
+                training.status = 'completed'
+                training.completed_at = datetime.utcnow()
+                training.result = result
+                training.config_url = result.get('config_file', {}).get('url')
+                training.weights_url = result.get('diffusers_lora_file', {}).get('url')
+                changed = True
+                logger.info(f"Training {training.training_id} completed")
+        elif getattr(status, 'status', None) == 'failed':
+            training.status = 'failed'
+            training.append_log_lines([f"Training failed: {getattr(status, 'error', 'Unknown error')}"])
+            changed = True
+
+        if changed:
+            db.session.commit()
+        return changed
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error checking training status: {str(e)}")
+        return None
+
+
+class TrainingReconciler:
+    # Longest wait between checks of a training that keeps bringing nothing new
+    MAX_BACKOFF_SECONDS = 15 * 60
+
+    def __init__(self, app=None):
+        self.app = app
+        self.interval = 30
+        self.executor = None
+        # Training row id -> (monotonic time it is next due, current delay)
+        self._backoff = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Schedule reconciliation on the app's scheduler (initialize subscription_scheduler first)"""
+        self.app = app
+        self.interval = app.config['TRAINING_STATUS_REFRESH_SECONDS']
+        max_workers = int(os.getenv('TRAINING_RECONCILE_WORKERS', '4'))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='training-reconcile')
+        subscription_scheduler.scheduler.add_job(
+            func=self.reconcile,
+            trigger=IntervalTrigger(seconds=self.interval),
+            id='training_reconcile',
+            name='Reconcile in-progress trainings with FAL',
+            replace_existing=True
+        )
+        logger.info(f"Training reconciler scheduled every {self.interval}s with {max_workers} workers")
+
+    def stop(self):
+        """Stop the reconciliation workers"""
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def reconcile(self):
+        """Check every due in-progress training with FAL; returns how many were checked"""
+        with self.app.app_context():
+            try:
+                in_progress = [row_id for (row_id,) in db.session.query(TrainingHistory.id).filter(
+                    TrainingHistory.status == 'in_progress',
+                    TrainingHistory.queue_id.isnot(None)
+                ).all()]
+            finally:
+                db.session.remove()
+        if not in_progress:
+            self._backoff.clear()
+            return 0
+
+        now = time.monotonic()
+        with self._lock:
+            # Forget trainings that finished since the last pass
+            self._backoff = {row_id: entry for row_id, entry in self._backoff.items() if row_id in in_progress}
+            due = [row_id for row_id in in_progress if self._backoff.get(row_id, (0, 0))[0] <= now]
+        if not due:
+            return 0
+
+        with self.app.app_context():
+            # Shared by the workers; the underlying HTTP client is thread-safe
+            from blueprints.clients import init_fal_client
+            client = init_fal_client()
+
+        results = self.executor.map(lambda row_id: self._reconcile_one(client, row_id), due)
+        checked = sum(1 for result in results if result is not None)
+        if checked:
+            logger.info(f"Reconciled {checked} of {len(in_progress)} in-progress trainings")
+        return checked
+
+    def _reconcile_one(self, client, row_id):
+        with self.app.app_context():
+            try:
+                training = db.session.get(TrainingHistory, row_id)
+                if not training or training.status != 'in_progress':
+                    return None
+                if not training.claim_status_refresh(self.interval):
+                    # A webhook or another process updated it within the interval
+                    return None
+                changed = refresh_training_status(client, training)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error reconciling training {row_id}: {e}")
+                changed = None
+            finally:
+                db.session.remove()
+
+        with self._lock:
+            _, delay = self._backoff.get(row_id, (0, 0))
+            delay = self.interval if changed else min(max(delay, self.interval) * 2, self.MAX_BACKOFF_SECONDS)
+            self._backoff[row_id] = (time.monotonic() + delay, delay)
+        return changed
+
+
+# Global reconciler instance
+training_reconciler = TrainingReconciler()
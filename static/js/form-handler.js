@@ -173,11 +173,23 @@ export function initializeForm() {
                 body: JSON.stringify(formData),
             });
 
-            const data = await response.json();
+            const job = await response.json();
             
             if (!response.ok) {
-                throw new Error(data.error);
+                throw new Error(job.error);
             }
+
+            // Generation runs in the background; poll the job until it finishes
+            let status;
+            do {
+                await new Promise(resolve => setTimeout(resolve, 1500));
+                status = await (await fetch(`/api/jobs/${job.job_id}`)).json();
+            } while (status.status === 'queued' || status.status === 'running');
+
+            if (status.status !== 'completed') {
+                throw new Error(status.error || 'Image generation failed');
+            }
+            const data = status.result;
             
             // Handle successful response
             if (data.images) {
@@ -0,0 +1,96 @@
+// Follow a background generation job until it finishes.
+//
+// The job status endpoint is polled. When the server offers a progress
+// stream (the job's events_url, passed as eventsUrl) it is followed over
+// Server-Sent Events instead, falling back to polling if the browser has no
+// EventSource or the stream is refused or keeps failing. Resolves with the
+// finished job (status, result, credits_remaining) and rejects with an Error
+// carrying the failed job.
+function watchGenerationJob(jobId, { onStatus, onLog, eventsUrl = null, pollInterval = 1500 } = {}) {
+    return new Promise((resolve, reject) => {
+        let finished = false;
+
+        function finish(job) {
+            if (finished) return;
+            finished = true;
+            if (job.status === 'completed') {
+                resolve(job);
+            } else {
+                const error = new Error(job.error || 'Generation failed');
+                error.job = job;
+                reject(error);
+            }
+        }
+
+        async function poll() {
+            let lastLogCount = 0;
+            while (!finished) {
+                await new Promise(r => setTimeout(r, pollInterval));
+                let job;
+                try {
+                    const response = await fetch(`/api/jobs/${jobId}`);
+                    job = await response.json();
+                    if (!response.ok) {
+                        finished = true;
+                        reject(new Error(job.error || `HTTP error! status: ${response.status}`));
+                        return;
+                    }
+                } catch (error) {
+                    continue;  // Transient network error; try again
+                }
+
+                const progress = job.progress || {};
+                if (onStatus) {
+                    onStatus({
+                        status: job.status,
+                        queue_position: progress.queue_position,
+                        percent: progress.percent
+                    });
+                }
+                if (onLog && progress.logs) {
+                    const total = progress.log_count || 0;
+                    const first = total - progress.logs.length;
+                    for (let i = Math.max(lastLogCount, first); i < total; i++) {
+                        onLog(progress.logs[i - first]);
+                    }
+                    lastLogCount = Math.max(lastLogCount, total);
+                }
+                if (job.status === 'completed' || job.status === 'failed') {
+                    finish(job);
+                }
+            }
+        }
+
+        if (!eventsUrl || !window.EventSource) {
+            poll();
+            return;
+        }
+
+        const source = new EventSource(eventsUrl);
+        let failures = 0;
+
+        source.addEventListener('status', event => {
+            failures = 0;
+            if (onStatus) onStatus(JSON.parse(event.data));
+        });
+        source.addEventListener('log', event => {
+            if (onLog) onLog(JSON.parse(event.data).message);
+        });
+        ['completed', 'failed'].forEach(type => {
+            source.addEventListener(type, event => {
+                source.close();
+                finish(JSON.parse(event.data));
+            });
+        });
+        source.onerror = () => {
+            // EventSource reconnects on its own (resuming from the last log id);
+            // give up on streaming if it cannot stay connected
+            if (finished) return;
+            failures += 1;
+            if (failures >= 3 || source.readyState === EventSource.CLOSED) {
+                source.close();
+                poll();
+            }
+        };
+    });
+}
@@ -332,11 +332,34 @@ document.addEventListener('DOMContentLoaded', () => {
                 body: JSON.stringify(formData),
             });
 
-            const data = await response.json();
+            const job = await response.json();
             if (!response.ok) {
-                throw new Error(data.error || `HTTP error! status: ${response.status}`);
+                throw new Error(job.error || `HTTP error! status: ${response.status}`);
             }
 
+            // Generation runs in the background; follow its progress until it finishes
+            const loadingText = document.getElementById('loadingText');
+            let finishedJob;
+            try {
+                finishedJob = await watchGenerationJob(job.job_id, {
+                    eventsUrl: job.events_url,
+                    onStatus: status => {
+                        if (!loadingText) return;
+                        if (status.queue_position !== null && status.queue_position !== undefined) {
+                            loadingText.textContent = `Waiting in queue (position ${status.queue_position + 1})...`;
+                        } else if (status.percent !== null && status.percent !== undefined) {
+                            loadingText.textContent = `Crafting your masterpiece... ${status.percent}%`;
+                        }
+                    }
+                });
+            } catch (error) {
+                if (error.job && error.job.credits_remaining !== undefined) {
+                    updateCreditsDisplay(error.job.credits_remaining);
+                }
+                throw error;
+            }
+            const data = { ...finishedJob.result, credits_remaining: finishedJob.credits_remaining };
+
             if (data.images && data.images.length > 0) {
                 displayGeneratedImage(data);
                 showToast('Image generated successfully!', 'success');
@@ -353,6 +376,10 @@ document.addEventListener('DOMContentLoaded', () => {
         } finally {
             if (loadingIndicator) {
                 loadingIndicator.classList.add('hidden');
+                const loadingText = document.getElementById('loadingText');
+                if (loadingText) {
+                    loadingText.textContent = 'Crafting your masterpiece... This might take a moment.';
+                }
             }
         }
     }
@@ -11,6 +11,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const spinner = startButton.querySelector('.loading');
     let statusCheckInterval = null;
     let consecutiveErrorCount = 0;
+    let logOffset = 0;  // Log lines of the current training already shown
     const MAX_ERRORS = 5;
 
     // Add image preview functionality
@@ -137,17 +138,19 @@ document.addEventListener('DOMContentLoaded', function() {
 
     async function checkTrainingStatus(trainingId) {
         try {
-            const response = await fetch(`/api/training/${trainingId}`);
+            // Only lines after the ones already shown are sent back
+            const response = await fetch(`/api/training/${trainingId}?offset=${logOffset}`);
             if (!response.ok) {
                 throw new Error('Failed to fetch training status');
             }
 
             const data = await response.json();
+            logOffset = data.log_offset;
             
-            // Update logs if available
+            // Append new logs if available
             if (data.logs) {
                 const formattedLogs = formatLogs(data.logs);
-                logsContainer.textContent = formattedLogs;
+                logsContainer.textContent += formattedLogs + '\n';
                 logsContainer.scrollTop = logsContainer.scrollHeight;
                 
                 // Extract progress
@@ -246,7 +249,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     'X-CSRFToken': window.csrf_token
                 },
                 body: JSON.stringify({
-                    images_data_url: uploadResult.images_data_url,
+                    images_url: uploadResult.images_url,
                     trigger_word: document.getElementById('triggerWord').value,
                     steps: parseInt(document.getElementById('steps').value),
                     create_masks: document.getElementById('createMasks').checked
@@ -263,8 +266,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error(result.error);
             }
 
-            // Reset error count
+            // Reset error count and log position
             consecutiveErrorCount = 0;
+            logOffset = 0;
 
             // Start polling for status updates
             const trainingId = result.training_id;
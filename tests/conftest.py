@@ -0,0 +1,84 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Configure the app before it is imported (app.py creates it at import time)
+_db_dir = tempfile.mkdtemp(prefix='sketchmaker-tests-')
+os.environ['SECRET_KEY'] = 'test-secret-key'
+os.environ['DB_PATH'] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app
+    from extensions import limiter
+
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, RATELIMIT_ENABLED=False)
+    limiter.enabled = False
+    return flask_app
+
+
+@pytest.fixture
+def api_keys(app):
+    """Configure placeholder FAL and OpenAI keys, so routes get past their key checks"""
+    from models import db, APISettings
+
+    with app.app_context():
+        settings = APISettings.get_settings()
+        settings.set_fal_key('test-fal-key')
+        settings.set_openai_key('test-openai-key')
+        db.session.commit()
+        APISettings.invalidate_cache()
+
+
+@pytest.fixture
+def local_storage(tmp_path, monkeypatch):
+    """Store images under a temporary directory instead of static/images"""
+    from services.storage import image_storage, LocalStorage
+
+    backend = LocalStorage(str(tmp_path / 'images'), '/static/images')
+    monkeypatch.setattr(image_storage, 'backend', backend)
+    return backend
+
+
+@pytest.fixture
+def make_user(app):
+    """Create a user with an active premium subscription holding some credits; returns the user id"""
+    from models import db, User, UserSubscription, SubscriptionPlanModel
+    from uuid import uuid4
+
+    def make(credits=10):
+        with app.app_context():
+            name = f"user-{uuid4().hex[:8]}"
+            user = User(username=name, email=f"{name}@example.com", password_hash='x')
+            db.session.add(user)
+            db.session.commit()
+            plan = SubscriptionPlanModel.query.filter_by(name='premium').first()
+            db.session.add(UserSubscription(
+                user_id=user.id,
+                plan_id=plan.id,
+                credits_remaining=credits,
+                credits_used_this_month=0
+            ))
+            db.session.commit()
+            return user.id
+
+    return make
+
+
+@pytest.fixture
+def client_for(app):
+    """Test client logged in as a user id"""
+    def client(user_id):
+        test_client = app.test_client()
+        with test_client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return test_client
+
+    return client
@@ -0,0 +1,70 @@
+"""Concurrent credit deduction against one subscription row"""
+import threading
+
+from models import db, UserSubscription
+
+THREADS = 8
+STARTING_CREDITS = 50
+
+
+def _subscription_id(app, user_id):
+    with app.app_context():
+        return UserSubscription.query.filter_by(user_id=user_id).one().id
+
+
+def test_concurrent_deductions_never_overdraw(app, make_user):
+    subscription_id = _subscription_id(app, make_user(credits=STARTING_CREDITS))
+    with app.app_context():
+        cost = db.session.get(UserSubscription, subscription_id).get_credit_cost('images')
+    assert cost > 0
+
+    start = threading.Barrier(THREADS + 1)
+    done = threading.Event()
+    deducted = []
+    errors = []
+    balances = []
+
+    def spend():
+        total = 0
+        with app.app_context():
+            try:
+                subscription = db.session.get(UserSubscription, subscription_id)
+                start.wait()
+                while True:
+                    try:
+                        total += subscription.deduct_credits('images', 1)
+                    except ValueError:
+                        break
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+        deducted.append(total)
+
+    def watch():
+        with app.app_context():
+            start.wait()
+            while not done.is_set():
+                balances.append(db.session.query(UserSubscription.credits_remaining).filter_by(id=subscription_id).scalar())
+                db.session.rollback()
+            db.session.remove()
+
+    spenders = [threading.Thread(target=spend) for _ in range(THREADS)]
+    watcher = threading.Thread(target=watch)
+    for thread in spenders + [watcher]:
+        thread.start()
+    for thread in spenders:
+        thread.join(timeout=120)
+    done.set()
+    watcher.join(timeout=30)
+
+    assert not errors
+    with app.app_context():
+        subscription = db.session.get(UserSubscription, subscription_id)
+        remaining = subscription.credits_remaining
+        used = subscription.credits_used_this_month
+
+    assert 0 <= remaining < cost
+    assert sum(deducted) == STARTING_CREDITS - remaining
+    assert used == sum(deducted)
+    assert balances and min(balances) >= 0
@@ -0,0 +1,55 @@
+"""Credits charged by background image generation jobs"""
+import time
+
+from PIL import Image as PILImage
+
+import blueprints.generate as generate
+from models import UserSubscription
+from models.subscription import UsageHistory
+from services.storage import image_storage
+
+
+def _wait_for_job(client, job_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f'/api/jobs/{job_id}').get_json()
+        if job['status'] in ('completed', 'failed'):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f'job {job_id} still {job["status"]}')
+
+
+def test_image_job_charges_only_saved_images(app, api_keys, local_storage, make_user, client_for, monkeypatch):
+    def generate_two(params, on_submit=None, on_queue_update=None):
+        # One of the three requested downloads failed and was dropped
+        on_submit('request-1')
+        paths = []
+        for color in ('red', 'blue'):
+            path = image_storage.staging_path('png')
+            PILImage.new('RGB', (64, 64), color).save(path)
+            paths.append(path)
+        return {'image_paths': paths}
+
+    monkeypatch.setattr(generate, 'generate_image', generate_two)
+    user_id = make_user(credits=30)
+    client = client_for(user_id)
+    with app.app_context():
+        subscription = UserSubscription.query.filter_by(user_id=user_id).one()
+        cost = subscription.get_credit_cost('images')
+
+    response = client.post('/generate/image', json={
+        'prompt': 'a lighthouse at dusk',
+        'model': 'fal-ai/flux/dev',
+        'num_images': 3,
+        'image_size': {'width': 64, 'height': 64}
+    })
+    assert response.status_code == 202, response.get_json()
+    job = _wait_for_job(client, response.get_json()['job_id'])
+
+    assert job['status'] == 'completed'
+    assert len(job['result']['images']) == 2
+    with app.app_context():
+        subscription = UserSubscription.query.filter_by(user_id=user_id).one()
+        assert subscription.credits_remaining == 30 - 2 * cost
+        usage = UsageHistory.query.filter_by(user_id=user_id, action='images').one()
+        assert usage.credits_used == 2 * cost
@@ -0,0 +1,98 @@
+"""Quality floors (SSIM) of size-targeted and draft-decoded image optimization"""
+import io
+import time
+from functools import lru_cache
+
+import pytest
+from PIL import Image
+
+from scripts.bench_common import synthetic_photo
+from services.image_optimizer import ImageOptimizer
+
+
+def ssim(first, second, window=8):
+    """Mean SSIM of two same-size images over non-overlapping window x window blocks, in grayscale"""
+    assert first.size == second.size
+    width, height = first.size
+    xs = list(first.convert('L').getdata())
+    ys = list(second.convert('L').getdata())
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    n = window * window
+    total, blocks = 0.0, 0
+    for top in range(0, height - window + 1, window):
+        for left in range(0, width - window + 1, window):
+            rows = range(top * width + left, (top + window) * width + left, width)
+            x = [v for row in rows for v in xs[row:row + window]]
+            y = [v for row in rows for v in ys[row:row + window]]
+            mx, my = sum(x) / n, sum(y) / n
+            vx = sum((v - mx) ** 2 for v in x) / (n - 1)
+            vy = sum((v - my) ** 2 for v in y) / (n - 1)
+            cov = sum((a - mx) * (b - my) for a, b in zip(x, y)) / (n - 1)
+            total += ((2 * mx * my + c1) * (2 * cov + c2)) / ((mx * mx + my * my + c1) * (vx + vy + c2))
+            blocks += 1
+    return total / blocks
+
+
+@lru_cache(maxsize=None)
+def photo(size=(1600, 1200)):
+    """The benchmarks' seeded synthetic photo, built once per size"""
+    return synthetic_photo(size)
+
+
+def jpeg_bytes(image, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def fit(image, quality, max_bytes):
+    config = {
+        'max_width': 4096,
+        'max_height': 4096,
+        'quality': quality,
+        'max_file_size_mb': max_bytes / (1024 * 1024),
+        'format': 'JPEG'
+    }
+    return ImageOptimizer._fit_to_size(image, config, time.monotonic() + 60)
+
+
+def test_quality_search_fits_target_above_ssim_floor():
+    original = photo()
+    target = int(len(jpeg_bytes(original, 90)) * 0.6)
+
+    encoded, result, quality, was_resized, stats = fit(original, 90, target)
+
+    assert len(encoded) <= target
+    assert not was_resized
+    assert ImageOptimizer.MIN_QUALITY <= quality < 90
+    assert ssim(original, Image.open(io.BytesIO(encoded))) >= 0.95
+
+
+def test_downscale_to_target_keeps_ssim_floor():
+    original = photo()
+    target = int(len(jpeg_bytes(original, ImageOptimizer.MIN_QUALITY)) * 0.3)
+
+    encoded, result, quality, was_resized, stats = fit(original, 90, target)
+
+    assert len(encoded) <= target
+    assert was_resized
+    decoded = Image.open(io.BytesIO(encoded))
+    reference = original.resize(decoded.size, Image.Resampling.LANCZOS)
+    assert ssim(reference, decoded) >= 0.86
+
+
+@pytest.mark.parametrize('max_side', [1000, 600, 300])
+def test_draft_decode_matches_full_decode(max_side):
+    source = jpeg_bytes(photo((2400, 1800)), 95)
+    config = {'max_width': max_side, 'max_height': max_side}
+
+    full = Image.open(io.BytesIO(source))
+    full.load()
+    drafted = Image.open(io.BytesIO(source))
+    ImageOptimizer._draft_for_target(drafted, config)
+    assert drafted.size[0] >= max_side and drafted.size[0] < full.size[0]
+
+    expected, _ = ImageOptimizer._resize_image(full.convert('RGB'), config)
+    actual, _ = ImageOptimizer._resize_image(drafted.convert('RGB'), config)
+    assert actual.size == expected.size
+    assert ssim(expected, actual) >= 0.98
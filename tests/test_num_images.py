@@ -0,0 +1,35 @@
+"""num_images validation on the routes that reserve credits up front"""
+import pytest
+
+from models import db, UserSubscription
+
+ROUTES = [
+    ('/generate/image', {'prompt': 'a lighthouse at dusk', 'model': 'fal-ai/flux/dev'}),
+    ('/api/magix/generate', {'prompt': 'a lighthouse at dusk', 'mode': 'generate'}),
+    ('/api/virtual/generate', {'prompt': 'a lighthouse at dusk'}),
+]
+
+
+@pytest.mark.parametrize('url,payload', ROUTES)
+@pytest.mark.parametrize('num_images', [0, -3, 5, 2.5, 'two', None, True])
+def test_invalid_num_images_rejected(app, api_keys, make_user, client_for, url, payload, num_images):
+    user_id = make_user(credits=10)
+    client = client_for(user_id)
+
+    response = client.post(url, json={**payload, 'num_images': num_images})
+
+    assert response.status_code == 400
+    assert response.get_json()['type'] == 'invalid_num_images'
+    with app.app_context():
+        assert UserSubscription.query.filter_by(user_id=user_id).one().credits_remaining == 10
+
+
+@pytest.mark.parametrize('amount', [0, -5])
+def test_deduct_credits_rejects_non_positive_amounts(app, make_user, amount):
+    user_id = make_user(credits=10)
+    with app.app_context():
+        subscription = UserSubscription.query.filter_by(user_id=user_id).one()
+        with pytest.raises(ValueError):
+            subscription.deduct_credits('images', amount)
+        db.session.expire_all()
+        assert subscription.credits_remaining == 10
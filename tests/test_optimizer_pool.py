@@ -0,0 +1,72 @@
+"""Failure handling of ImageOptimizer's worker process pool"""
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from services.image_optimizer import ImageOptimizer
+from services.optimization_cache import optimization_cache
+
+
+@pytest.fixture
+def fresh_pool(monkeypatch):
+    """A pool forked after the test's patches, shut down afterwards; every image reaches it"""
+    monkeypatch.setattr(optimization_cache, 'cache_dir', None)
+    ImageOptimizer.shutdown_pool()
+    yield
+    ImageOptimizer.shutdown_pool()
+
+
+def make_files(directory, names):
+    files = []
+    for name in names:
+        source = os.path.join(directory, f"{name}.png")
+        Image.new('RGB', (64, 64), 'red').save(source)
+        files.append((source, os.path.join(directory, f"{name}.jpg")))
+    return files
+
+
+def patch_worker(monkeypatch, misbehave):
+    """Make pool processes (forked after this) misbehave on sources named 'bad'"""
+    optimize_file = ImageOptimizer._optimize_file
+
+    def patched(source_path, *args):
+        if os.path.basename(source_path).startswith('bad'):
+            misbehave()
+        return optimize_file(source_path, *args)
+
+    monkeypatch.setattr(ImageOptimizer, '_optimize_file', patched)
+
+
+def test_dead_worker_fails_its_images_and_pool_recovers(tmp_path, monkeypatch, fresh_pool):
+    patch_worker(monkeypatch, lambda: os._exit(1))  # Like the OOM killer
+
+    results = ImageOptimizer.optimize_files(make_files(tmp_path, ['bad', 'good-1', 'good-2']))
+
+    source, metadata = results[0]
+    assert metadata['optimization_failed']
+    assert source.endswith('bad.png')
+    results = ImageOptimizer.optimize_files(make_files(tmp_path, ['next-1', 'next-2']))
+    assert not any(metadata.get('optimization_failed') for _, metadata in results)
+
+
+def test_worker_abandons_image_past_time_limit(tmp_path, monkeypatch, fresh_pool):
+    patch_worker(monkeypatch, lambda: time.sleep(30))
+
+    started = time.monotonic()
+    results = ImageOptimizer.optimize_files(
+        make_files(tmp_path, ['bad', 'good']), custom_config={'time_budget_seconds': 0.5}
+    )
+
+    assert time.monotonic() - started < 10
+    assert 'longer than' in results[0][1]['error']
+    assert not results[1][1].get('optimization_failed')
+
+
+def test_workers_cap_their_address_space(fresh_pool):
+    resource = pytest.importorskip('resource')
+
+    soft, _ = ImageOptimizer._submit(resource.getrlimit, resource.RLIMIT_AS).result()
+
+    assert soft != resource.RLIM_INFINITY
@@ -0,0 +1,32 @@
+"""SQL statements issued per request on hot routes"""
+from models import db
+from scripts.bench_common import count_statements
+
+
+def _request_statements(app, client, method, url, **kwargs):
+    # The first request warms the per-process settings caches
+    client.open(url, method=method, **kwargs)
+    with app.app_context():
+        engine = db.engine
+    with count_statements(engine) as statements:
+        response = client.open(url, method=method, **kwargs)
+    return response, statements
+
+
+def test_dashboard_statement_count(app, make_user, client_for):
+    client = client_for(make_user(credits=10))
+    response, statements = _request_statements(app, client, 'GET', '/dashboard')
+    assert response.status_code == 200
+    assert len(statements) <= 1, statements
+
+
+def test_generate_insufficient_credits_statement_count(app, api_keys, make_user, client_for):
+    client = client_for(make_user(credits=0))
+    response, statements = _request_statements(app, client, 'POST', '/generate/image', json={
+        'prompt': 'a lighthouse at dusk',
+        'model': 'fal-ai/flux/dev',
+        'num_images': 1,
+        'image_size': {'width': 512, 'height': 512}
+    })
+    assert response.status_code == 403
+    assert len(statements) <= 4, statements